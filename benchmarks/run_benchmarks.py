@@ -0,0 +1,191 @@
+"""
+Benchmark suite for `rlgym-reward-analysis` over synthetic replays.
+
+Measures per-reward throughput, replay file load times, `parse_replays` wall time, arena grid generation
+and arena contour plotting, along with the peak memory allocated by each step.
+Results are saved as JSON and can be compared against a previous run.
+
+Usage:
+    python benchmarks/run_benchmarks.py --output results.json
+    python benchmarks/run_benchmarks.py --output new.json --compare results.json
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from rlgym_reward_analysis.parse_replay.cache import ReplayCache  # noqa: E402
+from rlgym_reward_analysis.parse_replay.parsing import load_replay, parse_replay, parse_replays  # noqa: E402
+from rlgym_reward_analysis.parse_replay.replay import Replay  # noqa: E402
+from rlgym_reward_analysis.parse_replay.reward_functions import rewards_names_map  # noqa: E402
+from rlgym_reward_analysis.utils.generate import grid_positions, synthetic_replay, synthetic_replays  # noqa: E402
+
+
+def measure(fn, repeat=1, setup=None):
+    """
+    :param fn: Function to measure, called with the result of `setup` if provided
+    :param repeat: Number of repetitions
+    :param setup: Function called before every repetition, not measured. Optional.
+    :return: The result of the last call, the best wall time in seconds and the peak allocated bytes
+    """
+    best_time, peak = float("inf"), 0
+    result = None
+    for _ in range(repeat):
+        args = (setup(),) if setup is not None else ()
+        tracemalloc.start()
+        start = time.perf_counter()
+        result = fn(*args)
+        best_time = min(best_time, time.perf_counter() - start)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return result, best_time, peak
+
+
+def bench_rewards(n_frames, n_players, repeat, seed):
+    df = synthetic_replay(n_frames, n_players, seed=seed)
+    results = {}
+
+    _, wall_time, peak = measure(lambda: Replay.from_dataframe(df), repeat)
+    results["Replay.from_dataframe"] = {"time_s": wall_time,
+                                        "frames_per_s": n_frames / wall_time,
+                                        "peak_bytes": peak}
+
+    for r_name, fn in rewards_names_map.items():
+        try:
+            # a fresh replay for every call so that no reward reuses features computed by another
+            _, wall_time, peak = measure(fn, repeat, setup=lambda: Replay.from_dataframe(df))
+        except NotImplementedError:
+            continue
+        results[r_name] = {"time_s": wall_time,
+                           "frames_per_s": n_frames / wall_time,
+                           "peak_bytes": peak}
+
+    r_names = [r for r in results if r in rewards_names_map]
+    _, wall_time, peak = measure(lambda: parse_replay(df, r_names), repeat)
+    results["parse_replay(all)"] = {"time_s": wall_time,
+                                    "frames_per_s": n_frames / wall_time,
+                                    "peak_bytes": peak}
+    return results
+
+
+def bench_files(folder, n_replays, n_frames, n_players, n_workers, seed):
+    paths = synthetic_replays(os.path.join(folder, "replays"), n_replays, n_frames, n_players, seed)
+    cache = ReplayCache(os.path.join(folder, "cache"))
+    results = {}
+
+    for name, load in (("load_csv", lambda p: load_replay(p)),
+                       ("load_cache_store", lambda p: load_replay(p, cache)),
+                       ("load_cache_hit", lambda p: load_replay(p, cache))):
+        times, peaks = [], []
+        for path in paths:
+            _, wall_time, peak = measure(lambda: load(path))
+            times.append(wall_time)
+            peaks.append(peak)
+        results[name] = {"time_s_per_file": float(np.mean(times)),
+                         "frames_per_s": n_frames / float(np.mean(times)),
+                         "peak_bytes": max(peaks)}
+
+    r_names = [r for r in rewards_names_map if r != "touch_ball"]
+    for name, kwargs in (("parse_replays", {}),
+                         ("parse_replays_cached", {"cache": cache}),
+                         ("parse_replays_workers", {"n_workers": n_workers})):
+        _, wall_time, peak = measure(lambda: parse_replays({"synthetic": [os.path.dirname(paths[0])]},
+                                                           r_names, n_skip=1, **kwargs))
+        results[name] = {"time_s": wall_time,
+                         "frames_per_s": n_replays * n_frames / wall_time,
+                         "peak_bytes": peak}
+    return results
+
+
+def bench_arena(repeat):
+    results = {}
+    for point_distance in (800, 400, 200):
+        positions, wall_time, peak = measure(lambda: grid_positions(point_distance), repeat)
+        results["grid_positions(%d)" % point_distance] = {"time_s": wall_time,
+                                                          "n_positions": len(positions),
+                                                          "peak_bytes": peak}
+
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    from rlgym_reward_analysis.plot_arena import plotting
+    from rlgym_reward_analysis.plot_arena.reward_functions import custom_rewards
+
+    z = custom_rewards.liu_dist_ball2goal(plotting.arena_positions)
+
+    def contour():
+        plotting.arena_contour(z, ball_position=np.array([0, 0, 93]), annotate_ball=True)
+        plt.close("all")
+
+    _, wall_time, peak = measure(contour, repeat)
+    results["arena_contour"] = {"time_s": wall_time, "peak_bytes": peak}
+    return results
+
+
+def compare(results, previous):
+    print("%-45s %12s %12s %8s" % ("benchmark", "previous", "current", "ratio"))
+    for group, benchmarks in results["benchmarks"].items():
+        for name, metrics in benchmarks.items():
+            old = previous["benchmarks"].get(group, {}).get(name)
+            key = next(k for k in ("time_s", "time_s_per_file") if k in metrics)
+            if old is None or key not in old:
+                continue
+            print("%-45s %12.4g %12.4g %7.2fx" % (group + "/" + name, old[key], metrics[key],
+                                                   old[key] / metrics[key]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--frames", type=int, default=20000, help="Frames per synthetic replay")
+    parser.add_argument("--players", type=int, default=6, help="Players per synthetic replay")
+    parser.add_argument("--replays", type=int, default=8, help="Number of synthetic replay files")
+    parser.add_argument("--workers", type=int, default=4, help="Worker processes for parallel parsing")
+    parser.add_argument("--repeat", type=int, default=3, help="Repetitions, the best time is reported")
+    parser.add_argument("--seed", type=int, default=0, help="Synthetic replay random seed")
+    parser.add_argument("--skip", nargs="*", default=(), choices=("rewards", "files", "arena"),
+                        help="Benchmark groups to skip")
+    parser.add_argument("--output", default="benchmark_results.json", help="JSON output path")
+    parser.add_argument("--compare", help="JSON results of a previous run to compare against")
+    args = parser.parse_args()
+
+    benchmarks = {}
+    if "rewards" not in args.skip:
+        benchmarks["rewards"] = bench_rewards(args.frames, args.players, args.repeat, args.seed)
+    if "files" not in args.skip:
+        with tempfile.TemporaryDirectory() as folder:
+            benchmarks["files"] = bench_files(folder, args.replays, args.frames, args.players, args.workers,
+                                              args.seed)
+    if "arena" not in args.skip:
+        benchmarks["arena"] = bench_arena(args.repeat)
+
+    results = {"config": vars(args),
+               "environment": {"python": platform.python_version(),
+                               "platform": platform.platform(),
+                               "numpy": np.__version__,
+                               "pandas": pd.__version__,
+                               "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S")},
+               "benchmarks": benchmarks}
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+
+    for group, group_benchmarks in benchmarks.items():
+        for name, metrics in group_benchmarks.items():
+            print("%-45s %s" % (group + "/" + name,
+                                "  ".join("%s=%.4g" % (k, v) for k, v in metrics.items())))
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
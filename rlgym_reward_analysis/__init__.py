@@ -2,3 +2,5 @@
 The `rlgym-reward-analysis` package is a custom-made package for analyzing RLGym rewards using data visualization and
 analysis techniques.
 """
+
+__version__ = "0.1"
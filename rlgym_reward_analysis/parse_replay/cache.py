@@ -0,0 +1,182 @@
+import hashlib
+import json
+import os
+from typing import Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from .replay import select_columns
+
+
+class ReplayCache:
+    """
+    On-disk binary cache of replay data frames.
+
+    Every replay is stored as a single column-major `.npy` array of shape (n_columns + 1, n_frames), the first row
+    holding the frame index, next to a small `.json` sidecar holding the two-level column names.
+    Entries are keyed by the absolute path, size and modification time of the source replay file,
+    so that modified replays are never served from the cache.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: Union[None, int] = None):
+        """
+        :param cache_dir: Directory holding the cache entries. Created if it does not exist.
+        :param max_bytes: Maximum total size of the cache entries in bytes.
+            If exceeded, least recently used entries are evicted. Unlimited if `None`.
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def _path_key(replay_file: str):
+        return hashlib.sha1(os.path.abspath(replay_file).encode()).hexdigest()
+
+    def key(self, replay_file: str) -> str:
+        stat = os.stat(replay_file)
+        version = hashlib.sha1(f"{stat.st_size}:{stat.st_mtime_ns}".encode()).hexdigest()[:16]
+        return self._path_key(replay_file) + "_" + version
+
+    def _entry_paths(self, key: str):
+        entry = os.path.join(self.cache_dir, key)
+        return entry + ".npy", entry + ".json"
+
+    def _entries(self):
+        return [f[:-len(".npy")] for f in os.listdir(self.cache_dir) if f.endswith(".npy")]
+
+    def __contains__(self, replay_file: str):
+        return os.path.exists(self._entry_paths(self.key(replay_file))[1])
+
+    def load(self,
+             replay_file: str,
+             mmap: bool = False,
+             columns: Union[None, Sequence[Tuple[str, str]]] = None,
+             dtype: Union[None, str, np.dtype] = None,
+             frames: Union[None, slice, np.ndarray] = None) -> Union[None, pd.DataFrame]:
+        """
+        Loads a replay from the cache
+
+        :param replay_file: Path to the source replay file
+        :param mmap: Whether to memory-map the cached values instead of reading them into memory.
+            Ignored if `columns`, `dtype` or frame indices are provided.
+        :param columns: The (entity, field) columns to load, see `select_columns`. Only the rows of the cached
+            array holding these columns are read. All columns are loaded if `None`.
+        :param dtype: The data type of the loaded values, e.g. `"float32"`. Defaults to the cached data type.
+        :param frames: A slice or indices of the frames to load, e.g. `slice(None, None, 9)`. Only the selected
+            frames are read. All frames are loaded if `None`.
+        :return: The replay data frame or `None` if the replay is not cached
+        """
+        values_path, meta_path = self._entry_paths(self.key(replay_file))
+        selective = columns is not None or frames is not None
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            values = np.load(values_path, mmap_mode="r" if mmap or selective else None)
+        except FileNotFoundError:
+            return None
+        # bump the modification time for least recently used eviction
+        os.utime(values_path)
+
+        cached_columns = [tuple(c) for c in meta["columns"]]
+        rows = slice(None)
+        if columns is not None:
+            columns = select_columns(cached_columns, columns)
+            positions = {c: i + 1 for i, c in enumerate(cached_columns)}
+            rows = [0] + [positions[c] for c in columns]
+        else:
+            columns = cached_columns
+        if selective:
+            # every column is a contiguous row of the cached array, only the selected rows and frames are read
+            frames = slice(None) if frames is None else frames
+            if isinstance(rows, list) and not isinstance(frames, slice):
+                values = values[np.ix_(rows, frames)]
+            elif isinstance(rows, list) or not isinstance(frames, slice):
+                values = values[rows, frames]
+            else:
+                # a sliced memory-map is a view, the selected frames are read into memory
+                values = np.array(values[rows, frames])
+
+        index = pd.Index(values[0].astype(meta["index_dtype"]), name=meta["index_name"])
+        data = values[1:] if dtype is None else values[1:].astype(dtype)
+        # values are stored column-major, the data frame is backed by them without copying
+        return pd.DataFrame(data.T, index=index, columns=pd.MultiIndex.from_tuples(columns), copy=False)
+
+    def store(self, replay_file: str, df: pd.DataFrame):
+        """
+        Stores a replay in the cache, replacing any entries of older versions of the same replay file
+
+        :param replay_file: Path to the source replay file
+        :param df: The replay data frame, as read from the replay file
+        """
+        key = self.key(replay_file)
+        self.invalidate(replay_file)
+
+        values = np.empty((df.shape[1] + 1, df.shape[0]))
+        values[0] = df.index.values
+        values[1:] = df.values.T
+        meta = {"source": os.path.abspath(replay_file),
+                "columns": [list(c) for c in df.columns],
+                "index_dtype": df.index.dtype.str,
+                "index_name": df.index.name}
+
+        # write to temporary files first so that concurrent readers never see partial entries
+        values_path, meta_path = self._entry_paths(key)
+        with open(values_path + ".tmp", "wb") as f:
+            np.save(f, values)
+        with open(meta_path + ".tmp", "w") as f:
+            json.dump(meta, f)
+        os.replace(values_path + ".tmp", values_path)
+        os.replace(meta_path + ".tmp", meta_path)
+
+        if self.max_bytes is not None:
+            self.prune()
+
+    def invalidate(self, replay_file: Union[None, str] = None):
+        """
+        Removes cache entries
+
+        :param replay_file: Path to the replay file whose entries, of any version, are removed.
+            If `None`, the whole cache is cleared.
+        """
+        prefix = self._path_key(replay_file) + "_" if replay_file is not None else ""
+        for key in self._entries():
+            if key.startswith(prefix):
+                self._remove(key)
+
+    def _remove(self, key: str):
+        for path in self._entry_paths(key):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def size(self) -> int:
+        """
+        :return: Total size of the cache entries in bytes
+        """
+        return sum(os.path.getsize(p) for key in self._entries() for p in self._entry_paths(key)
+                   if os.path.exists(p))
+
+    def prune(self, max_bytes: Union[None, int] = None):
+        """
+        Evicts least recently used entries until the cache fits the size limit
+
+        :param max_bytes: Size limit in bytes. Defaults to the cache `max_bytes`.
+        """
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        entries = []
+        for key in self._entries():
+            values_path, meta_path = self._entry_paths(key)
+            try:
+                stat = os.stat(values_path)
+                entries.append((stat.st_mtime_ns, stat.st_size + os.path.getsize(meta_path), key))
+            except FileNotFoundError:
+                continue
+
+        total = sum(e[1] for e in entries)
+        for _, entry_size, key in sorted(entries):
+            if total <= max_bytes:
+                break
+            self._remove(key)
+            total -= entry_size
@@ -0,0 +1,70 @@
+"""
+Composite rewards evaluated over replays as reward expression graphs, see `utils.reward_graph`.
+"""
+from functools import partial
+from typing import Callable, Dict, Union
+
+import numpy as np
+import pandas as pd
+
+from ..utils.reward_graph import Expr, RewardGraph
+from .conditions import gated
+from .replay import Replay
+from .reward_functions import rewards_names_map
+
+
+def compile_rewards(reward_names_exprs: Dict[str, Union[str, Expr]], expand_composites=True) -> RewardGraph:
+    """
+    :param reward_names_exprs: A dictionary of reward names and reward expressions or `rewards_names_map` names,
+        e.g. `{"potential": reward("offensive_potential") + 0.5 * reward("face_ball")}`
+    :param expand_composites: Whether composite rewards are expanded into their shared sub-rewards
+    :return: The compiled reward graph, reusable across replays
+    """
+    return RewardGraph(reward_names_exprs, rewards_names_map, expand_composites)
+
+
+def replay_call(replay: Replay) -> Callable[[Callable, dict], np.ndarray]:
+    """
+    :param replay: A `Replay`
+    :return: A reward graph call evaluating reward functions over the replay, gating rewards with a `conditions`
+        keyword argument, see `conditions.gated`
+    """
+    def call(fn, kwargs):
+        if "conditions" in kwargs:
+            kwargs = dict(kwargs)
+            conditions = kwargs.pop("conditions")
+            return gated(partial(fn, **kwargs), conditions, replay)
+        return fn(replay, **kwargs)
+
+    return call
+
+
+def parse_composite(df: Union[pd.DataFrame, Replay],
+                    reward_names_exprs: Union[RewardGraph, Dict[str, Union[str, Expr]]],
+                    team_idcs: Union[None, np.ndarray] = None) -> pd.DataFrame:
+    """
+    Computes reward expressions for all players of a replay, evaluating shared sub-expressions once
+
+    :param df: A replay data frame or a `Replay`
+    :param reward_names_exprs: A compiled reward graph or a dictionary of reward names and reward expressions,
+        see `compile_rewards`
+    :param team_idcs: Team indices of the players. Determined from the first replay frame if `None`.
+    :return: A reward data frame with (player name, reward name) columns, indexed by replay frame, as `parse_replay`.
+        Rewards over consecutive frames, e.g. `diff`, start at the second frame and are NaN at the first frame.
+    """
+    replay = df if isinstance(df, Replay) else Replay.from_dataframe(df, team_idcs)
+    graph = reward_names_exprs if isinstance(reward_names_exprs, RewardGraph) else compile_rewards(reward_names_exprs)
+
+    rewards = graph.evaluate(replay_call(replay), replay.team_idcs, player_axis=-1)
+    reward_values = np.full((replay.n_frames, replay.n_players, len(rewards)), np.nan)
+    for i, values in enumerate(rewards.values()):
+        values = np.asarray(values)
+        # rewards of the ball or the game apply to every player
+        values = values[:, None] if values.ndim == 1 else values
+        # frames are aligned to the end of the replay
+        n = values.shape[0] if values.ndim else replay.n_frames
+        assert n <= replay.n_frames, "Reward expressions must not produce more frames than the replay"
+        reward_values[replay.n_frames - n:, :, i] = values
+
+    columns = pd.MultiIndex.from_product([replay.player_names, list(rewards)])
+    return pd.DataFrame(reward_values.reshape(replay.n_frames, -1), index=replay.index, columns=columns)
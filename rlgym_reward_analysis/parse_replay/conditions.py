@@ -0,0 +1,99 @@
+"""
+Reward condition masks over whole replays.
+
+Conditions are boolean masks of shape (n_frames, n_players), computed for all frames and players of a replay at once,
+see `plot_arena.reward_functions.common_rewards.conditional` for their single frame counterparts. Rewards are gated by
+conditions with `gated`, e.g. through the `conditions` reward keyword argument of `parsing.parse_replay`.
+"""
+from typing import Callable, List, Sequence, Tuple, Union
+
+import numpy as np
+
+from .replay import Replay
+
+
+def closest2ball(replay: Replay, team_only=True) -> np.ndarray:
+    """
+    :param replay: A `Replay`
+    :param team_only: Whether players are compared with their team mates only or with all players
+    :return: Whether no other player is closer to the ball, shape (n_frames, n_players)
+    """
+    dist = replay.features.player2ball_dist
+    if not team_only:
+        return dist <= dist.min(1, keepdims=True)
+    # closest distance of each team, gathered for every player
+    team_idcs = replay.team_idcs
+    team_min = np.stack([np.where(team_idcs == t, dist, np.inf).min(1) for t in (0, 1)], -1)
+    return dist <= team_min[:, team_idcs]
+
+
+def behind_ball(replay: Replay) -> np.ndarray:
+    """
+    :param replay: A `Replay`
+    :return: Whether players are between the ball and their own goal along the y axis, shape (n_frames, n_players)
+    """
+    features = replay.features
+    # blue players defend the negative y goal, orange players the positive y goal
+    side = np.where(replay.team_idcs == 1, -1, 1)
+    return (features.ball_position[:, 1, None] - features.position[..., 1]) * side > 0
+
+
+def touched_last(replay: Replay) -> np.ndarray:
+    """
+    :param replay: A `Replay`
+    :return: Whether players are the last to have touched the ball, up to and including the current frame, shape
+        (n_frames, n_players), see `features.ReplayFeatures.last_toucher`. Touches before the first frame are
+        given by `Replay.last_toucher`.
+    """
+    return replay.features.last_toucher[:, None] == np.arange(replay.n_players)
+
+
+conditions_names_map = {"closest2ball": closest2ball,
+                        "behind_ball": behind_ball,
+                        "touched_last": touched_last,
+                        }
+
+
+def _conditions(conditions) -> List[Tuple[str, dict]]:
+    if type(conditions) is str or (type(conditions) is tuple and len(conditions) == 2 and
+                                   isinstance(conditions[1], dict)):
+        conditions = [conditions]
+    return [(c, {}) if type(c) is str else tuple(c) for c in conditions]
+
+
+def condition_names(conditions: Union[str, Tuple[str, dict], Sequence[Union[str, Tuple[str, dict]]]]) -> List[str]:
+    """
+    :param conditions: A condition name, a 2-tuple of a condition name and condition keyword arguments, or a list
+        of them
+    :return: The condition names
+    """
+    return [c_name for c_name, _ in _conditions(conditions)]
+
+
+def condition_mask(replay: Replay,
+                   conditions: Union[str, Tuple[str, dict], Sequence[Union[str, Tuple[str, dict]]]]) -> np.ndarray:
+    """
+    :param replay: A `Replay`
+    :param conditions: A condition name of `conditions_names_map`, a 2-tuple of a condition name and condition
+        keyword arguments, e.g. `("closest2ball", {"team_only": False})`, or a list of them
+    :return: Whether all conditions hold, shape (n_frames, n_players)
+    """
+    mask = np.ones((replay.n_frames, replay.n_players), dtype=bool)
+    for c_name, c_args in _conditions(conditions):
+        mask &= conditions_names_map[c_name](replay, **c_args)
+    return mask
+
+
+def gated(reward_fn: Callable[[Replay], np.ndarray],
+          conditions: Union[str, Tuple[str, dict], Sequence[Union[str, Tuple[str, dict]]]],
+          replay: Replay,
+          otherwise=0.) -> np.ndarray:
+    """
+    :param reward_fn: A reward function taking a `Replay`
+    :param conditions: Conditions, see `condition_mask`
+    :param replay: A `Replay`
+    :param otherwise: The reward of frames and players the conditions do not hold for
+    :return: Rewards of shape (n_frames, n_players), `otherwise` where the conditions do not hold
+    """
+    rewards = np.broadcast_to(reward_fn(replay), (replay.n_frames, replay.n_players))
+    return np.where(condition_mask(replay, conditions), rewards, otherwise)
@@ -0,0 +1,132 @@
+"""
+Game event detection over whole replays.
+
+Events are boolean indicators of shape (n_frames, n_players), detected for all frames and players of a replay at once
+from ball and player states, and stacked into an (n_frames, n_players, n_events) tensor in `event_names` order, the
+order of `plot_arena.reward_functions.custom_rewards.event`. Event rewards are weighted sums of the event tensor.
+"""
+from typing import Sequence, Union
+
+import numpy as np
+import pandas as pd
+
+from rlgym_reward_analysis import _common_values
+from ..utils.math import norm
+from .conditions import touched_last
+from .replay import Replay
+
+event_names = ("goal", "team_goal", "concede", "touch", "shot", "save", "demo", "demoed")
+
+# half width of the goal mouth, as drawn by `plot_arena.arena.make_goal_`
+_goal_half_width = 893
+# player position change between consecutive frames above which a player respawned, i.e. was demolished
+_respawn_distance = 1500
+# player distance within which a demolished player was demolished by an opponent
+_demo_distance = 300
+
+
+def _on_target(position: np.ndarray, velocity: np.ndarray) -> np.ndarray:
+    # whether the ball heads into the orange and the blue goal in a straight line, shape (n_frames, 2)
+    goal_y = np.array([_common_values.BACK_WALL_Y, -_common_values.BACK_WALL_Y])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        time = (goal_y - position[:, 1, None]) / velocity[:, 1, None]
+        x = position[:, 0, None] + velocity[:, 0, None] * time
+    return (time > 0) & (np.abs(x) < _goal_half_width)
+
+
+def _scored(replay: Replay) -> np.ndarray:
+    # frames the ball crosses the orange and the blue goal lines, shape (n_frames, 2), orange goal first
+    ball_y = replay.features.ball_position[:, 1, None]
+    beyond = ball_y * np.array([1, -1]) > _common_values.BACK_WALL_Y + _common_values.BALL_RADIUS
+    beyond[1:] &= ~beyond[:-1]
+    return beyond
+
+
+def touch(replay: Replay) -> np.ndarray:
+    return replay.features.touches
+
+
+def team_goal(replay: Replay) -> np.ndarray:
+    # blue players score in the orange goal, orange players in the blue goal
+    return _scored(replay)[:, replay.team_idcs]
+
+
+def concede(replay: Replay) -> np.ndarray:
+    return _scored(replay)[:, 1 - replay.team_idcs]
+
+
+def goal(replay: Replay) -> np.ndarray:
+    return team_goal(replay) & touched_last(replay)
+
+
+def shot(replay: Replay) -> np.ndarray:
+    features = replay.features
+    on_target = _on_target(features.ball_position, features.ball_lin_velocity)
+    return features.touches & on_target[:, replay.team_idcs]
+
+
+def save(replay: Replay) -> np.ndarray:
+    features = replay.features
+    # the ball headed into the own goal before the touch and no longer does after it
+    on_own_goal = _on_target(features.ball_position, features.ball_lin_velocity)[:, 1 - replay.team_idcs]
+    saved = np.zeros_like(on_own_goal)
+    saved[1:] = on_own_goal[:-1] & ~on_own_goal[1:]
+    return features.touches & saved
+
+
+def demoed(replay: Replay) -> np.ndarray:
+    position = replay.features.position
+    # demolished players either vanish from the replay or respawn far away
+    missing = np.isnan(position).any(-1)
+    respawned = np.zeros_like(missing)
+    with np.errstate(invalid="ignore"):
+        respawned[1:] = (norm(np.diff(position, axis=0)) > _respawn_distance) | (missing[1:] & ~missing[:-1])
+    return respawned
+
+
+def demo(replay: Replay) -> np.ndarray:
+    position = replay.features.position
+    team_idcs = replay.team_idcs
+    # the closest opponent of every demolished player at the previous frame, shape (n_frames - 1, n_players)
+    dist = norm(position[:-1, :, None] - position[:-1, None])
+    dist = np.where((team_idcs[:, None] != team_idcs) & ~np.isnan(dist), dist, np.inf)
+    attacker = dist.argmin(-1)
+    demolished = demoed(replay)[1:] & (dist.min(-1) < _demo_distance)
+
+    demos = np.zeros((replay.n_frames, replay.n_players), dtype=bool)
+    demos[1:] = (demolished[..., None] & (attacker[..., None] == np.arange(replay.n_players))).any(1)
+    return demos
+
+
+events_names_map = {"goal": goal,
+                    "team_goal": team_goal,
+                    "concede": concede,
+                    "touch": touch,
+                    "shot": shot,
+                    "save": save,
+                    "demo": demo,
+                    "demoed": demoed,
+                    }
+
+
+def detect_events(replay: Union[pd.DataFrame, Replay], names: Sequence[str] = event_names) -> np.ndarray:
+    """
+    :param replay: A replay data frame or a `Replay`
+    :param names: Event names of `events_names_map`
+    :return: Event indicators of shape (n_frames, n_players, n_events), in `names` order
+    """
+    replay = replay if isinstance(replay, Replay) else Replay.from_dataframe(replay)
+    return np.stack([events_names_map[name](replay) for name in names], -1)
+
+
+def event_rewards(events: np.ndarray, weights: Union[Sequence[float], np.ndarray]) -> np.ndarray:
+    """
+    Weighted sums of events, as a single batched dot product
+
+    :param events: Event indicators of shape (n_frames, n_players, n_events)
+    :param weights: Event weights of shape (n_events,), or (n_events, n_rewards) for several event rewards at once
+    :return: Event rewards of shape (n_frames, n_players) or (n_frames, n_players, n_rewards)
+    """
+    weights = np.asarray(weights, dtype=float)
+    assert weights.shape[0] == events.shape[-1], "Event weights do not match events"
+    return np.matmul(events, weights)
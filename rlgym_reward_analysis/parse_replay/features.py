@@ -0,0 +1,179 @@
+from functools import cached_property
+
+import numpy as np
+
+from rlgym_reward_analysis import _common_values
+from . import _objectives
+from .orientation import orientation_vectors
+from ..utils.math import norm
+
+# ball center distance within which a player touches the ball, the ball radius and about the car hitbox half length
+_touch_distance = _common_values.BALL_RADIUS + 80
+# ball velocity change between consecutive frames above which the ball is hit, well above gravity at low frame rates
+_touch_velocity_change = 250
+
+
+def _read_only(array):
+    array = np.asarray(array)
+    array.setflags(write=False)
+    return array
+
+
+def _unit(vec, norm):
+    return vec / (norm[..., None] + 1e-8)
+
+
+class ReplayFeatures:
+    """
+    Lazily computed geometric features of a replay. Every feature is computed at most once and is a read-only array.
+    Ball features have shape (n_frames, ...), player features (n_frames, n_players, ...).
+    Objective features refer to the opponent goal of each player, own goal features to the player team goal.
+    """
+
+    def __init__(self, replay):
+        """
+        :param replay: A `Replay`
+        """
+        self.replay = replay
+        self.team_idcs = replay.team_idcs
+
+    # --- Ball ---
+
+    @cached_property
+    def ball_position(self):
+        return _read_only(self.replay.ball_('pos_x', 'pos_y', 'pos_z'))
+
+    @cached_property
+    def ball_lin_velocity(self):
+        return _read_only(self.replay.ball_('vel_x', 'vel_y', 'vel_z'))
+
+    @cached_property
+    def ball2goals(self):
+        """Ball to goal back vectors, shape (n_frames, 2, 3), orange goal first"""
+        return _read_only(_objectives - self.ball_position[:, None])
+
+    @cached_property
+    def ball2goals_dist(self):
+        return _read_only(norm(self.ball2goals))
+
+    @cached_property
+    def ball2goals_unit(self):
+        return _read_only(_unit(self.ball2goals, self.ball2goals_dist))
+
+    @cached_property
+    def ball_velocity_change(self):
+        """Ball velocity change since the previous frame, shape (n_frames,), 0 at the first frame"""
+        change = np.zeros(self.replay.n_frames)
+        change[1:] = norm(np.diff(self.ball_lin_velocity, axis=0))
+        return _read_only(change)
+
+    @cached_property
+    def is_kickoff(self):
+        return _read_only((self.ball_position[:, 0] == 0) & (self.ball_position[:, 1] == 0))
+
+    # --- Player ---
+
+    @cached_property
+    def position(self):
+        return _read_only(self.replay.player_('pos_x', 'pos_y', 'pos_z'))
+
+    @cached_property
+    def lin_velocity(self):
+        return _read_only(self.replay.player_('vel_x', 'vel_y', 'vel_z'))
+
+    @cached_property
+    def speed(self):
+        return _read_only(norm(self.lin_velocity))
+
+    @cached_property
+    def orientation(self):
+        """Forward, right and up vectors, computed together"""
+        # euler angles are (pitch, yaw, roll)
+        pitch, yaw, roll = np.moveaxis(self.replay.player_('rot_x', 'rot_y', 'rot_z'), -1, 0)
+        return tuple(_read_only(v) for v in orientation_vectors(pitch, yaw, roll))
+
+    @property
+    def forward(self):
+        return self.orientation[0]
+
+    @property
+    def right(self):
+        return self.orientation[1]
+
+    @property
+    def up(self):
+        return self.orientation[2]
+
+    @cached_property
+    def player2ball(self):
+        return _read_only(self.ball_position[:, None] - self.position)
+
+    @cached_property
+    def player2ball_dist(self):
+        return _read_only(norm(self.player2ball))
+
+    @cached_property
+    def player2ball_unit(self):
+        return _read_only(_unit(self.player2ball, self.player2ball_dist))
+
+    @cached_property
+    def touches(self):
+        """
+        Ball touches, shape (n_frames, n_players). The ball is touched when its velocity changes abruptly while
+        players are within touching distance at the current or previous frame, by the closest of them.
+        """
+        dist = self.player2ball_dist.copy()
+        dist[1:] = np.minimum(dist[1:], dist[:-1])
+        hit = (self.ball_velocity_change > _touch_velocity_change) & (dist < _touch_distance).any(1)
+        closest = dist.argmin(1)
+        return _read_only(hit[:, None] & (closest[:, None] == np.arange(self.replay.n_players)))
+
+    @cached_property
+    def last_toucher(self):
+        """
+        Index of the player who touched the ball last, up to and including each frame, shape (n_frames,),
+        `Replay.last_toucher` before the first touch of the replay
+        """
+        touches = self.touches
+        # frame of the last touch, forward filled
+        last_touch = np.maximum.accumulate(np.where(touches.any(1), np.arange(self.replay.n_frames), -1))
+        last_toucher = np.where(last_touch >= 0, touches.argmax(1)[last_touch], self.replay.last_toucher)
+        return _read_only(last_toucher)
+
+    @cached_property
+    def events(self):
+        """Event indicators, shape (n_frames, n_players, n_events), see `events.event_names`"""
+        from .events import detect_events
+        return _read_only(detect_events(self.replay))
+
+    # --- Player goals ---
+
+    @property
+    def objective(self):
+        return _objectives[self.team_idcs]
+
+    @property
+    def own_goal(self):
+        return _objectives[1 - self.team_idcs]
+
+    @cached_property
+    def ball2objective_dist(self):
+        return _read_only(self.ball2goals_dist[:, self.team_idcs])
+
+    @cached_property
+    def ball2objective_unit(self):
+        return _read_only(self.ball2goals_unit[:, self.team_idcs])
+
+    @cached_property
+    def ball2own_goal_dist(self):
+        return _read_only(self.ball2goals_dist[:, 1 - self.team_idcs])
+
+    @cached_property
+    def player2objective_unit(self):
+        vec = self.objective - self.position
+        return _read_only(_unit(vec, norm(vec)))
+
+    @cached_property
+    def own_goal2player_unit(self):
+        vec = self.position - self.own_goal
+        return _read_only(_unit(vec, norm(vec)))
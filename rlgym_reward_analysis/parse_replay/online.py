@@ -0,0 +1,149 @@
+"""
+Online reward evaluation, one frame or a small batch of frames at a time.
+"""
+from typing import Dict, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from ..utils.reward_graph import Expr, RewardGraph, reward
+from .composition import compile_rewards, replay_call
+from .replay import Replay
+
+
+def _reward_exprs(reward_names_args: Sequence[Union[str, Tuple[str, dict]]]) -> Dict[str, Expr]:
+    reward_names_exprs = {}
+    for r in reward_names_args:
+        r_name, r_args = (r, {}) if type(r) is str else r
+        reward_names_exprs[r_name] = reward(r_name, **r_args)
+    return reward_names_exprs
+
+
+class OnlineEvaluator:
+    """
+    Evaluates rewards for all players of a live or simulated game as frames arrive, in constant time per frame.
+    Rewards over consecutive frames, e.g. `diff` and `diff_potential` expressions, keep the last frame of their
+    inputs and are NaN at the first frame. Reward functions are evaluated with the previous frame prepended and the
+    last player to touch the ball carried over, as `parsing.iter_parse_replay` chunks, so that touches, events and
+    the `touched_last` condition are detected. Rewards match `parse_composite` over the same frames.
+    """
+
+    def __init__(self,
+                 reward_names_exprs: Union[RewardGraph, Dict[str, Union[str, Expr]],
+                                           Sequence[Union[str, Tuple[str, dict]]]],
+                 player_names: Sequence[str],
+                 team_idcs: Union[np.ndarray, Sequence[int]],
+                 ball_fields: Sequence[str],
+                 player_fields: Sequence[str],
+                 game_fields: Sequence[str] = ()):
+        """
+        :param reward_names_exprs: A compiled reward graph, a dictionary of reward names and reward expressions,
+            see `composition.compile_rewards`, or a list of reward names or 2-tuples of reward names and reward keyword
+            arguments
+        :param player_names: Names of the players
+        :param team_idcs: Team indices of the players
+        :param ball_fields: Ball fields of the frames, in frame array order
+        :param player_fields: Player fields of the frames, in frame array order
+        :param game_fields: Game fields of the frames, in frame array order
+        """
+        if isinstance(reward_names_exprs, RewardGraph):
+            self.graph = reward_names_exprs
+        else:
+            if not isinstance(reward_names_exprs, dict):
+                reward_names_exprs = _reward_exprs(reward_names_exprs)
+            self.graph = compile_rewards(reward_names_exprs)
+        self.reward_names = list(self.graph.outputs)
+        self.player_names = list(player_names)
+        self.team_idcs = np.asarray(team_idcs, dtype=int)
+        self.ball_fields = list(ball_fields)
+        self.player_fields = list(player_fields)
+        self.game_fields = list(game_fields)
+        self.state = {}
+        self.n_frames = 0
+        # the previous frame ball, player and game rows, and the last player to touch the ball
+        self.context = None
+        self.last_toucher = -1
+
+    @classmethod
+    def from_replay(cls,
+                    reward_names_exprs: Union[RewardGraph, Dict[str, Union[str, Expr]],
+                                              Sequence[Union[str, Tuple[str, dict]]]],
+                    replay: Union[pd.DataFrame, Replay]) -> "OnlineEvaluator":
+        """
+        :param reward_names_exprs: Rewards to evaluate, see `OnlineEvaluator`
+        :param replay: A replay data frame or a `Replay` with the players, teams and fields of the frames to evaluate
+        :return: An evaluator of frames laid out as the replay arrays
+        """
+        replay = replay if isinstance(replay, Replay) else Replay.from_dataframe(replay)
+        return cls(reward_names_exprs, replay.player_names, replay.team_idcs, replay.ball_fields,
+                   replay.player_fields, replay.game_fields)
+
+    def reset(self):
+        """
+        Clears the previous frame values, e.g. at the start of a new episode
+        """
+        self.state = {}
+        self.n_frames = 0
+        self.context = None
+        self.last_toucher = -1
+
+    def step(self,
+             ball: np.ndarray,
+             players: np.ndarray,
+             game: Union[None, np.ndarray] = None) -> np.ndarray:
+        """
+        :param ball: Ball state of shape (n_ball_fields,) for a single frame or (n_frames, n_ball_fields)
+        :param players: Player state of shape (n_players, n_player_fields) for a single frame or
+            (n_frames, n_players, n_player_fields)
+        :param game: Game state of shape (n_game_fields,) for a single frame or (n_frames, n_game_fields). Optional.
+        :return: Rewards of shape (n_players, n_rewards) for a single frame or (n_frames, n_players, n_rewards),
+            in `reward_names` order
+        """
+        single = np.ndim(ball) == 1
+        ball, players = np.atleast_2d(ball), np.asarray(players)
+        players = players[None] if single else players
+        game = None if game is None else np.atleast_2d(game)
+
+        n_frames = ball.shape[0]
+        n_context = 0 if self.context is None else 1
+        if n_context:
+            context_ball, context_players, context_game = self.context
+            ball, players = np.concatenate([context_ball, ball]), np.concatenate([context_players, players])
+            game = None if game is None or context_game is None else np.concatenate([context_game, game])
+
+        index = np.arange(self.n_frames - n_context, self.n_frames + n_frames)
+        replay = Replay(ball, self.ball_fields, players, self.player_fields, self.player_names, self.team_idcs, index,
+                        game, self.game_fields, self.last_toucher)
+        call = replay_call(replay)
+        # rewards of the context frame are dropped, the graph state holds the previous frame values
+        rewards = self.graph.evaluate(lambda fn, kwargs: np.asarray(call(fn, kwargs))[n_context:],
+                                      self.team_idcs, player_axis=-1, state=self.state)
+        self.n_frames += n_frames
+
+        if n_frames:
+            self.context = (ball[-1:].copy(), players[-1:].copy(), None if game is None else game[-1:].copy())
+            # only evaluators whose rewards read the last toucher compute it
+            if "last_toucher" in vars(replay.features):
+                self.last_toucher = int(replay.features.last_toucher[-1])
+
+        reward_values = np.empty((n_frames, replay.n_players, len(rewards)))
+        for i, values in enumerate(rewards.values()):
+            values = np.asarray(values)
+            # rewards of the ball or the game apply to every player
+            reward_values[..., i] = values[:, None] if values.ndim == 1 else values
+        return reward_values[0] if single else reward_values
+
+    def step_dataframe(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        :param df: Replay data frame rows with the players of the evaluator
+        :return: A reward data frame with (player name, reward name) columns, indexed by replay frame, as
+            `parse_composite`
+        """
+        entities = df.columns.get_level_values(0)
+        ball = df["ball"].reindex(columns=self.ball_fields).values
+        players = np.stack([df[p].reindex(columns=self.player_fields).values for p in self.player_names], 1)
+        game = df["game"].reindex(columns=self.game_fields).values if "game" in entities else None
+
+        reward_values = self.step(ball, players, game)
+        columns = pd.MultiIndex.from_product([self.player_names, self.reward_names])
+        return pd.DataFrame(reward_values.reshape(df.shape[0], -1), index=df.index, columns=columns)
@@ -0,0 +1,36 @@
+import numpy as np
+
+
+def orientation_vectors(pitch: np.ndarray, yaw: np.ndarray, roll: np.ndarray):
+    """
+    Closed form car orientation vectors from Euler angles, vectorized over any input shape.
+
+    The vectors are the columns of the rotation matrix of extrinsic x (roll), y (pitch), z (yaw) rotations,
+    i.e. `Rotation.from_euler('xyz', [roll, pitch, yaw]).as_matrix()`, without building the matrix.
+
+    :param pitch: Pitch angles, `rot_x` replay field
+    :param yaw: Yaw angles, `rot_y` replay field
+    :param roll: Roll angles, `rot_z` replay field
+    :return: A tuple of forward, right and up vectors, each of shape `pitch.shape + (3,)`
+    """
+    cp, sp = np.cos(pitch), np.sin(pitch)
+    cy, sy = np.cos(yaw), np.sin(yaw)
+    cr, sr = np.cos(roll), np.sin(roll)
+
+    shape = np.shape(pitch) + (3,)
+    forward, right, up = np.empty(shape), np.empty(shape), np.empty(shape)
+
+    forward[..., 0] = cy * cp
+    forward[..., 1] = sy * cp
+    forward[..., 2] = -sp
+
+    spsr, spcr = sp * sr, sp * cr
+    right[..., 0] = cy * spsr - sy * cr
+    right[..., 1] = sy * spsr + cy * cr
+    right[..., 2] = cp * sr
+
+    up[..., 0] = cy * spcr + sy * sr
+    up[..., 1] = sy * spcr - cy * sr
+    up[..., 2] = cp * cr
+
+    return forward, right, up
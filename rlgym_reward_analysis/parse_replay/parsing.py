@@ -1,63 +1,412 @@
 import os
+from concurrent.futures import Executor, ProcessPoolExecutor
 from functools import partial
 from typing import Sequence, Union, Dict, Callable, Tuple
 
 import numpy as np
 import pandas as pd
 
-from .reward_functions import rewards_names_map
+from .cache import ReplayCache
+from .conditions import condition_names, gated
+from .postprocessing import postprocess, stage_functions
+from .profiling import RewardProfiler, unmeasured
+from .replay import Replay, non_players, select_columns, team_indices
+from .results import ResultCache
+from .resampling import replay_time, resample_frames, tick_mask, time_column
+from .reward_functions import rewards_columns, rewards_names_map
 
 
-def parse_replay(df: pd.DataFrame,
+def reward_functions(reward_names_args: Sequence[Union[str, Tuple[str, dict]]]) -> Dict[str, Callable]:
+    """
+    :param reward_names_args: A list of reward names or 2-tuples of reward names and reward keyword arguments.
+        Rewards with a `conditions` keyword argument are zero wherever the conditions do not hold,
+        see `conditions.condition_mask`, e.g. `("face_ball", {"conditions": ["closest2ball", "behind_ball"]})`.
+    :return: A dictionary of reward names and reward functions with their keyword arguments bound
+    """
+    reward_names_fns = {}
+    for r in reward_names_args:
+        if type(r) is str:
+            r_name, r_args = r, {}
+        else:
+            r_name, r_args = r
+        r_args = dict(r_args)
+        r_conditions = r_args.pop("conditions", None)
+        reward_names_fns[r_name] = partial(rewards_names_map[r_name], **r_args)
+        if r_conditions is not None:
+            reward_names_fns[r_name] = partial(gated, reward_names_fns[r_name], r_conditions)
+    return reward_names_fns
+
+
+def _columns_names(reward_names_args: Sequence[Union[str, Tuple[str, dict]]]) -> list:
+    # rewards and the conditions gating them, determining the replay columns to load
+    names = []
+    for r in reward_names_args:
+        names.append(r if type(r) is str else r[0])
+        if type(r) is not str and r[1].get("conditions") is not None:
+            names.extend(condition_names(r[1]["conditions"]))
+    return names
+
+
+def parse_replay(df: Union[pd.DataFrame, Replay],
                  reward_names_args: Union[None, Sequence[Union[str, Tuple[str, dict]]]] = None,
-                 reward_names_fns: Union[None, Dict[str, Callable[[pd.DataFrame, np.ndarray], np.ndarray]]] = None):
+                 reward_names_fns: Union[None, Dict[str, Callable[[Replay], np.ndarray]]] = None,
+                 team_idcs: Union[None, np.ndarray] = None,
+                 profiler: Union[None, RewardProfiler] = None,
+                 stage_names_args: Union[None, Sequence[Union[str, Tuple[str, dict]]]] = None,
+                 start: int = 0,
+                 result_cache: Union[None, ResultCache] = None,
+                 result_key: Union[None, str] = None):
+    """
+    Computes rewards for all players of a replay
+
+    :param df: A replay data frame or a `Replay`
+    :param reward_names_args: A list of reward names or 2-tuples of reward names and reward keyword arguments
+    :param reward_names_fns: A dictionary of reward names and reward functions, used instead of `reward_names_args`.
+        Reward functions take a `Replay` and return rewards of shape (n_frames, n_players).
+    :param team_idcs: Team indices of the players. Determined from the first replay frame if `None`.
+    :param profiler: A profiler recording replay array construction and reward computation steps. Optional.
+    :param stage_names_args: A list of post-processing stage names or 2-tuples of stage names and stage keyword
+        arguments, applied in order to all rewards, see `postprocessing.stages_names_map`. Optional.
+    :param start: Replay position of the first frame, for stages depending on it, e.g. `anneal`
+    :param result_cache: A cache of computed rewards. Only rewards not cached for the replay are computed, and are
+        cached in turn. Rewards are cached before post-processing. Requires `reward_names_args`. Optional.
+    :param result_key: The replay cache key, see `ResultCache.file_key`. Defaults to the replay content key,
+        see `ResultCache.replay_key`.
+    :return: A reward data frame with (player name, reward name) columns, indexed by replay frame
+    """
     assert reward_names_args or reward_names_fns, "Either `reward_names_args` or `reward_names_fns` must be provided"
 
-    non_players = ['ball', 'game']
-    player_names = [c for c in df.columns.levels[0] if c not in non_players]
-    # Frame 1: negative coordinate blue (0), positive coordinate orange (1)
-    team_idcs = (df[player_names].xs('pos_y', level=1, axis=1).iloc[0] > 0).values.astype(int)
-    players_teams = np.stack((player_names, team_idcs), axis=-1)
+    measure = profiler.measure if profiler is not None else unmeasured
 
+    if isinstance(df, Replay):
+        replay = df
+    else:
+        with measure("replay", n_frames=df.shape[0]):
+            replay = Replay.from_dataframe(df, team_idcs)
     if reward_names_fns is None:
-        reward_names_fns = {}
-        for r in reward_names_args:
-            if type(r) is str:
-                r_name, r_args = r, {}
-            else:
-                r_name, r_args = r
-            reward_names_fns[r_name] = partial(rewards_names_map[r_name], **r_args)
+        reward_names_fns = reward_functions(reward_names_args)
 
-    player_reward_values = {(p_t[0], r_n): reward_names_fns[r_n](df, p_t)
-                            for p_t in players_teams
-                            for r_n in reward_names_fns}
+    cached = {}
+    if result_cache is not None:
+        assert reward_names_args, "Cached rewards are keyed by `reward_names_args`"
+        reward_names_args = {r if type(r) is str else r[0]: r for r in reward_names_args}
+        result_key = result_cache.replay_key(replay) if result_key is None else result_key
+        cached = result_cache.load(result_key, list(reward_names_args.values()), (replay.n_frames, replay.n_players))
 
-    reward_values_df = pd.DataFrame(player_reward_values)
-    assert reward_values_df.shape[0] == df.shape[0]  # assert for same number of rows
+    # Every reward is evaluated once for all players, sharing the replay geometric features
+    reward_values = np.empty((replay.n_frames, replay.n_players, len(reward_names_fns)))
+    for i, (r_name, fn) in enumerate(reward_names_fns.items()):
+        if r_name in cached:
+            reward_values[..., i] = cached[r_name]
+            continue
+        with measure("reward", r_name, replay.n_players, replay.n_frames):
+            reward_values[..., i] = fn(replay)
+        if result_cache is not None:
+            result_cache.store(result_key, reward_names_args[r_name], reward_values[..., i], replay)
 
-    return reward_values_df
+    # Post-processing stages transform the whole (frames, players, rewards) block at once
+    for s_name, stage in stage_functions(stage_names_args or ()):
+        with measure("postprocess", s_name, replay.n_players, replay.n_frames):
+            reward_values = stage(reward_values, replay.team_idcs, start)
 
+    columns = pd.MultiIndex.from_product([replay.player_names, list(reward_names_fns)])
+    return pd.DataFrame(reward_values.reshape(replay.n_frames, -1), index=replay.index, columns=columns)
 
-def parse_replays(folder_paths: Dict[str, Sequence[str]],
-                  reward_names_args: Union[None, Sequence[Union[str, Tuple[str, dict]]]],
-                  n_skip=9):
-    reward_names_fns = {}
-    for r in reward_names_args:
-        if type(r) is str:
-            r_name, r_args = r, {}
+
+def _header_rows(header: pd.DataFrame) -> int:
+    # two column header rows and an index name row if the index is named
+    return 2 + (header.index.name is not None)
+
+
+def _read_csv_columns(replay_file: str,
+                      columns: Union[None, Sequence[Tuple[str, str]]],
+                      dtype: Union[None, str, np.dtype],
+                      skip_frame: Union[None, Callable[[int], bool]] = None) -> pd.DataFrame:
+    # pandas does not support `usecols` with multi-row headers, hence the header is read separately
+    # and the data rows are read by column position
+    header = pd.read_csv(replay_file, header=[0, 1], index_col=0, nrows=0)
+    all_columns = list(header.columns)
+    selected = all_columns if columns is None else select_columns(all_columns, columns)
+    positions = {c: i + 1 for i, c in enumerate(all_columns)}
+    usecols = [0] + [positions[c] for c in selected]
+
+    n_header = _header_rows(header)
+    df = pd.read_csv(replay_file,
+                     header=None,
+                     skiprows=n_header if skip_frame is None else lambda i: i < n_header or skip_frame(i - n_header),
+                     index_col=0,
+                     usecols=usecols,
+                     dtype=None if dtype is None else {i: dtype for i in usecols[1:]})
+    df.columns = pd.MultiIndex.from_tuples(selected)
+    df.index.name = header.index.name
+    return df
+
+
+def _select_frames(df: pd.DataFrame, n_skip: int, target_hz: Union[None, float]) -> pd.DataFrame:
+    if target_hz is not None:
+        return df.iloc[resample_frames(replay_time(df), target_hz)]
+    return df.iloc[::n_skip] if n_skip != 1 else df
+
+
+def load_replay(replay_file: str,
+                cache: Union[None, ReplayCache] = None,
+                mmap: bool = False,
+                columns: Union[None, Sequence[Tuple[str, str]]] = None,
+                dtype: Union[None, str, np.dtype] = None,
+                n_skip: int = 1,
+                target_hz: Union[None, float] = None):
+    """
+    Loads a replay data frame from a replay CSV file
+
+    :param replay_file: Path to the replay file
+    :param cache: Replay cache to load the replay from. The replay is read from the CSV file and stored into
+        the cache if not already cached. Optional.
+    :param mmap: Whether a cached replay is memory-mapped instead of read into memory
+    :param columns: The (entity, field) columns to load, the `"player"` entity standing for every player,
+        e.g. `rewards_columns(reward_names)`. Other columns are not parsed. All columns are loaded if `None`.
+    :param dtype: The data type replay values are stored as, e.g. `"float32"`. Defaults to `float64`.
+    :param n_skip: Keep one every `n_skip` frames. Skipped frames are not parsed.
+    :param target_hz: Resample the replay to this frame rate, keeping the first frame of every `1 / target_hz`
+        seconds of game time, instead of keeping one every `n_skip` frames. Optional.
+    """
+    if cache is not None:
+        if target_hz is not None:
+            time = cache.load(replay_file, columns=[time_column])
+            frames = None if time is None else resample_frames(replay_time(time), target_hz)
+            df = None if time is None else cache.load(replay_file, mmap, columns, dtype, frames)
         else:
-            r_name, r_args = r
-        reward_names_fns[r_name] = partial(rewards_names_map[r_name], **r_args)
+            df = cache.load(replay_file, mmap, columns, dtype, slice(None, None, n_skip) if n_skip != 1 else None)
+        if df is not None:
+            return df
 
-    def load_parse(replay_file):
+        # the cache always holds the full replay, so that any later selection can be served from it
         df = pd.read_csv(replay_file,
                          header=[0, 1],
-                         index_col=0).iloc[::n_skip]
-        return parse_replay(df, reward_names_fns=reward_names_fns)
+                         index_col=0)
+        cache.store(replay_file, df)
+        df = _select_frames(df, n_skip, target_hz)
+        if columns is not None:
+            df = df[select_columns(list(df.columns), columns)]
+        return df if dtype is None else df.astype(dtype)
+
+    if target_hz is not None:
+        # the time column is read first, so that only the resampled frames of the other columns are parsed
+        keep = tick_mask(replay_time(_read_csv_columns(replay_file, [time_column], None)), target_hz)[0]
+        return _read_csv_columns(replay_file, columns, dtype, lambda i: not keep[i])
+    if columns is None and dtype is None and n_skip == 1:
+        return pd.read_csv(replay_file,
+                           header=[0, 1],
+                           index_col=0)
+    return _read_csv_columns(replay_file, columns, dtype, (lambda i: i % n_skip != 0) if n_skip != 1 else None)
+
+
+def iter_replay_chunks(replay_file: str,
+                       chunk_size: int = 10000,
+                       cache: Union[None, ReplayCache] = None,
+                       n_skip: int = 1,
+                       target_hz: Union[None, float] = None):
+    """
+    Reads a replay in chunks of frames
+
+    :param replay_file: Path to the replay file
+    :param chunk_size: Number of frames per chunk. Chunks of resampled replays may hold fewer frames.
+    :param cache: Replay cache to read the replay from. Cached replays are memory-mapped. Optional.
+        Replays are not stored into the cache when read in chunks.
+    :param n_skip: Keep one every `n_skip` frames. Skipped frames are not parsed.
+    :param target_hz: Resample the replay to this frame rate instead of keeping one every `n_skip` frames,
+        see `load_replay`. Optional.
+    :return: A generator of replay data frame chunks
+    """
+    df = cache.load(replay_file, mmap=True) if cache is not None else None
+    if df is not None:
+        frames = resample_frames(replay_time(df), target_hz) if target_hz is not None \
+            else np.arange(0, df.shape[0], n_skip)
+        for start in range(0, len(frames), chunk_size):
+            yield df.iloc[frames[start:start + chunk_size]].copy()
+        return
+
+    n_header = _header_rows(pd.read_csv(replay_file, header=[0, 1], index_col=0, nrows=0))
+    start_time = last_tick = None
+    with pd.read_csv(replay_file,
+                     header=[0, 1],
+                     index_col=0,
+                     skiprows=(lambda i: i >= n_header and (i - n_header) % n_skip != 0)
+                     if n_skip != 1 and target_hz is None else None,
+                     chunksize=chunk_size) as reader:
+        for chunk in reader:
+            if target_hz is not None:
+                # ticks continue across chunks
+                time = replay_time(chunk)
+                start_time = time[0] if start_time is None else start_time
+                mask, last_tick = tick_mask(time, target_hz, start_time, last_tick)
+                chunk = chunk[mask]
+            yield chunk
+
+
+def iter_parse_replay(replay_file: str,
+                      reward_names_args: Union[None, Sequence[Union[str, Tuple[str, dict]]]] = None,
+                      reward_names_fns: Union[None, Dict[str, Callable[[Replay], np.ndarray]]] = None,
+                      chunk_size: int = 10000,
+                      context: int = 1,
+                      cache: Union[None, ReplayCache] = None,
+                      n_skip: int = 1,
+                      target_hz: Union[None, float] = None,
+                      stage_names_args: Union[None, Sequence[Union[str, Tuple[str, dict]]]] = None):
+    """
+    Parses a replay in chunks of frames, keeping memory bounded regardless of the replay length
+
+    :param replay_file: Path to the replay file
+    :param reward_names_args: A list of reward names or 2-tuples of reward names and reward keyword arguments
+    :param reward_names_fns: A dictionary of reward names and reward functions, used instead of `reward_names_args`
+    :param chunk_size: Number of frames per chunk
+    :param context: Number of frames of the previous chunk the rewards of each chunk are computed with.
+        Rewards depending on previous frames remain correct across chunk boundaries if `context` covers them.
+        The last player to touch the ball, e.g. of the `touched_last` condition and `goal` events, is carried across
+        chunks regardless, and requires a `context` of at least 1 frame for touches at chunk boundaries.
+    :param cache: Replay cache to read the replay from. Optional.
+    :param n_skip: Keep one every `n_skip` frames
+    :param target_hz: Resample the replay to this frame rate instead, see `load_replay`. Optional.
+    :param stage_names_args: Post-processing stages, see `parse_replay`. Stages over consecutive frames, e.g. `diff`,
+        require a `context` of at least 1 frame.
+    :return: A generator of reward data frame chunks, indexed by replay frame
+    """
+    team_idcs = None
+    previous = None
+    last_toucher = -1
+    n_parsed = 0
+    for chunk in iter_replay_chunks(replay_file, chunk_size, cache, n_skip, target_hz):
+        if team_idcs is None:
+            # Teams are determined by the first frame of the replay, not of each chunk
+            team_idcs = team_indices(chunk, [c for c in chunk.columns.levels[0] if c not in non_players])
+
+        n_context = 0 if previous is None else previous.shape[0]
+        frames = chunk if previous is None else pd.concat([previous, chunk])
+        replay = Replay.from_dataframe(frames, team_idcs, last_toucher)
+        reward_values_df = parse_replay(replay, reward_names_args, reward_names_fns,
+                                        stage_names_args=stage_names_args, start=n_parsed - n_context)
+        yield reward_values_df.iloc[n_context:]
+        n_parsed += chunk.shape[0]
+
+        # Touches of the context frames are detected again by the next chunk, replaying the same last toucher.
+        # Only chunks whose rewards read the last toucher compute it.
+        if "last_toucher" in vars(replay.features):
+            last_toucher = int(replay.features.last_toucher[-1])
+
+        previous = frames.iloc[frames.shape[0] - context:] if context else None
+
+
+def _replay_files(folder_paths: Dict[str, Sequence[str]]):
+    return [(category, os.path.join(folder, f_name))
+            for category, folders in folder_paths.items()
+            for folder in folders
+            for f_name in sorted(os.listdir(folder))]
+
+
+def _load_parse(replay_file: str,
+                reward_names_fns: Dict[str, Callable[[Replay], np.ndarray]],
+                n_skip: int,
+                cache: Union[None, ReplayCache],
+                trace_memory: Union[None, bool],
+                columns: Union[None, Sequence[Tuple[str, str]]] = None,
+                dtype: Union[None, str, np.dtype] = None,
+                target_hz: Union[None, float] = None,
+                stage_names_args: Union[None, Sequence[Union[str, Tuple[str, dict]]]] = None,
+                result_cache: Union[None, ResultCache] = None,
+                reward_names_args: Union[None, Sequence[Union[str, Tuple[str, dict]]]] = None):
+    # Profiling records are collected per file and returned, since workers cannot share the parent profiler
+    profiler = RewardProfiler(trace_memory=trace_memory) if trace_memory is not None else None
+    measure = profiler.measure if profiler is not None else unmeasured
+    if profiler is not None:
+        profiler.file = replay_file
+
+    result_key = None
+    reward_values_df = None
+    if result_cache is not None:
+        # replays whose rewards are all cached are not loaded
+        result_key = result_cache.file_key(replay_file, n_skip=n_skip, target_hz=target_hz, dtype=dtype)
+        reward_values_df = result_cache.assemble(result_key, reward_names_args)
+    if reward_values_df is not None:
+        if stage_names_args:
+            # rewards are cached before post-processing
+            team_idcs = np.array(result_cache.meta(result_key)["team_idcs"])
+            reward_values = reward_values_df.values.reshape(reward_values_df.shape[0], len(team_idcs), -1)
+            reward_values = postprocess(reward_values, stage_names_args, team_idcs)
+            reward_values_df = pd.DataFrame(reward_values.reshape(reward_values_df.shape),
+                                            index=reward_values_df.index, columns=reward_values_df.columns)
+    else:
+        with measure("load"):
+            df = load_replay(replay_file, cache, columns=columns, dtype=dtype, n_skip=n_skip, target_hz=target_hz)
+        reward_values_df = parse_replay(df, reward_names_args, reward_names_fns, profiler=profiler,
+                                        stage_names_args=stage_names_args, result_cache=result_cache,
+                                        result_key=result_key)
+    # Only the compact reward arrays are sent back from worker processes
+    return (reward_values_df.values, reward_values_df.columns.tolist(), reward_values_df.index.values,
+            profiler.records if profiler is not None else None)
+
+
+def parse_replays(folder_paths: Dict[str, Sequence[str]],
+                  reward_names_args: Union[None, Sequence[Union[str, Tuple[str, dict]]]],
+                  n_skip=9,
+                  cache: Union[None, str, ReplayCache] = None,
+                  n_workers: int = 1,
+                  executor: Union[None, Executor] = None,
+                  profiler: Union[None, RewardProfiler] = None,
+                  dtype: Union[None, str, np.dtype] = None,
+                  target_hz: Union[None, float] = None,
+                  stage_names_args: Union[None, Sequence[Union[str, Tuple[str, dict]]]] = None,
+                  result_cache: Union[None, str, ResultCache] = None):
+    """
+    Parses all replay files of the provided folders. Only the replay columns the rewards read are loaded.
+
+    :param folder_paths: A dictionary of category names and lists of folders containing replay files
+    :param reward_names_args: A list of reward names or 2-tuples of reward names and reward keyword arguments
+    :param n_skip: Keep one every `n_skip` frames. Skipped frames are not parsed.
+    :param cache: Replay cache or replay cache directory to load replays from. Optional.
+    :param n_workers: Number of worker processes replays are loaded and parsed with.
+        Replays are parsed in the current process if 1.
+    :param executor: An executor replays are loaded and parsed with, e.g. a `ProcessPoolExecutor`.
+        If provided, `n_workers` is ignored.
+    :param profiler: A profiler recording load, replay array construction and reward computation steps of
+        every replay file. Records of each file are passed to the profiler callback once the file is parsed.
+        Optional.
+    :param dtype: The data type replay values are loaded as, e.g. `"float32"` to halve replay memory.
+        Defaults to `float64`.
+    :param target_hz: Resample replays to this frame rate instead of keeping one every `n_skip` frames,
+        aligning replays recorded at different tick rates, see `load_replay`. Optional.
+    :param stage_names_args: Post-processing stages applied to the rewards of every replay, see `parse_replay`.
+        Optional.
+    :param result_cache: A cache or cache directory of computed rewards, keyed by replay file content and loading
+        options. Only rewards not cached are computed, replays whose rewards are all cached are not loaded. Optional.
+    :return: A dictionary of category names and lists of reward data frames, in sorted file name order
+    """
+    reward_names_fns = reward_functions(reward_names_args)
+
+    if type(cache) is str:
+        cache = ReplayCache(cache)
+    if type(result_cache) is str:
+        result_cache = ResultCache(result_cache)
+
+    replay_files = _replay_files(folder_paths)
+    load_parse = partial(_load_parse, reward_names_fns=reward_names_fns, n_skip=n_skip, cache=cache,
+                         trace_memory=profiler.trace_memory if profiler is not None else None,
+                         columns=rewards_columns(_columns_names(reward_names_args)), dtype=dtype, target_hz=target_hz,
+                         stage_names_args=stage_names_args, result_cache=result_cache,
+                         reward_names_args=reward_names_args)
+
+    if executor is not None:
+        results = executor.map(load_parse, [f for _, f in replay_files])
+    elif n_workers > 1:
+        with ProcessPoolExecutor(n_workers) as pool:
+            results = list(pool.map(load_parse, [f for _, f in replay_files], chunksize=4))
+    else:
+        results = map(load_parse, [f for _, f in replay_files])
 
-    reward_values_dfs = {category: [load_parse(folder + "/" + f_name)
-                                    for folder in folders
-                                    for f_name in os.listdir(folder)]
-                         for category, folders in folder_paths.items()}
+    reward_values_dfs = {category: [] for category in folder_paths}
+    for (category, _), (values, columns, index, records) in zip(replay_files, results):
+        if profiler is not None:
+            profiler.extend(records)
+        reward_values_dfs[category].append(pd.DataFrame(values,
+                                                        index=index,
+                                                        columns=pd.MultiIndex.from_tuples(columns)))
 
     return reward_values_dfs
@@ -0,0 +1,148 @@
+"""
+Reward post-processing stages.
+
+Stages transform the (n_frames, n_players, n_rewards) reward block of a replay as a whole, see `parsing.parse_replay`,
+rather than one reward and one player at a time. Stage parameters are either shared by all rewards or given per
+reward, as sequences of length n_rewards, broadcasting over the last block axis.
+"""
+from functools import partial
+from typing import Callable, Sequence, Tuple, Union
+
+import numpy as np
+
+
+def _per_reward(param) -> np.ndarray:
+    # scalars or per reward values, broadcasting over the (n_frames, n_players, n_rewards) block
+    return np.asarray(param, dtype=float)
+
+
+def _shape_negative(values: np.ndarray, negative_slope) -> np.ndarray:
+    negative_slope = _per_reward(negative_slope)
+    if (negative_slope != 1).any():
+        values = np.where(values < 0, values * negative_slope, values)
+    return values
+
+
+def distribute(values: np.ndarray, team_idcs: np.ndarray, start: int = 0, team_spirit=0.3) -> np.ndarray:
+    """
+    Rewards shared between team mates and opposed to the opponents' rewards,
+    see `plot_arena.reward_functions.extra_rewards.distribute`
+
+    :param values: Rewards of shape (n_frames, n_players, n_rewards)
+    :param team_idcs: Team indices of the players
+    :param start: Replay position of the first frame, unused
+    :param team_spirit: The share of the team mean reward
+    :return: Distributed rewards of shape (n_frames, n_players, n_rewards)
+    """
+    orange = np.asarray(team_idcs, dtype=bool)
+    team_spirit = _per_reward(team_spirit)
+    blue_means = values[:, ~orange].mean(1, keepdims=True)
+    orange_means = values[:, orange].mean(1, keepdims=True)
+    # every player gets its own team mean and the opposing team mean
+    team_means = np.where(orange[:, None], orange_means, blue_means)
+    opponent_means = np.where(orange[:, None], blue_means, orange_means)
+    return team_means * team_spirit + values * (1 - team_spirit) - opponent_means
+
+
+def diff(values: np.ndarray, team_idcs: np.ndarray, start: int = 0, negative_slope=1.) -> np.ndarray:
+    """
+    Difference of consecutive frame rewards, see `plot_arena.reward_functions.extra_rewards.diff`
+
+    :param values: Rewards of shape (n_frames, n_players, n_rewards)
+    :param team_idcs: Team indices of the players, unused
+    :param start: Replay position of the first frame, unused
+    :param negative_slope: Negative differences scale
+    :return: Rewards of shape (n_frames, n_players, n_rewards), NaN at the first frame
+    """
+    out = np.full(values.shape, np.nan)
+    out[1:] = _shape_negative(values[1:] - values[:-1], negative_slope)
+    return out
+
+
+def diff_potential(values: np.ndarray, team_idcs: np.ndarray, start: int = 0, gamma=0.99,
+                   negative_slope=1.) -> np.ndarray:
+    """
+    Potential-based reward shaping, see `plot_arena.reward_functions.custom_rewards.diff_potential`
+
+    :param values: Potentials of shape (n_frames, n_players, n_rewards)
+    :param team_idcs: Team indices of the players, unused
+    :param start: Replay position of the first frame, unused
+    :param gamma: The discount factor
+    :param negative_slope: Negative rewards scale
+    :return: Rewards of shape (n_frames, n_players, n_rewards), NaN at the first frame
+    """
+    out = np.full(values.shape, np.nan)
+    out[1:] = _shape_negative(_per_reward(gamma) * values[1:] - values[:-1], negative_slope)
+    return out
+
+
+def anneal_weights(n_rewards: int, frames: np.ndarray, x_fading_steps: Sequence[int], offset: int = 0) -> np.ndarray:
+    """
+    :param n_rewards: Number of rewards
+    :param frames: Replay positions of the frames
+    :param x_fading_steps: Number of frames each reward fades into the next one over, of length n_rewards - 1
+    :param offset: Replay position the first fade starts at
+    :return: Reward weights of shape (n_frames, n_rewards), adding up to 1 at every frame
+    """
+    assert len(x_fading_steps) == n_rewards - 1, "Every reward but the last must fade into the next one"
+    # fades follow each other, every fade going linearly from 0 to 1, as `extra_rewards.anneal` kernels
+    ends = offset + np.cumsum(x_fading_steps)
+    fades = np.clip((frames[:, None] - (ends - x_fading_steps)) / np.maximum(np.subtract(x_fading_steps, 1), 1),
+                    0, 1)
+    # weight of reward i: faded in by fade i - 1 and faded out by fade i
+    fades = np.concatenate([np.ones((len(frames), 1)), fades, np.zeros((len(frames), 1))], 1)
+    return fades[:, :-1] - fades[:, 1:]
+
+
+def anneal(values: np.ndarray, team_idcs: np.ndarray, start: int = 0, x_fading_steps: Sequence[int] = (),
+           offset: int = 0) -> np.ndarray:
+    """
+    Rewards cross-faded over the replay, see `plot_arena.reward_functions.extra_rewards.anneal`. Every reward is
+    weighted by its share of the schedule, so that the rewards add up to the annealed reward.
+
+    :param values: Rewards of shape (n_frames, n_players, n_rewards)
+    :param team_idcs: Team indices of the players, unused
+    :param start: Replay position of the first frame
+    :param x_fading_steps: Number of frames each reward fades into the next one over, see `anneal_weights`
+    :param offset: Replay position the first fade starts at
+    :return: Weighted rewards of shape (n_frames, n_players, n_rewards)
+    """
+    frames = np.arange(start, start + values.shape[0])
+    return values * anneal_weights(values.shape[-1], frames, x_fading_steps, offset)[:, None]
+
+
+stages_names_map = {"distribute": distribute,
+                    "diff": diff,
+                    "diff_potential": diff_potential,
+                    "anneal": anneal,
+                    }
+
+
+def stage_functions(stage_names_args: Sequence[Union[str, Tuple[str, dict]]]) -> Sequence[Tuple[str, Callable]]:
+    """
+    :param stage_names_args: A list of stage names or 2-tuples of stage names and stage keyword arguments
+    :return: A list of stage names and stage functions with their keyword arguments bound, in order
+    """
+    stages = []
+    for s in stage_names_args:
+        s_name, s_args = (s, {}) if type(s) is str else s
+        stages.append((s_name, partial(stages_names_map[s_name], **s_args)))
+    return stages
+
+
+def postprocess(values: np.ndarray,
+                stage_names_args: Sequence[Union[str, Tuple[str, dict]]],
+                team_idcs: np.ndarray,
+                start: int = 0) -> np.ndarray:
+    """
+    Applies post-processing stages in order
+
+    :param values: Rewards of shape (n_frames, n_players, n_rewards)
+    :param stage_names_args: A list of stage names or 2-tuples of stage names and stage keyword arguments
+    :param team_idcs: Team indices of the players
+    :param start: Replay position of the first frame
+    :return: Post-processed rewards of shape (n_frames, n_players, n_rewards)
+    """
+    for _, stage in stage_functions(stage_names_args):
+        values = stage(values, team_idcs, start)
+    return values
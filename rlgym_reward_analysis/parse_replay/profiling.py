@@ -0,0 +1,102 @@
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from typing import Callable, List, Union
+
+import pandas as pd
+
+_record_keys = ("file", "stage", "reward", "n_players", "n_frames", "wall_time", "calls", "allocated_bytes")
+
+
+def unmeasured(*args, **kwargs):
+    """
+    Drop-in for `RewardProfiler.measure` when profiling is disabled
+    """
+    return nullcontext()
+
+
+class RewardProfiler:
+    """
+    Records wall time, call count and allocated bytes of replay loading, replay array construction,
+    reward computation and post-processing steps of `parse_replay` and `parse_replays`.
+
+    Every step produces a record with keys `file`, `stage` (`"load"`, `"replay"`, `"reward"` or `"postprocess"`),
+    `reward`, `n_players`, `n_frames`, `wall_time`, `calls` and `allocated_bytes`. Rewards are evaluated for all players
+    of a replay at once, hence reward records refer to all `n_players` players.
+    """
+
+    def __init__(self,
+                 callback: Union[None, Callable[[dict], None]] = None,
+                 trace_memory: bool = True):
+        """
+        :param callback: A function called with every new record. Optional.
+        :param trace_memory: Whether to measure the peak allocated bytes of each step using `tracemalloc`.
+            Memory tracing slows down the measured steps.
+        """
+        self.callback = callback
+        self.trace_memory = trace_memory
+        self.file = None
+        self.records: List[dict] = []
+
+    def record(self, record: dict):
+        self.records.append(record)
+        if self.callback is not None:
+            self.callback(record)
+
+    def extend(self, records: List[dict]):
+        for record in records:
+            self.record(record)
+
+    @contextmanager
+    def measure(self, stage: str, reward: Union[None, str] = None, n_players: int = None, n_frames: int = None):
+        """
+        Context measuring a single step
+
+        :param stage: The step stage, `"load"`, `"replay"`, `"reward"` or `"postprocess"`
+        :param reward: The reward name of reward steps, the stage name of post-processing steps
+        :param n_players: Number of players the step computes values for
+        :param n_frames: Number of frames the step computes values for
+        """
+        start_tracing = self.trace_memory and not tracemalloc.is_tracing()
+        if start_tracing:
+            tracemalloc.start()
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+            start_memory = tracemalloc.get_traced_memory()[0]
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            wall_time = time.perf_counter() - start
+            allocated = tracemalloc.get_traced_memory()[1] - start_memory if self.trace_memory else None
+            if start_tracing:
+                tracemalloc.stop()
+            self.record({"file": self.file,
+                         "stage": stage,
+                         "reward": reward,
+                         "n_players": n_players,
+                         "n_frames": n_frames,
+                         "wall_time": wall_time,
+                         "calls": 1,
+                         "allocated_bytes": allocated})
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """
+        :return: A data frame of all records
+        """
+        return pd.DataFrame(self.records, columns=list(_record_keys))
+
+    def report(self, by=("stage", "reward")) -> pd.DataFrame:
+        """
+        :param by: Record keys to aggregate records by, e.g. `("file", "stage", "reward")`
+        :return: A data frame of total wall time, total calls, mean wall time per call and
+            maximum allocated bytes per group, sorted by total wall time
+        """
+        df = self.to_dataframe()
+        df[list(by)] = df[list(by)].fillna("")
+        report = df.groupby(list(by)).agg(wall_time=("wall_time", "sum"),
+                                          calls=("calls", "sum"),
+                                          allocated_bytes=("allocated_bytes", "max"))
+        report["wall_time_per_call"] = report["wall_time"] / report["calls"]
+        return report.sort_values("wall_time", ascending=False)
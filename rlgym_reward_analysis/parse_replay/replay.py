@@ -0,0 +1,171 @@
+from functools import cached_property
+from typing import Callable, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from .features import ReplayFeatures
+
+non_players = ('ball', 'game')
+
+# Fields are stored in this order so that vector fields can be read as array views
+_field_order = ('pos_x', 'pos_y', 'pos_z',
+                'vel_x', 'vel_y', 'vel_z',
+                'rot_x', 'rot_y', 'rot_z',
+                'ang_vel_x', 'ang_vel_y', 'ang_vel_z',
+                'boost')
+
+
+def _sort_fields(fields):
+    known = [f for f in _field_order if f in fields]
+    return known + [f for f in fields if f not in _field_order]
+
+
+def _select(values: np.ndarray, field_idcs: dict, fields: Sequence[str]):
+    idcs = [field_idcs[f] for f in fields]
+    if idcs == list(range(idcs[0], idcs[0] + len(idcs))):
+        # consecutive fields, no copy
+        return values[..., idcs[0]:idcs[0] + len(idcs)]
+    return values[..., idcs]
+
+
+def team_indices(df: pd.DataFrame, player_names: Sequence[str]) -> np.ndarray:
+    """
+    Frame 1: negative coordinate blue (0), positive coordinate orange (1)
+    """
+    return (df[list(player_names)].xs('pos_y', level=1, axis=1).iloc[0] > 0).values.astype(int)
+
+
+def select_columns(available: Sequence[Tuple[str, str]], columns: Sequence[Tuple[str, str]]) -> list:
+    """
+    :param available: The (entity, field) columns of a replay
+    :param columns: The requested (entity, field) columns. The `"player"` entity stands for every player.
+    :return: The available requested columns, in replay column order. Missing columns are skipped.
+    """
+    columns = set(columns)
+    return [c for c in available
+            if c in columns or (c[0] not in non_players and ("player", c[1]) in columns)]
+
+
+class Replay:
+    """
+    Dense array view of a replay. Ball and game state are stored as (n_frames, n_fields) arrays,
+    player state as a (n_frames, n_players, n_fields) array.
+
+    Replays of frame ranges, e.g. chunks of a longer replay, carry the state of earlier frames that features with
+    unbounded history depend on: `last_toucher`, the index of the player who touched the ball last before the first
+    frame, -1 if none.
+    """
+
+    def __init__(self,
+                 ball: np.ndarray,
+                 ball_fields: Sequence[str],
+                 players: np.ndarray,
+                 player_fields: Sequence[str],
+                 player_names: Sequence[str],
+                 team_idcs: np.ndarray,
+                 index: Union[None, np.ndarray] = None,
+                 game: Union[None, np.ndarray] = None,
+                 game_fields: Sequence[str] = (),
+                 last_toucher: Union[int, Callable[[], int]] = -1):
+        self.ball = ball
+        self.ball_fields = list(ball_fields)
+        self.players = players
+        self.player_fields = list(player_fields)
+        self.player_names = list(player_names)
+        self.team_idcs = np.asarray(team_idcs, dtype=int)
+        self.index = np.arange(ball.shape[0]) if index is None else index
+        self.game = np.empty((ball.shape[0], 0)) if game is None else game
+        self.game_fields = list(game_fields)
+        self._last_toucher = last_toucher
+
+        self._ball_idcs = {f: i for i, f in enumerate(self.ball_fields)}
+        self._player_idcs = {f: i for i, f in enumerate(self.player_fields)}
+        self._game_idcs = {f: i for i, f in enumerate(self.game_fields)}
+
+    @classmethod
+    def from_dataframe(cls,
+                       df: pd.DataFrame,
+                       team_idcs: Union[None, np.ndarray] = None,
+                       last_toucher: int = -1) -> "Replay":
+        """
+        :param df: A replay data frame with (entity, field) columns
+        :param team_idcs: Team indices of the players. Determined from the first replay frame if `None`.
+        :param last_toucher: Index of the player who touched the ball last before the first frame, -1 if none
+        """
+        entities = df.columns.get_level_values(0)
+        player_names = [c for c in df.columns.levels[0] if c not in non_players and c in entities]
+        if team_idcs is None:
+            team_idcs = team_indices(df, player_names)
+
+        ball_fields = _sort_fields(list(df['ball'].columns))
+        ball = np.ascontiguousarray(df['ball'][ball_fields].values)
+
+        if 'game' in entities:
+            game_fields = list(df['game'].columns)
+            game = np.ascontiguousarray(df['game'].values)
+        else:
+            game_fields, game = (), None
+
+        player_fields = _sort_fields(list(dict.fromkeys(f for p in player_names for f in df[p].columns)))
+        players = np.empty((df.shape[0], len(player_names), len(player_fields)),
+                           dtype=np.result_type(*df.dtypes.unique()))
+        for i, p in enumerate(player_names):
+            players[:, i] = df[p].reindex(columns=player_fields).values
+
+        return cls(ball, ball_fields, players, player_fields, player_names, team_idcs, df.index.values,
+                   game, game_fields, last_toucher)
+
+    @property
+    def n_frames(self):
+        return self.ball.shape[0]
+
+    @property
+    def n_players(self):
+        return len(self.player_names)
+
+    @property
+    def last_toucher(self) -> int:
+        """
+        Index of the player who touched the ball last before the first frame, -1 if none
+        """
+        if callable(self._last_toucher):
+            # slices resolve the state of the frames before them only when it is read
+            self._last_toucher = int(self._last_toucher())
+        return self._last_toucher
+
+    def ball_(self, *fields: str) -> np.ndarray:
+        """
+        :return: Ball fields, shape (n_frames, n_fields)
+        """
+        return _select(self.ball, self._ball_idcs, fields)
+
+    def player_(self, *fields: str) -> np.ndarray:
+        """
+        :return: Player fields, shape (n_frames, n_players, n_fields)
+        """
+        return _select(self.players, self._player_idcs, fields)
+
+    def game_(self, *fields: str) -> np.ndarray:
+        """
+        :return: Game fields, shape (n_frames, n_fields)
+        """
+        return _select(self.game, self._game_idcs, fields)
+
+    def __getitem__(self, frames: slice) -> "Replay":
+        """
+        :param frames: A slice of replay frames
+        :return: A replay of the sliced frames, backed by views of this replay's arrays
+        """
+        start = frames.indices(self.n_frames)[0]
+        last_toucher = self._last_toucher if start == 0 else lambda: self.features.last_toucher[start - 1]
+        return Replay(self.ball[frames], self.ball_fields, self.players[frames], self.player_fields,
+                      self.player_names, self.team_idcs, self.index[frames], self.game[frames], self.game_fields,
+                      last_toucher)
+
+    @cached_property
+    def features(self) -> ReplayFeatures:
+        """
+        Lazily computed geometric features, shared by every reward evaluated on this replay
+        """
+        return ReplayFeatures(self)
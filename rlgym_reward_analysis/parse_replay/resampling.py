@@ -0,0 +1,51 @@
+from typing import Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+time_column = ("game", "time")
+
+
+def replay_time(df: pd.DataFrame) -> np.ndarray:
+    """
+    :param df: A replay data frame
+    :return: The game time of every frame in seconds
+    """
+    if time_column not in df.columns:
+        raise ValueError("Time-based resampling requires the %s replay column" % (time_column,))
+    return df[time_column].values
+
+
+def tick_mask(time: np.ndarray,
+              target_hz: float,
+              start_time: Union[None, float] = None,
+              last_tick: Union[None, float] = None) -> Tuple[np.ndarray, float]:
+    """
+    Selects the first frame of every `1 / target_hz` seconds tick. Frames can be selected chunk by chunk,
+    passing the start time and the last tick of the previous chunks.
+
+    :param time: Game times of consecutive frames
+    :param target_hz: Target frame rate
+    :param start_time: The time ticks start at. Defaults to the first frame time.
+    :param last_tick: The tick of the last frame of the previous chunk, if any
+    :return: A boolean mask of selected frames and the tick of the last frame
+    """
+    if len(time) == 0:
+        return np.zeros(0, dtype=bool), last_tick
+    start_time = time[0] if start_time is None else start_time
+    # tolerance against accumulated floating point error of tick-aligned times
+    ticks = np.floor((time - start_time) * target_hz + 1e-6)
+    mask = np.empty(len(ticks), dtype=bool)
+    mask[0] = last_tick is None or ticks[0] != last_tick
+    mask[1:] = ticks[1:] != ticks[:-1]
+    return mask, ticks[-1]
+
+
+def resample_frames(time: np.ndarray, target_hz: float) -> np.ndarray:
+    """
+    :param time: Game times of all replay frames
+    :param target_hz: Target frame rate
+    :return: Indices of the first frame of every `1 / target_hz` seconds tick, aligning replays recorded at
+        different tick rates
+    """
+    return np.flatnonzero(tick_mask(time, target_hz)[0])
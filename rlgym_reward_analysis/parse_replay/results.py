@@ -0,0 +1,197 @@
+"""
+On-disk cache of computed rewards.
+
+Rewards of every replay are stored per reward, keyed by the replay content and the reward configuration, i.e. the
+reward name, its keyword arguments completed with the reward function defaults, and the library version. Adding a
+reward to a list of cached rewards thus only computes the new reward.
+"""
+import hashlib
+import json
+import os
+import shutil
+from typing import Dict, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from rlgym_reward_analysis import __version__
+from ..utils.reward_graph import canonical_kwargs, freeze
+from .replay import Replay
+from .reward_functions import rewards_names_map
+
+_hash_block = 1 << 20
+
+
+def _digest(*parts) -> str:
+    sha = hashlib.sha1()
+    for part in parts:
+        sha.update(part if isinstance(part, bytes) else repr(part).encode())
+    return sha.hexdigest()
+
+
+def _array_bytes(array: np.ndarray) -> bytes:
+    if array.dtype == object:
+        return repr(array.tolist()).encode()
+    return np.ascontiguousarray(array).tobytes()
+
+
+def reward_key(reward_name_args: Union[str, Tuple[str, dict]]) -> str:
+    """
+    :param reward_name_args: A reward name or a 2-tuple of a reward name and reward keyword arguments
+    :return: The cache key of the reward configuration. Keyword arguments equal to the reward function defaults
+        produce the same key as omitted ones.
+    """
+    r_name, r_args = (reward_name_args, {}) if type(reward_name_args) is str else reward_name_args
+    r_args = dict(r_args)
+    conditions = r_args.pop("conditions", None)
+    r_args = canonical_kwargs(rewards_names_map[r_name], r_args)
+    return _digest(r_name, freeze(r_args), freeze(conditions), __version__)
+
+
+class ResultCache:
+    """
+    On-disk cache of reward values.
+
+    Every replay entry is a directory holding the frame index, a `.json` sidecar with the players and one
+    `.npy` array of shape (n_frames, n_players) per reward configuration, see `reward_key`. Entries are keyed either
+    by the replay arrays, see `replay_key`, or by the replay file content and loading options, see `file_key`.
+    """
+
+    def __init__(self, cache_dir: str):
+        """
+        :param cache_dir: Directory holding the cache entries. Created if it does not exist.
+        """
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def replay_key(replay: Replay) -> str:
+        """
+        :param replay: A `Replay`
+        :return: The cache key of the replay content
+        """
+        arrays = [replay.index, replay.ball, replay.players, replay.team_idcs]
+        if replay.game is not None:
+            arrays.append(replay.game)
+        return _digest(replay.ball_fields, replay.player_fields, replay.game_fields, replay.player_names,
+                       replay.last_toucher,
+                       *(a.dtype.str + str(a.shape) for a in arrays),
+                       *(_array_bytes(a) for a in arrays))
+
+    def file_key(self, replay_file: str, **load_options) -> str:
+        """
+        :param replay_file: Path to the replay file
+        :param load_options: `parsing.load_replay` keyword arguments the replay is loaded with, e.g. `n_skip`
+        :return: The cache key of the replay file content loaded with the options
+        """
+        # file contents are hashed once per file version, identified by size and modification time
+        stat = os.stat(replay_file)
+        hash_path = os.path.join(self.cache_dir, "files",
+                                 _digest(os.path.abspath(replay_file), stat.st_size, stat.st_mtime_ns))
+        try:
+            with open(hash_path) as f:
+                content = f.read()
+        except FileNotFoundError:
+            sha = hashlib.sha1()
+            with open(replay_file, "rb") as f:
+                for block in iter(lambda: f.read(_hash_block), b""):
+                    sha.update(block)
+            content = sha.hexdigest()
+            self._write(hash_path, lambda f: f.write(content.encode()))
+        return _digest(content, sorted((k, str(v)) for k, v in load_options.items()))
+
+    @staticmethod
+    def _write(path: str, write):
+        # write to a temporary file first so that concurrent readers never see partial entries
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".%d.tmp" % os.getpid(), "wb") as f:
+            write(f)
+        os.replace(path + ".%d.tmp" % os.getpid(), path)
+
+    def _entry_path(self, key: str, name: str) -> str:
+        return os.path.join(self.cache_dir, key, name)
+
+    def load(self,
+             key: str,
+             reward_names_args: Sequence[Union[str, Tuple[str, dict]]],
+             shape: Union[None, Tuple[int, int]] = None) -> Dict[str, np.ndarray]:
+        """
+        :param key: A replay cache key
+        :param reward_names_args: A list of reward names or 2-tuples of reward names and reward keyword arguments
+        :param shape: The expected (n_frames, n_players) shape of the rewards. Rewards of other shapes are ignored.
+        :return: A dictionary of reward names and reward values of shape (n_frames, n_players), of the cached
+            rewards only
+        """
+        cached = {}
+        for r in reward_names_args:
+            try:
+                values = np.load(self._entry_path(key, reward_key(r) + ".npy"))
+            except FileNotFoundError:
+                continue
+            if shape is None or values.shape == tuple(shape):
+                cached[r if type(r) is str else r[0]] = values
+        return cached
+
+    def store(self,
+              key: str,
+              reward_name_args: Union[str, Tuple[str, dict]],
+              values: np.ndarray,
+              replay: Replay):
+        """
+        :param key: A replay cache key
+        :param reward_name_args: A reward name or a 2-tuple of a reward name and reward keyword arguments
+        :param values: Reward values of shape (n_frames, n_players)
+        :param replay: The `Replay` the rewards are computed for
+        """
+        meta_path = self._entry_path(key, "meta.json")
+        if not os.path.exists(meta_path):
+            self._write(self._entry_path(key, "index.npy"), lambda f: np.save(f, np.asarray(replay.index)))
+            meta = {"player_names": list(replay.player_names), "team_idcs": replay.team_idcs.tolist()}
+            self._write(meta_path, lambda f: f.write(json.dumps(meta).encode()))
+        self._write(self._entry_path(key, reward_key(reward_name_args) + ".npy"),
+                    lambda f: np.save(f, np.asarray(values)))
+
+    def meta(self, key: str) -> Union[None, dict]:
+        """
+        :param key: A replay cache key
+        :return: The `player_names` and `team_idcs` of the replay entry, or `None` if the replay is not cached
+        """
+        try:
+            with open(self._entry_path(key, "meta.json")) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def assemble(self, key: str, reward_names_args: Sequence[Union[str, Tuple[str, dict]]]) -> Union[None,
+                                                                                                     pd.DataFrame]:
+        """
+        :param key: A replay cache key
+        :param reward_names_args: A list of reward names or 2-tuples of reward names and reward keyword arguments
+        :return: A reward data frame with (player name, reward name) columns, indexed by replay frame, as
+            `parsing.parse_replay`, or `None` unless all rewards are cached
+        """
+        meta = self.meta(key)
+        try:
+            index = np.load(self._entry_path(key, "index.npy"))
+        except FileNotFoundError:
+            return None
+        if meta is None:
+            return None
+        player_names = meta["player_names"]
+        cached = self.load(key, reward_names_args, (len(index), len(player_names)))
+        if len(cached) < len(reward_names_args):
+            return None
+
+        reward_values = np.stack(list(cached.values()), -1)
+        columns = pd.MultiIndex.from_product([player_names, list(cached)])
+        return pd.DataFrame(reward_values.reshape(len(index), -1), index=index, columns=columns)
+
+    def invalidate(self, key: Union[None, str] = None):
+        """
+        Removes cache entries
+
+        :param key: The replay cache key whose entry is removed. If `None`, the whole cache is cleared.
+        """
+        keys = [key] if key is not None else [k for k in os.listdir(self.cache_dir) if k != "files"]
+        for k in keys:
+            shutil.rmtree(os.path.join(self.cache_dir, k), ignore_errors=True)
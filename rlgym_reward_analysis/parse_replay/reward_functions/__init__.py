@@ -1,4 +1,7 @@
+from typing import List, Sequence, Tuple, Union
+
 from . import common_rewards, custom_rewards, extra_rewards
+from .. import conditions
 
 rewards_names_map = {"liu_dist_ball2goal": custom_rewards.liu_dist_ball2goal,
                      "signed_liu_dist_ball2goal": custom_rewards.signed_liu_dist_ball2goal,
@@ -15,4 +18,51 @@ rewards_names_map = {"liu_dist_ball2goal": custom_rewards.liu_dist_ball2goal,
                      "face_ball": common_rewards.face_ball,
                      "touch_ball": common_rewards.touch_ball,
                      "kickoff": extra_rewards.kickoff,
+                     "event": custom_rewards.event,
+                     # condition masks, e.g. multiplying reward expressions
+                     "closest2ball": conditions.closest2ball,
+                     "behind_ball": conditions.behind_ball,
+                     "touched_last": conditions.touched_last,
                      }
+
+_ball_position = [("ball", "pos_x"), ("ball", "pos_y"), ("ball", "pos_z")]
+_ball_lin_velocity = [("ball", "vel_x"), ("ball", "vel_y"), ("ball", "vel_z")]
+_player_position = [("player", "pos_x"), ("player", "pos_y"), ("player", "pos_z")]
+_player_lin_velocity = [("player", "vel_x"), ("player", "vel_y"), ("player", "vel_z")]
+_player_rotation = [("player", "rot_x"), ("player", "rot_y"), ("player", "rot_z")]
+
+# (entity, field) replay columns each reward reads, the "player" entity standing for every player
+rewards_columns_map = {"liu_dist_ball2goal": _ball_position,
+                       "signed_liu_dist_ball2goal": _ball_position,
+                       "liu_dist_ball2goal_diff": _ball_position,
+                       "velocity_ball2goal": _ball_position + _ball_lin_velocity,
+                       "ball_y_coord": _ball_position,
+                       "velocity": _player_lin_velocity,
+                       "save_boost": [("player", "boost")],
+                       "align_ball": _ball_position + _player_position,
+                       "dist_weighted_align_ball": _ball_position + _player_position,
+                       "offensive_potential": _ball_position + _player_position + _player_lin_velocity,
+                       "liu_dist_player2ball": _ball_position + _player_position,
+                       "velocity_player2ball": _ball_position + _player_position + _player_lin_velocity,
+                       "face_ball": _ball_position + _player_position + _player_rotation,
+                       "touch_ball": _ball_position + _ball_lin_velocity + _player_position,
+                       "kickoff": _ball_position + _player_position + _player_lin_velocity,
+                       "event": _ball_position + _ball_lin_velocity + _player_position,
+                       "closest2ball": _ball_position + _player_position,
+                       "behind_ball": _ball_position + _player_position,
+                       "touched_last": _ball_position + _ball_lin_velocity + _player_position,
+                       }
+
+
+def rewards_columns(reward_names: Sequence[str]) -> Union[None, List[Tuple[str, str]]]:
+    """
+    :param reward_names: Reward names
+    :return: The union of the replay columns the rewards read, including the player `pos_y` column teams are
+        determined by and the ball position every replay holds, or `None` if any reward does not declare its columns
+    """
+    columns = dict.fromkeys([("player", "pos_y")] + _ball_position)
+    for r_name in reward_names:
+        if r_name not in rewards_columns_map:
+            return None
+        columns.update(dict.fromkeys(rewards_columns_map[r_name]))
+    return list(columns)
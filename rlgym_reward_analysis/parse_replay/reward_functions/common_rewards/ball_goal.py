@@ -1,13 +1,9 @@
-import numpy as np
-
 from rlgym_reward_analysis import _common_values
-from rlgym_reward_analysis.parse_replay import _objectives
+from rlgym_reward_analysis.utils.math import dot
 
 
-def velocity_ball2goal(frames, player_team):
-    objective = _objectives[int(player_team[1])]
+def velocity_ball2goal(replay):
+    features = replay.features
 
-    pos_diff = objective - frames['ball'][['pos_x', 'pos_y', 'pos_z']]
-    norm_pos_diff = pos_diff / (np.linalg.norm(pos_diff, axis=-1)[..., None] + 1e-8)
-    ball_lin_velocity = frames['ball'][['vel_x', 'vel_y', 'vel_z']] / (_common_values.BALL_MAX_SPEED * 10)
-    return (norm_pos_diff.values * ball_lin_velocity.values).sum(1)
+    ball_lin_velocity = features.ball_lin_velocity / (_common_values.BALL_MAX_SPEED * 10)
+    return dot(features.ball2objective_unit, ball_lin_velocity[:, None])
@@ -1,28 +1,21 @@
 import numpy as np
 
 from rlgym_reward_analysis import _common_values
-from rlgym_reward_analysis.parse_replay import _objectives
-from rlgym_reward_analysis.utils.math import cosine_similarity
+from rlgym_reward_analysis.utils.math import dot
 
 
-def velocity(frames, player_team, negative=False):
-    return (np.linalg.norm(frames[player_team[0]][['vel_x', 'vel_y', 'vel_z']], axis=-1) /
-            (_common_values.CAR_MAX_SPEED * 10) * (1 - 2 * negative))
+def velocity(replay, negative=False):
+    return replay.features.speed / (_common_values.CAR_MAX_SPEED * 10) * (1 - 2 * negative)
 
 
-def save_boost(frames, player_team):
-    return np.sqrt(frames[player_team[0]]['boost'] / 255)
+def save_boost(replay):
+    return np.sqrt(replay.player_('boost')[..., 0] / 255)
 
 
-def align_ball(frames, player_team, defense=1, offense=1):
-    if int(player_team[1]):
-        blue_goal, orange_goal = _objectives
-    else:
-        blue_goal, orange_goal = _objectives[::-1]
-    ball_position = frames['ball'][['pos_x', 'pos_y', 'pos_z']].values
-    player_position = frames[player_team[0]][['pos_x', 'pos_y', 'pos_z']].values
+def align_ball(replay, defense=1, offense=1):
+    features = replay.features
 
-    defensive = defense * cosine_similarity(ball_position - player_position, player_position - blue_goal)
-    offensive = offense * cosine_similarity(ball_position - player_position, orange_goal - player_position)
+    defensive = defense * dot(features.player2ball_unit, features.own_goal2player_unit)
+    offensive = offense * dot(features.player2ball_unit, features.player2objective_unit)
 
     return defensive + offensive
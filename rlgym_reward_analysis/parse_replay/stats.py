@@ -0,0 +1,396 @@
+"""
+Streaming reward statistics.
+
+Statistics are updated replay by replay and are mergeable, hence replays can be reduced in worker processes and
+their statistics combined, with memory independent of the number of replays. Players are grouped by replay position or
+team rather than by name by default, so that memory does not grow with the number of distinct players either. Means,
+variances and co-moments are merged with the parallel algorithm of Chan et al., quantiles are approximated by a
+logarithmically bucketed sketch with bounded relative error (DDSketch).
+"""
+from concurrent.futures import Executor, ProcessPoolExecutor
+from functools import partial
+from typing import Callable, Dict, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from .cache import ReplayCache
+from .parsing import _columns_names, _replay_files, load_replay, parse_replay, reward_functions
+from .replay import Replay
+from .reward_functions import rewards_columns
+
+_default_bins = np.linspace(-1, 1, 41)
+_teams = ("blue", "orange")
+
+
+def _merge_moments(n_a, mean_a, m2_a, n_b, mean_b, m2_b):
+    n = n_a + n_b
+    delta = mean_b - mean_a
+    with np.errstate(invalid="ignore", divide="ignore"):
+        weight = np.where(n > 0, n_b / n, 0)
+    mean = mean_a + delta * weight
+    m2 = m2_a + m2_b + delta ** 2 * n_a * weight
+    return n, mean, m2
+
+
+class QuantileSketch:
+    """
+    Relative error quantile sketch of a batch of value series. Values are counted in logarithmically sized buckets,
+    so that every quantile estimate is within `relative_accuracy` of a true value. Values smaller in magnitude than
+    `min_value` are counted as zeros, values larger than `max_value` in the last bucket. Every series holds
+    about `2 * log(max_value / min_value) / log((1 + relative_accuracy) / (1 - relative_accuracy))` buckets, e.g.
+    4149 with the defaults, 1385 for values between 1e-3 and 1e3.
+    """
+
+    def __init__(self, n_series: int, relative_accuracy=0.01, min_value=1e-9, max_value=1e9):
+        """
+        :param n_series: Number of value series
+        :param relative_accuracy: Relative accuracy of quantile estimates
+        :param min_value: Smallest distinguishable value magnitude
+        :param max_value: Largest distinguishable value magnitude
+        """
+        self.relative_accuracy = relative_accuracy
+        self.min_value = min_value
+        self.max_value = max_value
+        self._log_gamma = np.log((1 + relative_accuracy) / (1 - relative_accuracy))
+        self._min_key = int(np.ceil(np.log(min_value) / self._log_gamma))
+        self._max_key = int(np.ceil(np.log(max_value) / self._log_gamma))
+        # negative buckets in decreasing magnitude, zero bucket, positive buckets in increasing magnitude
+        self._zero_idx = self._max_key - self._min_key + 1
+        self.counts = np.zeros((n_series, 2 * self._zero_idx + 1), dtype=np.int64)
+
+    def _bucket_values(self) -> np.ndarray:
+        keys = np.arange(self._min_key, self._max_key + 1)
+        values = 2 * np.exp(keys * self._log_gamma) / (1 + np.exp(self._log_gamma))
+        return np.concatenate([-values[::-1], [0], values])
+
+    def update(self, values: np.ndarray):
+        """
+        :param values: Values of shape (n_values, n_series). Non-finite values are ignored.
+        """
+        n_series, n_buckets = self.counts.shape
+        magnitude = np.abs(values)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            keys = np.ceil(np.log(magnitude) / self._log_gamma)
+        offsets = np.clip(np.nan_to_num(keys, nan=self._min_key, neginf=self._min_key), self._min_key,
+                          self._max_key).astype(np.int64) - self._min_key + 1
+        idcs = np.where(values > 0, self._zero_idx + offsets, self._zero_idx - offsets)
+        idcs[magnitude < self.min_value] = self._zero_idx
+        # non-finite values go to a discarded bucket past the last series
+        idcs = np.where(np.isfinite(values), idcs + np.arange(n_series) * n_buckets, n_series * n_buckets)
+        counts = np.bincount(idcs.ravel(), minlength=n_series * n_buckets + 1)
+        self.counts += counts[:-1].reshape(n_series, n_buckets)
+
+    def merge(self, other: "QuantileSketch") -> "QuantileSketch":
+        self.counts += other.counts
+        return self
+
+    def quantile(self, q: Union[float, Sequence[float]]) -> np.ndarray:
+        """
+        :param q: Quantile or quantiles between 0 and 1
+        :return: Quantile estimates of shape (n_series,) or (n_series, n_quantiles), NaN for empty series
+        """
+        q = np.asarray(q, dtype=float)
+        cum_counts = np.cumsum(self.counts, -1)
+        total = cum_counts[:, -1:]
+        ranks = np.atleast_1d(q)[None] * np.maximum(total - 1, 0)
+        idcs = (cum_counts[:, None, :] <= ranks[..., None]).sum(-1)
+        quantiles = self._bucket_values()[np.minimum(idcs, self.counts.shape[1] - 1)]
+        quantiles[total[:, 0] == 0] = np.nan
+        return quantiles if q.ndim else quantiles[:, 0]
+
+
+class RunningStats:
+    """
+    Count, mean, variance, minimum, maximum, histogram and quantile sketch of a batch of value series
+    """
+
+    def __init__(self, n_series: int, bins: Sequence[np.ndarray], relative_accuracy=0.01, min_value=1e-9,
+                 max_value=1e9):
+        """
+        :param n_series: Number of value series
+        :param bins: Histogram bin edges of each series. Values outside the edges are counted in an underflow
+            and an overflow bin.
+        :param relative_accuracy: Relative accuracy of quantile estimates
+        :param min_value: Smallest value magnitude distinguished by quantile estimates, see `QuantileSketch`
+        :param max_value: Largest value magnitude distinguished by quantile estimates, see `QuantileSketch`
+        """
+        self.bins = [np.asarray(edges, dtype=float) for edges in bins]
+        self.count = np.zeros(n_series, dtype=np.int64)
+        self.mean = np.zeros(n_series)
+        self.m2 = np.zeros(n_series)
+        self.min = np.full(n_series, np.inf)
+        self.max = np.full(n_series, -np.inf)
+        self.histograms = [np.zeros(len(edges) + 1, dtype=np.int64) for edges in self.bins]
+        self.sketch = QuantileSketch(n_series, relative_accuracy, min_value, max_value)
+
+    def update(self, values: np.ndarray):
+        """
+        :param values: Values of shape (n_values, n_series). Non-finite values are ignored.
+        """
+        finite = np.isfinite(values)
+        count = finite.sum(0)
+        zeroed = np.where(finite, values, 0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.where(count > 0, zeroed.sum(0) / count, 0)
+        m2 = np.where(finite, values - mean, 0)
+        m2 = np.einsum('ij,ij->j', m2, m2)
+        self.count, self.mean, self.m2 = _merge_moments(self.count, self.mean, self.m2, count, mean, m2)
+
+        self.min = np.minimum(self.min, np.where(finite, values, np.inf).min(0, initial=np.inf))
+        self.max = np.maximum(self.max, np.where(finite, values, -np.inf).max(0, initial=-np.inf))
+
+        for i, edges in enumerate(self.bins):
+            series = values[finite[:, i], i]
+            idcs = np.searchsorted(edges, series, side="right")
+            # the last bin includes its right edge
+            idcs[series == edges[-1]] -= 1
+            self.histograms[i] += np.bincount(idcs, minlength=len(edges) + 1)
+
+        self.sketch.update(values)
+
+    def merge(self, other: "RunningStats") -> "RunningStats":
+        self.count, self.mean, self.m2 = _merge_moments(self.count, self.mean, self.m2,
+                                                        other.count, other.mean, other.m2)
+        self.min = np.minimum(self.min, other.min)
+        self.max = np.maximum(self.max, other.max)
+        for histogram, other_histogram in zip(self.histograms, other.histograms):
+            histogram += other_histogram
+        self.sketch.merge(other.sketch)
+        return self
+
+    @property
+    def var(self) -> np.ndarray:
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(self.count > 1, self.m2 / (self.count - 1), np.nan)
+
+
+class RewardStats:
+    """
+    Mergeable statistics of the reward data frames of a replay category. Keeps running statistics per player group
+    and reward, and the co-moment matrix of rewards over all frames and players.
+
+    Players are grouped by `group_by`:
+
+    - `"slot"`: the position of the player in the reward data frames, e.g. 0 to 5 in 3v3 replays
+    - `"team"`: the player team, `"blue"` or `"orange"`
+    - `"player"`: the player name. Memory grows with the number of distinct players.
+    """
+
+    def __init__(self,
+                 reward_names: Sequence[str],
+                 bins: Union[np.ndarray, Dict[str, np.ndarray]] = _default_bins,
+                 relative_accuracy=0.01,
+                 group_by="slot",
+                 min_value=1e-9,
+                 max_value=1e9):
+        """
+        :param reward_names: The reward names, in reward data frame order
+        :param bins: Histogram bin edges shared by all rewards, or a dictionary of reward names and bin edges.
+            Rewards missing from the dictionary use edges from -1 to 1.
+        :param relative_accuracy: Relative accuracy of quantile estimates
+        :param group_by: How players are grouped, `"slot"`, `"team"` or `"player"`
+        :param min_value: Smallest reward magnitude distinguished by quantile estimates, see `QuantileSketch`
+        :param max_value: Largest reward magnitude distinguished by quantile estimates, see `QuantileSketch`
+        """
+        assert group_by in ("slot", "team", "player"), "Unknown player grouping %s" % group_by
+        self.reward_names = list(reward_names)
+        self.bins = [bins.get(r, _default_bins) if isinstance(bins, dict) else bins for r in self.reward_names]
+        self.relative_accuracy = relative_accuracy
+        self.group_by = group_by
+        self.min_value = min_value
+        self.max_value = max_value
+        self.groups: Dict[Union[int, str], RunningStats] = {}
+
+        n_rewards = len(self.reward_names)
+        self.count = 0
+        self.mean = np.zeros(n_rewards)
+        self.comoment = np.zeros((n_rewards, n_rewards))
+
+    def _running_stats(self) -> RunningStats:
+        return RunningStats(len(self.reward_names), self.bins, self.relative_accuracy, self.min_value, self.max_value)
+
+    def update(self, reward_values_df: pd.DataFrame, team_idcs: Union[None, np.ndarray] = None):
+        """
+        :param reward_values_df: A reward data frame with (player name, reward name) columns, see `parse_replay`
+        :param team_idcs: Team indices of the players, required if players are grouped by team
+        """
+        player_names = list(dict.fromkeys(reward_values_df.columns.get_level_values(0)))
+        values = reward_values_df.reindex(columns=pd.MultiIndex.from_product([player_names, self.reward_names]))
+        values = values.values.reshape(-1, len(player_names), len(self.reward_names))
+
+        if self.group_by == "team":
+            assert team_idcs is not None, "Grouping players by team requires `team_idcs`"
+            players_groups = [(_teams[t], values[:, np.asarray(team_idcs) == t]) for t in (0, 1)]
+        else:
+            keys = player_names if self.group_by == "player" else range(len(player_names))
+            players_groups = [(key, values[:, [i]]) for i, key in enumerate(keys)]
+        for key, group_values in players_groups:
+            if key not in self.groups:
+                self.groups[key] = self._running_stats()
+            self.groups[key].update(group_values.reshape(-1, len(self.reward_names)))
+
+        # co-moments over the frames of all players with finite values for every reward
+        rows = values.reshape(-1, len(self.reward_names))
+        rows = rows[np.isfinite(rows).all(1)]
+        if len(rows):
+            mean = rows.mean(0)
+            centered = rows - mean
+            self._merge_comoment(len(rows), mean, centered.T @ centered)
+
+    def _merge_comoment(self, count, mean, comoment):
+        n = self.count + count
+        delta = mean - self.mean
+        self.comoment = self.comoment + comoment + np.outer(delta, delta) * self.count * count / n
+        self.mean = self.mean + delta * count / n
+        self.count = n
+
+    def merge(self, other: "RewardStats") -> "RewardStats":
+        assert self.reward_names == other.reward_names, "Reward statistics of different rewards cannot be merged"
+        assert self.group_by == other.group_by, "Reward statistics of different player groups cannot be merged"
+        for key, stats in other.groups.items():
+            if key in self.groups:
+                self.groups[key].merge(stats)
+            else:
+                self.groups[key] = stats
+        if other.count:
+            self._merge_comoment(other.count, other.mean, other.comoment)
+        return self
+
+    def total(self) -> RunningStats:
+        """
+        :return: Running statistics of each reward over all players
+        """
+        total = self._running_stats()
+        for stats in self.groups.values():
+            total.merge(stats)
+        return total
+
+    def summary(self, quantiles: Sequence[float] = (0.05, 0.25, 0.5, 0.75, 0.95), by_group=True) -> pd.DataFrame:
+        """
+        :param quantiles: Quantiles to estimate
+        :param by_group: Whether to summarize each player group separately or all players together
+        :return: A data frame of count, mean, std, min, max and quantiles, indexed by (player group, reward name)
+            or by reward name
+        """
+        groups = self.groups if by_group else {None: self.total()}
+        summaries = []
+        for stats in groups.values():
+            summary = pd.DataFrame({"count": stats.count,
+                                    "mean": np.where(stats.count > 0, stats.mean, np.nan),
+                                    "std": np.sqrt(stats.var),
+                                    "min": np.where(stats.count > 0, stats.min, np.nan),
+                                    "max": np.where(stats.count > 0, stats.max, np.nan)},
+                                   index=self.reward_names)
+            summary[["q%g" % q for q in quantiles]] = stats.sketch.quantile(quantiles)
+            summaries.append(summary)
+        if by_group:
+            return pd.concat(summaries, keys=list(groups), names=[self.group_by, "reward"])
+        return summaries[0].rename_axis("reward")
+
+    def histogram(self, reward: str, group: Union[None, int, str] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        :param reward: The reward name
+        :param group: The player group, a player slot, team or name depending on `group_by`. All players are counted
+            if `None`.
+        :return: Bin counts, including the underflow and overflow bins first and last, and bin edges
+        """
+        stats = self.total() if group is None else self.groups[group]
+        i = self.reward_names.index(reward)
+        return stats.histograms[i], stats.bins[i]
+
+    def covariance(self) -> pd.DataFrame:
+        """
+        :return: The reward covariance matrix over all frames and players
+        """
+        cov = self.comoment / (self.count - 1) if self.count > 1 else np.full_like(self.comoment, np.nan)
+        return pd.DataFrame(cov, index=self.reward_names, columns=self.reward_names)
+
+    def correlation(self) -> pd.DataFrame:
+        """
+        :return: The reward correlation matrix over all frames and players
+        """
+        cov = self.covariance()
+        std = np.sqrt(np.diag(cov.values))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return cov / np.outer(std, std)
+
+
+def _load_stats(replay_file: str,
+                reward_names_fns: Dict[str, Callable[[Replay], np.ndarray]],
+                n_skip: int,
+                cache: Union[None, ReplayCache],
+                dtype: Union[None, str, np.dtype],
+                target_hz: Union[None, float],
+                columns: Union[None, Sequence[Tuple[str, str]]],
+                **stats_kwargs) -> RewardStats:
+    df = load_replay(replay_file, cache, columns=columns, dtype=dtype, n_skip=n_skip, target_hz=target_hz)
+    replay = Replay.from_dataframe(df)
+    stats = RewardStats(list(reward_names_fns), **stats_kwargs)
+    stats.update(parse_replay(replay, reward_names_fns=reward_names_fns), replay.team_idcs)
+    return stats
+
+
+def reward_stats(folder_paths: Dict[str, Sequence[str]],
+                 reward_names_args: Sequence[Union[str, Tuple[str, dict]]],
+                 n_skip=9,
+                 cache: Union[None, str, ReplayCache] = None,
+                 n_workers: int = 1,
+                 executor: Union[None, Executor] = None,
+                 bins: Union[np.ndarray, Dict[str, np.ndarray]] = _default_bins,
+                 relative_accuracy=0.01,
+                 dtype: Union[None, str, np.dtype] = None,
+                 target_hz: Union[None, float] = None,
+                 group_by="slot",
+                 min_value=1e-9,
+                 max_value=1e9) -> Dict[str, RewardStats]:
+    """
+    Parses all replay files of the provided folders, reducing reward data frames to running statistics instead of
+    keeping them
+
+    :param folder_paths: A dictionary of category names and lists of folders containing replay files
+    :param reward_names_args: A list of reward names or 2-tuples of reward names and reward keyword arguments
+    :param n_skip: Keep one every `n_skip` frames
+    :param cache: Replay cache or replay cache directory to load replays from. Optional.
+    :param n_workers: Number of worker processes replays are loaded, parsed and reduced with.
+        Replays are parsed in the current process if 1.
+    :param executor: An executor replays are loaded, parsed and reduced with. If provided, `n_workers` is ignored.
+    :param bins: Histogram bin edges, see `RewardStats`
+    :param relative_accuracy: Relative accuracy of quantile estimates
+    :param dtype: The data type replay values are loaded as, e.g. `"float32"`. Defaults to `float64`.
+    :param target_hz: Resample replays to this frame rate instead of keeping one every `n_skip` frames,
+        see `load_replay`. Optional.
+    :param group_by: How players are grouped, `"slot"`, `"team"` or `"player"`, see `RewardStats`
+    :param min_value: Smallest reward magnitude distinguished by quantile estimates, see `QuantileSketch`
+    :param max_value: Largest reward magnitude distinguished by quantile estimates, see `QuantileSketch`
+    :return: A dictionary of category names and reward statistics
+    """
+    reward_names_fns = reward_functions(reward_names_args)
+
+    if type(cache) is str:
+        cache = ReplayCache(cache)
+
+    replay_files = _replay_files(folder_paths)
+    load_stats = partial(_load_stats, reward_names_fns=reward_names_fns, n_skip=n_skip, cache=cache, dtype=dtype,
+                         target_hz=target_hz, columns=rewards_columns(_columns_names(reward_names_args)), bins=bins,
+                         relative_accuracy=relative_accuracy, group_by=group_by, min_value=min_value,
+                         max_value=max_value)
+
+    category_stats = {category: RewardStats(list(reward_names_fns), bins, relative_accuracy, group_by, min_value,
+                                            max_value)
+                      for category in folder_paths}
+
+    def reduce(results):
+        # statistics are merged as they arrive, one replay at a time
+        for (category, _), stats in zip(replay_files, results):
+            category_stats[category].merge(stats)
+
+    if executor is not None:
+        reduce(executor.map(load_stats, [f for _, f in replay_files]))
+    elif n_workers > 1:
+        with ProcessPoolExecutor(n_workers) as pool:
+            reduce(pool.map(load_stats, [f for _, f in replay_files], chunksize=4))
+    else:
+        reduce(map(load_stats, [f for _, f in replay_files]))
+
+    return category_stats
@@ -0,0 +1,251 @@
+"""
+Memory-mapped multi-replay store.
+
+A store consolidates many replays into flat binary frame arrays, one for ball state, one for game state and one
+for player state, next to a JSON index of (replay id, category, start, length, player names, teams) records.
+Opening a store only reads the index; replays are zero-copy `Replay` views of the memory-mapped arrays.
+"""
+import json
+import os
+import uuid
+from concurrent.futures import Executor, ProcessPoolExecutor
+from functools import lru_cache, partial
+from typing import Dict, Iterator, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from .cache import ReplayCache
+from .parsing import _replay_files, load_replay, parse_replay, reward_functions
+from .replay import Replay, _sort_fields, non_players, team_indices
+
+_store_format = 2
+_index_file = "index.json"
+_arrays = ("frames", "ball", "game", "players")
+
+
+def build_store(store_dir: str,
+                folder_paths: Dict[str, Sequence[str]],
+                n_skip=1,
+                cache: Union[None, str, ReplayCache] = None,
+                columns: Union[None, Sequence[Tuple[str, str]]] = None,
+                dtype: Union[str, np.dtype] = "float64",
+                target_hz: Union[None, float] = None) -> "ReplayStore":
+    """
+    Consolidates all replay files of the provided folders into a store
+
+    Ball, game and player fields are taken from the first replay. Fields missing from later replays are stored as
+    NaN, extra fields are dropped.
+
+    :param store_dir: The store directory. Created if it does not exist, an existing store is replaced. Stores
+        already opened keep reading the replaced arrays.
+    :param folder_paths: A dictionary of category names and lists of folders containing replay files
+    :param n_skip: Keep one every `n_skip` frames
+    :param cache: Replay cache or replay cache directory to load replays from. Optional.
+    :param columns: The (entity, field) columns to store, see `load_replay`. All columns are stored if `None`.
+    :param dtype: The data type replay values are stored as
+    :param target_hz: Resample replays to this frame rate instead of keeping one every `n_skip` frames,
+        see `load_replay`. Optional.
+    :return: The opened store
+    """
+    if type(cache) is str:
+        cache = ReplayCache(cache)
+    os.makedirs(store_dir, exist_ok=True)
+    # a store without an index is incomplete and cannot be opened
+    if os.path.exists(os.path.join(store_dir, _index_file)):
+        os.remove(os.path.join(store_dir, _index_file))
+
+    dtype = np.dtype(dtype)
+    # arrays are written next to the live ones and replace them once complete, since truncating files that are
+    # memory-mapped by open stores crashes their readers
+    files = {name: open(os.path.join(store_dir, name + ".bin.tmp"), "wb") for name in _arrays}
+    fields = None
+    records = []
+    n_frames = n_player_rows = 0
+    try:
+        for category, replay_file in _replay_files(folder_paths):
+            df = load_replay(replay_file, cache, columns=columns, n_skip=n_skip, target_hz=target_hz)
+            entities = df.columns.get_level_values(0)
+            player_names = [c for c in df.columns.levels[0] if c not in non_players and c in entities]
+
+            if fields is None:
+                fields = {"ball": _sort_fields(list(df["ball"].columns)),
+                          "game": list(df["game"].columns) if "game" in entities else [],
+                          "player": _sort_fields(list(dict.fromkeys(f for p in player_names
+                                                                    for f in df[p].columns)))}
+
+            ball = df["ball"].reindex(columns=fields["ball"]).values
+            game = df["game"].reindex(columns=fields["game"]).values if "game" in entities \
+                else np.full((df.shape[0], len(fields["game"])), np.nan)
+            players = np.stack([df[p].reindex(columns=fields["player"]).values for p in player_names], 1)
+
+            files["frames"].write(np.ascontiguousarray(df.index.values, dtype=np.int64).tobytes())
+            files["ball"].write(np.ascontiguousarray(ball, dtype=dtype).tobytes())
+            files["game"].write(np.ascontiguousarray(game, dtype=dtype).tobytes())
+            files["players"].write(np.ascontiguousarray(players, dtype=dtype).tobytes())
+
+            records.append({"replay_id": os.path.abspath(replay_file),
+                            "category": category,
+                            "start": n_frames,
+                            "length": df.shape[0],
+                            "player_start": n_player_rows,
+                            "player_names": player_names,
+                            "teams": team_indices(df, player_names).tolist()})
+            n_frames += df.shape[0]
+            n_player_rows += df.shape[0] * len(player_names)
+    finally:
+        for f in files.values():
+            f.close()
+    for name in _arrays:
+        os.replace(os.path.join(store_dir, name + ".bin.tmp"), os.path.join(store_dir, name + ".bin"))
+
+    fields = fields or {"ball": [], "game": [], "player": []}
+    index = {"format": _store_format,
+             "build_id": uuid.uuid4().hex,
+             "dtype": dtype.str,
+             "ball_fields": fields["ball"],
+             "game_fields": fields["game"],
+             "player_fields": fields["player"],
+             "n_frames": n_frames,
+             "n_player_rows": n_player_rows,
+             "replays": records}
+    with open(os.path.join(store_dir, _index_file + ".tmp"), "w") as f:
+        json.dump(index, f)
+    os.replace(os.path.join(store_dir, _index_file + ".tmp"), os.path.join(store_dir, _index_file))
+    return ReplayStore(store_dir)
+
+
+class ReplayStore:
+    """
+    A memory-mapped store of many replays, see `build_store`.
+
+    Replays are addressed by position or replay id, the absolute path of the source replay file, and returned as
+    read-only `Replay` views of the store arrays, without reading or copying frames until they are used.
+    """
+
+    def __init__(self, store_dir: str):
+        """
+        :param store_dir: The store directory
+        """
+        self.store_dir = store_dir
+        with open(os.path.join(store_dir, _index_file)) as f:
+            meta = json.load(f)
+        assert meta["format"] == _store_format, "Unsupported replay store format %s" % meta["format"]
+
+        self.build_id = meta["build_id"]
+        self.dtype = np.dtype(meta["dtype"])
+        self.ball_fields = meta["ball_fields"]
+        self.game_fields = meta["game_fields"]
+        self.player_fields = meta["player_fields"]
+        self.records = meta["replays"]
+        self._positions = {r["replay_id"]: i for i, r in enumerate(self.records)}
+
+        shapes = {"frames": (meta["n_frames"],),
+                  "ball": (meta["n_frames"], len(self.ball_fields)),
+                  "game": (meta["n_frames"], len(self.game_fields)),
+                  "players": (meta["n_player_rows"], len(self.player_fields))}
+        self.frames, self.ball, self.game, self.players = (
+            self._memmap(name, np.int64 if name == "frames" else self.dtype, shapes[name]) for name in _arrays)
+
+    def _memmap(self, name, dtype, shape):
+        if 0 in shape:
+            # empty files cannot be memory-mapped
+            return np.empty(shape, dtype)
+        return np.memmap(os.path.join(self.store_dir, name + ".bin"), dtype=dtype, mode="r", shape=shape)
+
+    def __len__(self):
+        return len(self.records)
+
+    @property
+    def index(self) -> pd.DataFrame:
+        """
+        The store index, one row per replay
+        """
+        return pd.DataFrame(self.records, columns=["replay_id", "category", "start", "length", "player_start",
+                                                   "player_names", "teams"])
+
+    def replay(self, replay: Union[int, str]) -> Replay:
+        """
+        :param replay: The replay position in the store or the replay id
+        :return: A read-only `Replay` view of the store arrays. Slice it for frame ranges, e.g. `replay[100:200]`.
+        """
+        record = self.records[self._positions[replay] if type(replay) is str else replay]
+        start, length = record["start"], record["length"]
+        n_players = len(record["player_names"])
+        player_start = record["player_start"]
+
+        players = self.players[player_start:player_start + length * n_players]
+        return Replay(self.ball[start:start + length],
+                      self.ball_fields,
+                      players.reshape(length, n_players, len(self.player_fields)),
+                      self.player_fields,
+                      record["player_names"],
+                      np.array(record["teams"]),
+                      self.frames[start:start + length],
+                      self.game[start:start + length],
+                      self.game_fields)
+
+    def iter_replays(self, category: Union[None, str] = None) -> Iterator[Tuple[dict, Replay]]:
+        """
+        :param category: Only replays of this category are returned if provided
+        :return: A generator of index records and replays, in store order
+        """
+        for i, record in enumerate(self.records):
+            if category is None or record["category"] == category:
+                yield record, self.replay(i)
+
+
+@lru_cache(maxsize=8)
+def _open_store(store_dir: str, build_id: str) -> ReplayStore:
+    # workers open every build of a store once
+    store = ReplayStore(store_dir)
+    assert store.build_id == build_id, "The replay store %s was rebuilt while being parsed" % store_dir
+    return store
+
+
+def _parse_stored(position: int, store: Union[ReplayStore, Tuple[str, str]], reward_names_fns, n_skip: int):
+    store = store if isinstance(store, ReplayStore) else _open_store(*store)
+    replay = store.replay(position)[::n_skip]
+    reward_values_df = parse_replay(replay, reward_names_fns=reward_names_fns)
+    return reward_values_df.values, reward_values_df.columns.tolist(), reward_values_df.index.values
+
+
+def parse_store(store: Union[str, ReplayStore],
+                reward_names_args: Sequence[Union[str, Tuple[str, dict]]],
+                n_skip=1,
+                categories: Union[None, Sequence[str]] = None,
+                n_workers: int = 1,
+                executor: Union[None, Executor] = None) -> Dict[str, list]:
+    """
+    Parses all replays of a store, see `parse_replays`
+
+    :param store: A store or store directory
+    :param reward_names_args: A list of reward names or 2-tuples of reward names and reward keyword arguments
+    :param n_skip: Keep one every `n_skip` frames
+    :param categories: Categories to parse. All categories are parsed if `None`.
+    :param n_workers: Number of worker processes replays are parsed with. Replays are parsed in the current process
+        if 1.
+    :param executor: An executor replays are parsed with. If provided, `n_workers` is ignored.
+    :return: A dictionary of category names and lists of reward data frames, in store order
+    """
+    store = ReplayStore(store) if type(store) is str else store
+    reward_names_fns = reward_functions(reward_names_args)
+
+    positions = [i for i, r in enumerate(store.records) if categories is None or r["category"] in categories]
+    # workers reopen the store by directory and build, the current process parses the opened store
+    parse_stored = partial(_parse_stored, store=(store.store_dir, store.build_id), reward_names_fns=reward_names_fns,
+                           n_skip=n_skip)
+
+    if executor is not None:
+        results = executor.map(parse_stored, positions)
+    elif n_workers > 1:
+        with ProcessPoolExecutor(n_workers) as pool:
+            results = list(pool.map(parse_stored, positions, chunksize=4))
+    else:
+        results = map(partial(parse_stored, store=store), positions)
+
+    reward_values_dfs = {category: [] for category in dict.fromkeys(store.records[i]["category"] for i in positions)}
+    for i, (values, columns, index) in zip(positions, results):
+        reward_values_dfs[store.records[i]["category"]].append(
+            pd.DataFrame(values, index=index, columns=pd.MultiIndex.from_tuples(columns)))
+    return reward_values_dfs
@@ -0,0 +1,144 @@
+"""
+Reward hyperparameter sweeps.
+
+Numeric reward parameters are passed to the reward functions as arrays of shape (n_params, 1, 1), which broadcast
+against the (n_frames, n_players) replay features. Every parameter combination is thus computed in a single
+vectorized reward call, over geometric features computed once per replay.
+"""
+import itertools
+from concurrent.futures import Executor, ProcessPoolExecutor
+from functools import partial
+from numbers import Number
+from typing import Callable, Dict, List, Sequence, Union
+
+import numpy as np
+import pandas as pd
+
+from ..utils.reward_graph import freeze
+from .cache import ReplayCache
+from .parsing import _replay_files, load_replay
+from .replay import Replay
+from .reward_functions import rewards_columns, rewards_names_map
+
+
+def param_grid(params: Union[Dict[str, Sequence], Sequence[dict]]) -> List[dict]:
+    """
+    :param params: A dictionary of parameter names and parameter values, or a list of parameter dictionaries
+    :return: A list of parameter dictionaries, the cartesian product of parameter values if a dictionary is provided
+    """
+    if isinstance(params, dict):
+        names = list(params)
+        return [dict(zip(names, values)) for values in itertools.product(*params.values())]
+    return [dict(p) for p in params]
+
+
+def _broadcastable(value):
+    return isinstance(value, Number) and not isinstance(value, bool)
+
+
+def sweep_replay(df: Union[pd.DataFrame, Replay],
+                 reward: Union[str, Callable[..., np.ndarray]],
+                 params: Union[Dict[str, Sequence], Sequence[dict]],
+                 team_idcs: Union[None, np.ndarray] = None,
+                 max_batch: Union[None, int] = None,
+                 **reward_kwargs) -> np.ndarray:
+    """
+    Computes a reward for all players of a replay for every parameter combination
+
+    Numeric parameters are broadcast, hence reward functions must only combine them with array operations.
+    Combinations of non-numeric parameters, e.g. booleans or lists of event weights, are evaluated by separate reward
+    calls.
+
+    :param df: A replay data frame or a `Replay`
+    :param reward: A reward name or a reward function taking a `Replay`
+    :param params: A dictionary of parameter names and parameter values, swept over their cartesian product,
+        or a list of parameter dictionaries
+    :param team_idcs: Team indices of the players. Determined from the first replay frame if `None`.
+    :param max_batch: Maximum number of parameter combinations per reward call, bounding the memory of
+        reward intermediates. All combinations are computed at once if `None`.
+    :param reward_kwargs: Reward keyword arguments shared by all parameter combinations
+    :return: Rewards of shape (n_params, n_frames, n_players), in `param_grid(params)` order
+    """
+    replay = df if isinstance(df, Replay) else Replay.from_dataframe(df, team_idcs)
+    fn = rewards_names_map[reward] if type(reward) is str else reward
+    grid = param_grid(params)
+
+    names = list(grid[0]) if grid else []
+    broadcast = [n for n in names if all(_broadcastable(p[n]) for p in grid)]
+    static = [n for n in names if n not in broadcast]
+
+    # combinations sharing non-numeric parameters are computed together, lists and arrays compared by value
+    groups = {}
+    for i, p in enumerate(grid):
+        groups.setdefault(tuple(freeze(p[n]) for n in static), ([p[n] for n in static], []))[1].append(i)
+
+    rewards = np.empty((len(grid), replay.n_frames, replay.n_players))
+    for static_values, idcs in groups.values():
+        batch = len(idcs) if max_batch is None else max_batch
+        for start in range(0, len(idcs), batch):
+            block = idcs[start:start + batch]
+            kwargs = {n: np.array([grid[i][n] for i in block], dtype=float)[:, None, None] for n in broadcast}
+            kwargs.update(zip(static, static_values))
+            # parameter independent rewards broadcast to every combination
+            rewards[block] = fn(replay, **reward_kwargs, **kwargs)
+    return rewards
+
+
+def _load_sweep(replay_file: str, n_skip: int, cache: Union[None, ReplayCache], dtype, target_hz, **kwargs):
+    columns = rewards_columns([kwargs["reward"]]) if type(kwargs["reward"]) is str else None
+    df = load_replay(replay_file, cache, columns=columns, dtype=dtype, n_skip=n_skip, target_hz=target_hz)
+    return sweep_replay(df, **kwargs)
+
+
+def sweep_replays(folder_paths: Dict[str, Sequence[str]],
+                  reward: Union[str, Callable[..., np.ndarray]],
+                  params: Union[Dict[str, Sequence], Sequence[dict]],
+                  n_skip=9,
+                  cache: Union[None, str, ReplayCache] = None,
+                  n_workers: int = 1,
+                  executor: Union[None, Executor] = None,
+                  max_batch: Union[None, int] = None,
+                  dtype: Union[None, str, np.dtype] = None,
+                  target_hz: Union[None, float] = None,
+                  **reward_kwargs):
+    """
+    Computes a reward for all replay files of the provided folders for every parameter combination
+
+    :param folder_paths: A dictionary of category names and lists of folders containing replay files
+    :param reward: A reward name or a picklable reward function taking a `Replay`
+    :param params: A dictionary of parameter names and parameter values, swept over their cartesian product,
+        or a list of parameter dictionaries
+    :param n_skip: Keep one every `n_skip` frames
+    :param cache: Replay cache or replay cache directory to load replays from. Optional.
+    :param n_workers: Number of worker processes replays are loaded and swept with.
+        Replays are swept in the current process if 1.
+    :param executor: An executor replays are loaded and swept with. If provided, `n_workers` is ignored.
+    :param max_batch: Maximum number of parameter combinations per reward call, see `sweep_replay`
+    :param dtype: The data type replay values are loaded as, e.g. `"float32"`. Defaults to `float64`.
+    :param target_hz: Resample replays to this frame rate instead of keeping one every `n_skip` frames,
+        see `load_replay`. Optional.
+    :param reward_kwargs: Reward keyword arguments shared by all parameter combinations
+    :return: A data frame of parameter combinations, one row per combination, and a dictionary of category names
+        and lists of reward arrays of shape (n_params, n_frames, n_players), in sorted file name order
+    """
+    if type(cache) is str:
+        cache = ReplayCache(cache)
+
+    grid = param_grid(params)
+    replay_files = _replay_files(folder_paths)
+    load_sweep = partial(_load_sweep, n_skip=n_skip, cache=cache, dtype=dtype, target_hz=target_hz, reward=reward,
+                         params=grid, max_batch=max_batch, **reward_kwargs)
+
+    if executor is not None:
+        results = executor.map(load_sweep, [f for _, f in replay_files])
+    elif n_workers > 1:
+        with ProcessPoolExecutor(n_workers) as pool:
+            results = list(pool.map(load_sweep, [f for _, f in replay_files], chunksize=4))
+    else:
+        results = map(load_sweep, [f for _, f in replay_files])
+
+    reward_values = {category: [] for category in folder_paths}
+    for (category, _), rewards in zip(replay_files, results):
+        reward_values[category].append(rewards)
+
+    return pd.DataFrame(grid), reward_values
@@ -0,0 +1,221 @@
+"""
+Headless replay animation of reward fields on the arena.
+
+The figure, arena, goals and colorbar are drawn once. Every frame restores the static background and redraws
+only the reward field, boost pads, ball, players and velocity quivers, so rendering thousands of frames does not
+rebuild the figure.
+"""
+import os
+import subprocess
+from typing import Callable, Iterator, Sequence, Tuple, Union
+
+import numpy as np
+
+from .arena import arena_geometry
+from .plotting import _draw_boost_pads, _draw_goals
+
+_video_extensions = (".mp4", ".mkv", ".mov", ".avi", ".webm", ".gif")
+
+
+def _frame_field(z: Union[np.ndarray, Callable[[int], np.ndarray]], frame: int) -> np.ndarray:
+    return z(frame) if callable(z) else z[frame]
+
+
+def iter_replay_frames(z: Union[np.ndarray, Callable[[int], np.ndarray]],
+                       n_frames: Union[None, int] = None,
+                       ball_positions: np.ndarray = None,
+                       ball_lin_vels: np.ndarray = None,
+                       player_positions: np.ndarray = None,
+                       player_lin_vels: np.ndarray = None,
+                       team_idcs: np.ndarray = None,
+                       labels: Sequence[str] = None,
+                       vmin: Union[None, float] = None,
+                       vmax: Union[None, float] = None,
+                       goal_w: Union[int, float] = 1,
+                       figsize: Union[int, Tuple[int, int]] = (12, 15),
+                       dpi=80,
+                       ball_size=128,
+                       player_size=128,
+                       boost_pad_size=80,
+                       contour_levels=80,
+                       velocity_scale=0.5) -> Iterator[np.ndarray]:
+    """
+    Renders a reward field animation frame by frame, reusing a single headless figure
+
+    :param z: Reward values for each point of the arena for each frame. Either a numpy array of shape
+        (n_frames, n_arena_positions), or a function of the frame index returning an array of shape
+        (n_arena_positions,), which avoids holding the whole field sequence in memory.
+    :param n_frames: Number of frames. Defaults to the length of `z` if `z` is an array.
+    :param ball_positions: Ball positions, numpy array of shape (n_frames, 3), optional
+    :param ball_lin_vels: Ball linear velocities, numpy array of shape (n_frames, 3), optional
+    :param player_positions: Player positions, numpy array of shape (n_frames, n_players, 3), optional
+    :param player_lin_vels: Player linear velocities, shapes similar to `player_positions`. Optional.
+    :param team_idcs: Team indices of the players, blue (0) or orange (1). All players are blue if `None`.
+    :param labels: Frame labels, e.g. game times, optional
+    :param vmin: Lower bound of the colormap. Defaults to the minimum of `z` if `z` is an array,
+        otherwise to the minimum of the first frame.
+    :param vmax: Upper bound of the colormap, similar to `vmin`
+    :param goal_w: Goal reward, used for annotation only
+    :param figsize: The size of the figure. Can be either integer for a square plot or 2-tuple.
+    :param dpi: Figure resolution in dots per inch
+    :param ball_size: The ball marker size
+    :param player_size: The player marker size
+    :param boost_pad_size: The boost pad marker size
+    :param contour_levels: Number of reward field color levels, `None` for a continuous colormap
+    :param velocity_scale: Velocity quivers show the displacement over this many seconds
+    :return: A generator of RGBA frames of shape (height, width, 4). Frames are views of the figure buffer,
+        which is overwritten by the next frame, copy them if they must be kept.
+    """
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.colors import BoundaryNorm, Normalize
+    from matplotlib.figure import Figure
+
+    if n_frames is None:
+        if callable(z):
+            raise ValueError("n_frames is required when z is a function")
+        n_frames = len(z)
+    if vmin is None or vmax is None:
+        z_range = z if not callable(z) else z(0)
+        vmin = np.nanmin(z_range) if vmin is None else vmin
+        vmax = np.nanmax(z_range) if vmax is None else vmax
+    if vmin == vmax:
+        # constant reward field
+        vmin, vmax = vmin - 0.5, vmax + 0.5
+    if type(figsize) == int:
+        figsize = (figsize, figsize)
+
+    arena = arena_geometry()
+    fig = Figure(figsize=figsize, dpi=dpi)
+    canvas = FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+
+    # --- Static background ---
+
+    norm = Normalize(vmin, vmax) if contour_levels is None \
+        else BoundaryNorm(np.linspace(vmin, vmax, contour_levels + 1), 256)
+    field = ax.tripcolor(arena.triangulation, _frame_field(z, 0), shading="gouraud", norm=norm, animated=True)
+    _draw_goals(ax, goal_w)
+    # keep the arena limits, markers leaving the arena are clipped
+    ax.autoscale(False)
+    # Arena x axis is positive on the left-hand side, looking toward the orange goal
+    ax.invert_xaxis()
+    fig.colorbar(field, ax=ax)
+
+    # --- Dynamic artists, redrawn every frame in this order ---
+
+    dynamic = [field, *_draw_boost_pads(ax, boost_pad_size)]
+    quiver_kwargs = dict(angles="xy", scale_units="xy", scale=1 / velocity_scale,
+                         headwidth=2.5, headlength=3, headaxislength=3)
+
+    ball_plot = ball_quiver = None
+    if ball_positions is not None:
+        ball_plot = ax.scatter(*ball_positions[0, :2], c="red", marker="o", s=ball_size, label="Ball")
+        dynamic.append(ball_plot)
+        if ball_lin_vels is not None:
+            ball_quiver = ax.quiver(*ball_positions[0, :2], *ball_lin_vels[0, :2], color="r", **quiver_kwargs)
+            dynamic.append(ball_quiver)
+
+    teams = []
+    if player_positions is not None:
+        team_idcs = np.zeros(player_positions.shape[1], dtype=int) if team_idcs is None else np.asarray(team_idcs)
+        for team, color, label in ((0, "deepskyblue", "Blue team"), (1, "orangered", "Orange team")):
+            idcs = np.flatnonzero(team_idcs == team)
+            if len(idcs) == 0:
+                continue
+            team_plot = ax.scatter(*player_positions[0, idcs, :2].T, c=color, marker="D", s=player_size, label=label)
+            team_quiver = None
+            if player_lin_vels is not None:
+                team_quiver = ax.quiver(*player_positions[0, idcs, :2].T, *player_lin_vels[0, idcs, :2].T,
+                                        color=color, **quiver_kwargs)
+                dynamic.append(team_quiver)
+            dynamic.append(team_plot)
+            teams.append((idcs, team_plot, team_quiver))
+
+    dynamic.append(ax.legend(loc="upper right"))
+    label_text = ax.text(0.02, 0.98, "", transform=ax.transAxes, ha="left", va="top", fontsize=14)
+    dynamic.append(label_text)
+    for artist in dynamic:
+        artist.set_animated(True)
+
+    canvas.draw()
+    background = canvas.copy_from_bbox(fig.bbox)
+    buffer = np.asarray(canvas.buffer_rgba())
+
+    # --- Frames ---
+
+    for t in range(n_frames):
+        canvas.restore_region(background)
+
+        field.set_array(_frame_field(z, t))
+        if ball_plot is not None:
+            ball_plot.set_offsets(ball_positions[t, None, :2])
+            if ball_quiver is not None:
+                ball_quiver.set_offsets(ball_positions[t, None, :2])
+                ball_quiver.set_UVC(*ball_lin_vels[t, :2])
+        for idcs, team_plot, team_quiver in teams:
+            team_plot.set_offsets(player_positions[t, idcs, :2])
+            if team_quiver is not None:
+                team_quiver.set_offsets(player_positions[t, idcs, :2])
+                team_quiver.set_UVC(*player_lin_vels[t, idcs, :2].T)
+        if labels is not None:
+            label_text.set_text(labels[t])
+
+        for artist in dynamic:
+            ax.draw_artist(artist)
+        yield buffer
+
+
+def render_replay(output: str,
+                  z: Union[np.ndarray, Callable[[int], np.ndarray]],
+                  fps: Union[int, float] = 30,
+                  ffmpeg_args: Sequence[str] = ("-pix_fmt", "yuv420p"),
+                  **kwargs) -> int:
+    """
+    Renders a reward field animation to a video file or an image sequence, without opening a window
+
+    :param output: Output path. Paths containing a `%` format, e.g. `frames/frame_%05d.png`, produce an image
+        sequence. Other paths, e.g. `replay.mp4`, produce a video encoded by ffmpeg, which must be installed.
+    :param z: Reward values for each point of the arena for each frame, see `iter_replay_frames`
+    :param fps: Video frames per second
+    :param ffmpeg_args: Additional ffmpeg output arguments
+    :param kwargs: `iter_replay_frames` keyword arguments
+    :return: The number of rendered frames
+    """
+    frames = iter_replay_frames(z, **kwargs)
+    n_rendered = 0
+
+    if "%" in output:
+        from PIL import Image
+
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        for t, frame in enumerate(frames):
+            # fast PNG compression, encoding dominates the frame time otherwise
+            Image.fromarray(frame).save(output % t, compress_level=1)
+            n_rendered += 1
+        return n_rendered
+
+    if not output.lower().endswith(_video_extensions):
+        raise ValueError("Unsupported video format %s, expected one of %s or an image sequence format"
+                         % (output, ", ".join(_video_extensions)))
+
+    import matplotlib
+
+    first = next(frames)
+    height, width = first.shape[:2]
+    command = [matplotlib.rcParams["animation.ffmpeg_path"], "-y", "-loglevel", "error",
+               "-f", "rawvideo", "-pix_fmt", "rgba", "-s", "%dx%d" % (width, height), "-r", str(fps), "-i", "-",
+               # yuv420p requires even frame dimensions
+               "-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2",
+               *([] if output.lower().endswith(".gif") else ffmpeg_args), output]
+    with subprocess.Popen(command, stdin=subprocess.PIPE) as process:
+        try:
+            process.stdin.write(first)
+            n_rendered += 1
+            for frame in frames:
+                process.stdin.write(frame)
+                n_rendered += 1
+        finally:
+            process.stdin.close()
+    if process.returncode:
+        raise RuntimeError("ffmpeg exited with code %d" % process.returncode)
+    return n_rendered
@@ -0,0 +1,164 @@
+"""
+Lazily built, disk-cached arena geometry.
+
+The refined arena triangulation is built on first use and its vertices and triangles are cached on disk as plain
+arrays, so later processes load them without refining the triangulation. Lookup structures are rebuilt from the
+cached vertices, which takes milliseconds. Matplotlib is only imported when the
+triangulation object itself is needed, i.e. when plotting.
+"""
+import os
+from functools import cached_property, lru_cache
+from typing import Union
+
+import numpy as np
+
+from rlgym_reward_analysis import _common_values
+
+_cache_format = 1
+_default_subdiv = int(os.environ.get("RLGYM_REWARD_ANALYSIS_ARENA_SUBDIV", 6))
+
+# We use a height dimension of 300 for the plots
+ARENA_HEIGHT = 300
+
+
+def cache_dir() -> str:
+    """
+    :return: The arena geometry cache directory, `RLGYM_REWARD_ANALYSIS_CACHE_DIR` if set
+    """
+    return os.environ.get("RLGYM_REWARD_ANALYSIS_CACHE_DIR",
+                          os.path.join(os.path.expanduser("~"), ".cache", "rlgym_reward_analysis"))
+
+
+def make_arena_(refiner_sub_div=6):
+    from matplotlib import tri
+
+    corner_offset = 1152
+    right_corner0 = np.array([[- _common_values.SIDE_WALL_X + corner_offset, - _common_values.BACK_WALL_Y],
+                              [- _common_values.SIDE_WALL_X, - _common_values.BACK_WALL_Y + corner_offset]])
+    left_corner0 = np.array([[_common_values.SIDE_WALL_X - corner_offset, - _common_values.BACK_WALL_Y],
+                             [_common_values.SIDE_WALL_X, - _common_values.BACK_WALL_Y + corner_offset]])
+    right_corner1 = np.array([[- _common_values.SIDE_WALL_X + corner_offset, _common_values.BACK_WALL_Y],
+                              [- _common_values.SIDE_WALL_X, _common_values.BACK_WALL_Y - corner_offset]])
+    left_corner1 = np.array([[_common_values.SIDE_WALL_X - corner_offset, _common_values.BACK_WALL_Y],
+                             [_common_values.SIDE_WALL_X, _common_values.BACK_WALL_Y - corner_offset]])
+
+    x = np.array([right_corner0[:, 0], left_corner0[:, 0], right_corner1[:, 0], left_corner1[:, 0]]).flatten()
+    y = np.array([right_corner0[:, 1], left_corner0[:, 1], right_corner1[:, 1], left_corner1[:, 1]]).flatten()
+
+    triang = tri.Triangulation(x, y)
+    refiner = tri.UniformTriRefiner(triang)
+    return refiner.refine_triangulation(subdiv=refiner_sub_div)
+
+
+def make_goal_(orange=False):
+    from matplotlib import tri
+
+    goal_radius = 893
+
+    goal = np.array([[- goal_radius, - _common_values.BACK_WALL_Y],
+                     [- goal_radius, - _common_values.BACK_NET_Y],
+                     [goal_radius, - _common_values.BACK_WALL_Y],
+                     [goal_radius, - _common_values.BACK_NET_Y]])
+    if orange:
+        goal[:, 1] *= -1
+
+    x = goal[:, 0].flatten()
+    y = goal[:, 1].flatten()
+
+    return tri.Triangulation(x, y)
+
+
+class ArenaGeometry:
+    """
+    Refined arena triangulation vertices and triangles, with lazily built plotting and lookup structures
+    """
+
+    def __init__(self, x: np.ndarray, y: np.ndarray, triangles: np.ndarray, subdiv: int):
+        self.x = x
+        self.y = y
+        self.triangles = triangles
+        self.subdiv = subdiv
+
+    @cached_property
+    def positions(self) -> np.ndarray:
+        """
+        Arena vertex positions at the plot height, shape (n_vertices, 3)
+        """
+        positions = np.stack([self.x, self.y, np.full_like(self.x, ARENA_HEIGHT)], -1)
+        positions.setflags(write=False)
+        return positions
+
+    @cached_property
+    def triangulation(self):
+        """
+        The matplotlib arena triangulation
+        """
+        from matplotlib import tri
+        return tri.Triangulation(self.x, self.y, self.triangles)
+
+    @cached_property
+    def lookup(self):
+        """
+        Triangle lookup of arbitrary positions, see `sampling.TriangleLookup`
+        """
+        from .sampling import TriangleLookup
+        return TriangleLookup(self.x, self.y, self.triangles)
+
+    @cached_property
+    def trifinder(self):
+        """
+        Matplotlib triangle finder of the arena triangulation, backed by `lookup`
+        """
+        from .sampling import lookup_trifinder
+        return lookup_trifinder(self)
+
+    @cached_property
+    def kdtree(self):
+        """
+        Nearest arena vertex lookup index
+        """
+        from scipy.spatial import KDTree
+        return KDTree(self.positions)
+
+
+def _write_atomic(path, write):
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".%d.tmp" % os.getpid(), "wb") as f:
+            write(f)
+        os.replace(path + ".%d.tmp" % os.getpid(), path)
+    except OSError:
+        # the cache is an optimization, an unwritable cache directory only costs rebuilding
+        pass
+
+
+def set_arena_refinement(subdiv: int):
+    """
+    Sets the default arena refinement level, 6 unless set by the `RLGYM_REWARD_ANALYSIS_ARENA_SUBDIV`
+    environment variable. Must be called before the default arena is first used.
+    """
+    global _default_subdiv
+    _default_subdiv = subdiv
+
+
+@lru_cache(maxsize=None)
+def _arena_geometry(subdiv: int) -> ArenaGeometry:
+    path = os.path.join(cache_dir(), "arena_v%d_subdiv%d.npz" % (_cache_format, subdiv))
+    try:
+        with np.load(path) as cached:
+            return ArenaGeometry(cached["x"], cached["y"], cached["triangles"], subdiv)
+    except (OSError, KeyError, ValueError):
+        pass
+
+    triang = make_arena_(subdiv)
+    geometry = ArenaGeometry(triang.x, triang.y, triang.triangles, subdiv)
+    _write_atomic(path, lambda f: np.savez(f, x=geometry.x, y=geometry.y, triangles=geometry.triangles))
+    return geometry
+
+
+def arena_geometry(subdiv: Union[None, int] = None) -> ArenaGeometry:
+    """
+    :param subdiv: Arena triangulation refinement level. Defaults to the level set by `set_arena_refinement`.
+    :return: The arena geometry, built on first use or loaded from the disk cache
+    """
+    return _arena_geometry(_default_subdiv if subdiv is None else subdiv)
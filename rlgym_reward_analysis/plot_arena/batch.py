@@ -0,0 +1,206 @@
+"""
+Parallel headless rendering of reward contour plots.
+
+Every job evaluates a reward function over the arena positions for a scene, i.e. ball and player placements,
+and renders its contour plot to a file on a non-interactive figure.
+"""
+import inspect
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor
+from functools import partial
+from typing import Callable, Sequence, Tuple, Union
+
+import numpy as np
+
+from .arena import arena_geometry
+from .plotting import draw_arena_contour
+from .reward_functions import rewards_names_map
+
+_contour_args = tuple(inspect.signature(draw_arena_contour).parameters)[2:]
+
+
+def _player_value(values: Union[np.ndarray, Tuple[np.ndarray, np.ndarray]], player_idx: int) -> np.ndarray:
+    if type(values) == tuple:
+        values = np.concatenate(values)
+    return values[player_idx]
+
+
+class RenderJob:
+    """
+    A reward contour plot to render
+    """
+
+    def __init__(self,
+                 reward: Union[str, Callable],
+                 params: Union[None, dict] = None,
+                 scene: Union[None, dict] = None,
+                 arena_arg: Union[None, str] = None,
+                 title: Union[None, str] = None):
+        """
+        :param reward: A reward name of `plot_arena.reward_functions.rewards_names_map` or a reward function.
+            Reward functions must be picklable, e.g. module level functions, to be rendered in worker processes.
+        :param params: Reward keyword arguments, e.g. `{"dispersion": 0.8, "density": 2}`. Optional.
+        :param scene: `draw_arena_contour` keyword arguments, e.g. `ball_position`, `player_positions` and
+            `player_idx`. Reward arguments not in `params` are taken from the scene by name, with `ball_lin_velocity`
+            taken from `ball_lin_vel` and `player_position` and `player_lin_velocity` taken from the annotated
+            player of `player_positions` and `player_lin_vels`. Optional.
+        :param arena_arg: The reward argument evaluated over the arena positions. Defaults to the first reward
+            argument, e.g. `ball_position` for ball to goal rewards and `player_position` for player to ball rewards.
+        :param title: The plot title. Defaults to the reward name and parameters.
+        """
+        self.reward = reward
+        self.params = dict(params or {})
+        self.scene = dict(scene or {})
+        self.reward_fn = rewards_names_map[reward] if type(reward) == str else reward
+        reward_args = list(inspect.signature(self.reward_fn).parameters)
+        self.arena_arg = reward_args[0] if arena_arg is None else arena_arg
+        if title is None:
+            name = reward if type(reward) == str else getattr(reward, "__name__", repr(reward))
+            title = "%s(%s)" % (name, ", ".join("%s=%s" % (k, v) for k, v in self.params.items()))
+        self.title = title
+
+    def reward_kwargs(self, positions: np.ndarray) -> dict:
+        """
+        :param positions: Arena positions, numpy array of shape (n_positions, 3)
+        :return: The reward keyword arguments for the arena positions
+        """
+        scene = self.scene
+        player_idx = scene.get("player_idx", 0)
+        kwargs = {}
+        for arg in inspect.signature(self.reward_fn).parameters:
+            if arg == self.arena_arg:
+                kwargs[arg] = positions
+            elif arg in self.params:
+                kwargs[arg] = self.params[arg]
+            elif arg in scene:
+                kwargs[arg] = scene[arg]
+            elif arg == "ball_lin_velocity" and scene.get("ball_lin_vel") is not None:
+                kwargs[arg] = scene["ball_lin_vel"]
+            elif arg == "player_position" and scene.get("player_positions") is not None and player_idx is not None:
+                kwargs[arg] = _player_value(scene["player_positions"], player_idx)
+            elif arg == "player_lin_velocity" and scene.get("player_lin_vels") is not None \
+                    and player_idx is not None:
+                kwargs[arg] = _player_value(scene["player_lin_vels"], player_idx)
+        return kwargs
+
+    def evaluate(self, positions: Union[None, np.ndarray] = None) -> np.ndarray:
+        """
+        :param positions: Arena positions, defaults to the arena geometry positions
+        :return: Reward values for each arena position
+        """
+        positions = arena_geometry().positions if positions is None else positions
+        return self.reward_fn(**self.reward_kwargs(positions))
+
+
+def render_job(job: RenderJob,
+               path: str,
+               figsize: Union[int, Tuple[int, int]] = (12, 15),
+               dpi=80,
+               contour_kwargs: Union[None, dict] = None) -> str:
+    """
+    Renders a single job to an image file without pyplot
+
+    :param job: The render job
+    :param path: The image file path, the format is inferred from the extension
+    :param figsize: The size of the figure. Can be either integer for a square plot or 2-tuple.
+    :param dpi: Figure resolution in dots per inch
+    :param contour_kwargs: `draw_arena_contour` keyword arguments shared by all jobs, overridden by the job scene.
+        Optional.
+    :return: The image file path
+    """
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    if type(figsize) == int:
+        figsize = (figsize, figsize)
+    fig = Figure(figsize=figsize, dpi=dpi)
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+
+    kwargs = dict(contour_kwargs or {})
+    kwargs.update((k, v) for k, v in job.scene.items() if k in _contour_args)
+    draw_arena_contour(ax, job.evaluate(), **kwargs)
+    ax.set_title(job.title)
+    fig.savefig(path)
+    return path
+
+
+def _render_indexed(idx_job, output_dir, fmt, **kwargs):
+    idx, job = idx_job
+    name = job.reward if type(job.reward) == str else getattr(job.reward, "__name__", "reward")
+    return render_job(job, os.path.join(output_dir, "%04d_%s.%s" % (idx, name, fmt)), **kwargs)
+
+
+def render_batch(jobs: Sequence[Union[RenderJob, tuple]],
+                 output_dir: str,
+                 n_workers: int = 1,
+                 executor: Union[None, Executor] = None,
+                 fmt: str = "png",
+                 figsize: Union[int, Tuple[int, int]] = (12, 15),
+                 dpi=80,
+                 **contour_kwargs):
+    """
+    Renders reward contour plots to image files, in parallel worker processes if requested
+
+    :param jobs: Render jobs, or tuples of `RenderJob` arguments, e.g. `(reward, params, scene)`
+    :param output_dir: The image directory. Images are named after the job index and reward name.
+    :param n_workers: Number of worker processes jobs are rendered with. Jobs are rendered in the current process
+        if 1.
+    :param executor: An executor jobs are rendered with, e.g. a `ProcessPoolExecutor`.
+        If provided, `n_workers` is ignored.
+    :param fmt: Image format, e.g. `"png"`, `"jpg"` or `"svg"`
+    :param figsize: The size of each figure. Can be either integer for a square plot or 2-tuple.
+    :param dpi: Figure resolution in dots per inch
+    :param contour_kwargs: `draw_arena_contour` keyword arguments shared by all jobs, e.g. `contour_levels`
+    :return: A list of image file paths, in job order
+    """
+    jobs = [job if isinstance(job, RenderJob) else RenderJob(*job) for job in jobs]
+    os.makedirs(output_dir, exist_ok=True)
+    # build the geometry cache once, so that workers only load it
+    arena_geometry()
+
+    render = partial(_render_indexed, output_dir=output_dir, fmt=fmt, figsize=figsize, dpi=dpi,
+                     contour_kwargs=contour_kwargs)
+    if executor is not None:
+        return list(executor.map(render, enumerate(jobs)))
+    if n_workers > 1:
+        with ProcessPoolExecutor(n_workers) as pool:
+            return list(pool.map(render, enumerate(jobs)))
+    return list(map(render, enumerate(jobs)))
+
+
+def contact_sheet(paths: Sequence[str],
+                  output: str,
+                  n_cols: int = 4,
+                  thumbnail_width: Union[None, int] = None,
+                  background="white") -> str:
+    """
+    Tiles images into a single contact sheet image
+
+    :param paths: Image file paths, tiled row by row
+    :param output: The contact sheet image path
+    :param n_cols: Number of images per row
+    :param thumbnail_width: Width images are downscaled to, keeping their aspect ratio. Optional.
+    :param background: Background color of empty cells
+    :return: The contact sheet image path
+    """
+    from PIL import Image
+
+    images = []
+    for path in paths:
+        image = Image.open(path).convert("RGB")
+        if thumbnail_width is not None and image.width != thumbnail_width:
+            image = image.resize((thumbnail_width, round(image.height * thumbnail_width / image.width)),
+                                 Image.LANCZOS)
+        images.append(image)
+
+    cell_w = max(image.width for image in images)
+    cell_h = max(image.height for image in images)
+    n_cols = min(n_cols, len(images))
+    n_rows = -(-len(images) // n_cols)
+
+    sheet = Image.new("RGB", (n_cols * cell_w, n_rows * cell_h), background)
+    for i, image in enumerate(images):
+        sheet.paste(image, ((i % n_cols) * cell_w, (i // n_cols) * cell_h))
+    sheet.save(output)
+    return output
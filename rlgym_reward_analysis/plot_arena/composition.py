@@ -0,0 +1,44 @@
+"""
+Composite rewards evaluated over arena positions as reward expression graphs, see `utils.reward_graph`.
+"""
+import inspect
+from typing import Dict, Union
+
+import numpy as np
+
+from ..utils.reward_graph import Expr, RewardGraph
+from .reward_functions import rewards_names_map
+
+
+def compile_rewards(reward_names_exprs: Dict[str, Union[str, Expr]], expand_composites=True) -> RewardGraph:
+    """
+    :param reward_names_exprs: A dictionary of reward names and reward expressions or `rewards_names_map` names,
+        e.g. `{"potential": reward("offensive_potential") + 0.5 * reward("face_ball")}`
+    :param expand_composites: Whether composite rewards are expanded into their shared sub-rewards
+    :return: The compiled reward graph, reusable across scenes
+    """
+    return RewardGraph(reward_names_exprs, rewards_names_map, expand_composites)
+
+
+def evaluate_rewards(reward_names_exprs: Union[RewardGraph, Dict[str, Union[str, Expr]]],
+                     team_idcs: Union[None, np.ndarray] = None,
+                     **inputs) -> Dict[str, np.ndarray]:
+    """
+    Evaluates reward expressions, evaluating shared sub-expressions once
+
+    :param reward_names_exprs: A compiled reward graph or a dictionary of reward names and reward expressions,
+        see `compile_rewards`
+    :param team_idcs: Team indices of the players along the first reward axis, required by `distribute`
+    :param inputs: Reward function inputs by argument name, e.g. `ball_position=arena_positions` and
+        `player_position=np.array([0, -2000, 17])`. Reward functions are passed the inputs they take.
+    :return: A dictionary of reward names and reward values
+    """
+    graph = reward_names_exprs if isinstance(reward_names_exprs, RewardGraph) else compile_rewards(reward_names_exprs)
+
+    def call(fn, kwargs):
+        if "conditions" in kwargs:
+            raise ValueError("Reward conditions are evaluated over replays only, see `parse_replay.conditions`")
+        parameters = inspect.signature(fn).parameters
+        return fn(**{k: v for k, v in inputs.items() if k in parameters and k not in kwargs}, **kwargs)
+
+    return graph.evaluate(call, team_idcs, player_axis=0)
@@ -0,0 +1,162 @@
+"""
+Spatial reward gradients over the arena.
+
+Gradients are taken with respect to the reward argument evaluated over the arena positions, e.g. the ball position for
+ball to goal rewards, see `batch.RenderJob`. Rewards with known derivatives are differentiated analytically, other
+rewards by central differences evaluated in a single batched reward call.
+"""
+import inspect
+from typing import Callable, Sequence, Tuple, Union
+
+import numpy as np
+
+from rlgym_reward_analysis import _common_values
+from .arena import ARENA_HEIGHT, arena_geometry
+from .batch import RenderJob
+from .reward_functions.custom_rewards import _goal_depth
+
+_objectives = {False: np.array(_common_values.ORANGE_GOAL_BACK), True: np.array(_common_values.BLUE_GOAL_BACK)}
+
+
+def _liu_dist_gradient(position, target, offset, scale, density):
+    # d/dp exp(-0.5 (|p - t| - offset) / scale) ^ (1 / density)
+    diff = position - target
+    dist = np.linalg.norm(diff, 2, axis=-1)
+    rew = np.exp(-0.5 * (dist - offset) / scale) ** (1 / density)
+    return (rew * -0.5 / (scale * density) / (dist + 1e-8))[..., None] * diff
+
+
+def liu_dist_ball2goal_gradient(ball_position, dispersion=1., density=1., own_goal=False):
+    return _liu_dist_gradient(ball_position, _objectives[own_goal], _goal_depth,
+                              _common_values.BALL_MAX_SPEED * dispersion, density)
+
+
+def signed_liu_dist_ball2goal_gradient(ball_position, dispersion=1., density=1., own_goal=False):
+    diff = ball_position - _objectives[own_goal]
+    dist = np.linalg.norm(diff, 2, axis=-1)
+    unsigned = np.exp(-0.5 * (dist - _goal_depth) / (4570 * dispersion))
+    signed = (unsigned - 0.5) * 2
+    d_signed = 2 * unsigned * -0.5 / (4570 * dispersion)
+    d_rew = np.abs(signed) ** (1 / density - 1) / density * d_signed
+    return (d_rew / (dist + 1e-8))[..., None] * diff
+
+
+def liu_dist_ball2goal_diff_gradient(ball_position,
+                                     off_dispersion=0.5,
+                                     def_dispersion=0.5,
+                                     def_density=1.,
+                                     off_density=1.,
+                                     off_weight=1.,
+                                     def_weight=1.):
+    return (off_weight * liu_dist_ball2goal_gradient(ball_position, off_dispersion, off_density) -
+            def_weight * liu_dist_ball2goal_gradient(ball_position, def_dispersion, def_density, True))
+
+
+def liu_dist_player2ball_gradient(player_position, ball_position, dispersion=1, density=1):
+    return _liu_dist_gradient(player_position, ball_position, _common_values.BALL_RADIUS,
+                              _common_values.CAR_MAX_SPEED * dispersion, density)
+
+
+def ball_y_coord_gradient(ball_position, exponent=1.):
+    length = _common_values.BACK_WALL_Y + _common_values.BALL_RADIUS
+    gradient = np.zeros(np.shape(ball_position))
+    gradient[..., 1] = exponent * np.abs(ball_position[..., 1] / length) ** (exponent - 1) / length
+    return gradient
+
+
+# Analytic gradients with respect to the first reward argument, taking the reward arguments
+gradient_functions = {"liu_dist_ball2goal": liu_dist_ball2goal_gradient,
+                      "signed_liu_dist_ball2goal": signed_liu_dist_ball2goal_gradient,
+                      "liu_dist_ball2goal_diff": liu_dist_ball2goal_diff_gradient,
+                      "liu_dist_player2ball": liu_dist_player2ball_gradient,
+                      "ball_y_coord": ball_y_coord_gradient,
+                      }
+
+
+def reward_gradient(reward: Union[str, Callable, RenderJob],
+                    positions: Union[None, np.ndarray] = None,
+                    params: Union[None, dict] = None,
+                    scene: Union[None, dict] = None,
+                    arena_arg: Union[None, str] = None,
+                    method: str = "auto",
+                    eps=1.,
+                    axes: Sequence[int] = (0, 1, 2)) -> np.ndarray:
+    """
+    Computes the spatial gradient of a reward at many positions in one vectorized pass
+
+    :param reward: A reward name of `reward_functions.rewards_names_map`, a reward function or a `RenderJob`
+    :param positions: Arena positions, numpy array of shape (n_positions, 3). Defaults to the arena geometry positions.
+    :param params: Reward keyword arguments, see `RenderJob`. Ignored if `reward` is a `RenderJob`.
+    :param scene: Ball and player placements the other reward arguments are taken from, see `RenderJob`.
+        Ignored if `reward` is a `RenderJob`.
+    :param arena_arg: The reward argument the gradient is taken with respect to, see `RenderJob`.
+        Ignored if `reward` is a `RenderJob`.
+    :param method: `"analytic"`, `"central"` for central differences or `"auto"` for analytic gradients of the
+        rewards of `gradient_functions` with respect to their first argument and central differences otherwise
+    :param eps: Central difference step, in arena units
+    :param axes: The position axes central differences are taken along. Other gradient components are zero.
+    :return: Gradients of shape (n_positions, 3)
+    """
+    job = reward if isinstance(reward, RenderJob) else RenderJob(reward, params, scene, arena_arg)
+    positions = arena_geometry().positions if positions is None else np.asarray(positions, dtype=float)
+
+    gradient_fn = gradient_functions.get(job.reward) if type(job.reward) == str else None
+    analytic = gradient_fn is not None and job.arena_arg == next(iter(inspect.signature(job.reward_fn).parameters))
+    assert method != "analytic" or analytic, "No analytic gradient of %s with respect to %s" % (job.reward,
+                                                                                                 job.arena_arg)
+    if analytic and method != "central":
+        return np.broadcast_to(gradient_fn(**job.reward_kwargs(positions)), positions.shape).copy()
+
+    # every displaced position is evaluated in one reward call, shape (2, n_axes, n_positions, 3)
+    offsets = np.zeros((2, len(axes), 1, positions.shape[-1]))
+    for i, axis in enumerate(axes):
+        offsets[0, i, 0, axis] = eps
+        offsets[1, i, 0, axis] = -eps
+    displaced = positions + offsets
+    values = np.asarray(job.evaluate(displaced.reshape(-1, positions.shape[-1]))).reshape(2, len(axes), -1)
+
+    gradients = np.zeros(positions.shape)
+    gradients[:, list(axes)] = ((values[0] - values[1]) / (2 * eps)).T
+    return gradients
+
+
+def arena_grid(point_distance=400, height=ARENA_HEIGHT) -> np.ndarray:
+    """
+    :param point_distance: Distance between neighbouring grid points
+    :param height: The height of the grid
+    :return: Regular grid positions inside the arena, numpy array of shape (n_positions, 3)
+    """
+    xs = np.arange(-_common_values.SIDE_WALL_X, _common_values.SIDE_WALL_X + 1, point_distance)
+    ys = np.arange(-_common_values.BACK_WALL_Y, _common_values.BACK_WALL_Y + 1, point_distance)
+    x, y = (v.ravel() for v in np.meshgrid(xs - xs.mean(), ys - ys.mean()))
+    inside = arena_geometry().lookup.locate(x, y)[0] >= 0
+    return np.stack([x[inside], y[inside], np.full(inside.sum(), float(height))], -1)
+
+
+def gradient_field(reward: Union[str, Callable, RenderJob],
+                   params: Union[None, dict] = None,
+                   scene: Union[None, dict] = None,
+                   arena_arg: Union[None, str] = None,
+                   positions: Union[None, np.ndarray] = None,
+                   point_distance=400,
+                   normalize=False,
+                   **gradient_kwargs) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Reward gradients over the arena, ready to be passed to `quiver` or to `draw_arena_contour`
+
+    :param reward: A reward name, a reward function or a `RenderJob`, see `reward_gradient`
+    :param params: Reward keyword arguments, see `RenderJob`
+    :param scene: Ball and player placements the other reward arguments are taken from, see `RenderJob`
+    :param arena_arg: The reward argument the gradient is taken with respect to, see `RenderJob`
+    :param positions: Arena positions. Defaults to a regular grid of the arena, see `arena_grid`.
+    :param point_distance: Distance between neighbouring grid points if `positions` is not provided
+    :param normalize: Whether gradient vectors are scaled to unit length, showing directions only
+    :param gradient_kwargs: `reward_gradient` keyword arguments, e.g. `method` or `eps`
+    :return: Arrow x and y positions and x and y gradient components, in data coordinates, i.e. to be drawn with
+        `angles="xy"` on the x-inverted arena plot
+    """
+    positions = arena_grid(point_distance) if positions is None else np.asarray(positions, dtype=float)
+    gradients = reward_gradient(reward, positions, params, scene, arena_arg, **gradient_kwargs)[:, :2]
+    if normalize:
+        gradients = gradients / (np.linalg.norm(gradients, 2, axis=-1)[:, None] + 1e-12)
+    return positions[:, 0], positions[:, 1], gradients[:, 0], gradients[:, 1]
@@ -0,0 +1,145 @@
+"""
+Chunked reward evaluation over product spaces of reward arguments.
+
+Every reward argument is given a list of values, e.g. `utils.generate.grid_positions` for the player and ball
+positions and `utils.generate.sphere_points` for velocity directions, and the reward is evaluated over all their
+combinations. Combinations are enumerated in chunks sized to a memory budget, and every chunk is reduced over the
+non-kept arguments as it is computed, so that the full product space is never held in memory.
+"""
+import inspect
+from typing import Callable, Dict, Sequence, Union
+
+import numpy as np
+
+from .reward_functions import rewards_names_map
+
+_reductions = (None, "max", "mean", "argmax")
+# intermediate arrays of the reward computations, per argument value
+_temporaries = 4
+
+
+def z_slice(positions: np.ndarray, z: float) -> np.ndarray:
+    """
+    :param positions: Positions of shape (n_positions, 3), e.g. `utils.generate.grid_positions`
+    :param z: A height
+    :return: The positions of the grid level closest to the height `z`
+    """
+    positions = np.asarray(positions)
+    levels = np.unique(positions[:, 2])
+    return positions[positions[:, 2] == levels[np.abs(levels - z).argmin()]]
+
+
+def chunk_size(axes: Dict[str, np.ndarray], memory_budget: int, itemsize=8) -> int:
+    """
+    :param axes: A dictionary of reward argument names and argument values, see `grid_evaluate`
+    :param memory_budget: Memory budget in bytes
+    :param itemsize: Size of the computed values in bytes
+    :return: The number of argument combinations evaluated at once
+    """
+    width = sum(int(np.prod(np.shape(values)[1:])) for values in axes.values()) + 1
+    return max(memory_budget // (width * itemsize * _temporaries), 1)
+
+
+def grid_evaluate(reward: Union[str, Callable],
+                  axes: Dict[str, np.ndarray],
+                  params: Union[None, dict] = None,
+                  reduce: Union[None, str] = "max",
+                  keep: Union[None, Sequence[str]] = None,
+                  z: Union[None, float] = None,
+                  slice_axis: Union[None, str] = None,
+                  memory_budget: int = 1 << 28,
+                  out: Union[None, str, np.ndarray] = None,
+                  dtype=np.float64) -> np.ndarray:
+    """
+    Evaluates a reward over every combination of reward argument values
+
+    Values are ordered as the kept arguments followed by the reduced arguments, each in `axes` order, i.e. the full
+    result has shape (n_kept_0, ..., n_reduced_0, ...).
+
+    :param reward: A reward name of `reward_functions.rewards_names_map` or a reward function
+    :param axes: A dictionary of reward argument names and argument values of shape (n_values, ...), e.g.
+        `{"player_position": grid_positions(), "ball_position": grid_positions(),
+        "player_lin_velocity": sphere_points(50, 2300)}`
+    :param params: Reward keyword arguments shared by all combinations, e.g. `{"dispersion": 0.8}`. Optional.
+    :param reduce: `"max"`, `"mean"` or `"argmax"` over the non-kept arguments, or `None` for the full result.
+        `"max"` ignores NaN rewards. `"argmax"` values are flat indices into the reduced arguments, see
+        `np.unravel_index`, or -1 if all rewards are NaN.
+    :param keep: The arguments not reduced over. Defaults to the first argument.
+    :param z: A height. If provided, only the grid level of the `slice_axis` positions closest to `z` is evaluated,
+        see `z_slice`.
+    :param slice_axis: The position argument sliced at height `z`. Defaults to the first kept argument.
+    :param memory_budget: Approximate memory of a chunk of argument combinations and its rewards, in bytes
+    :param out: A `.npy` file path or an array the full result is written to, e.g. a memory-mapped array. Optional.
+    :param dtype: The result data type
+    :return: The reduced rewards of shape (n_kept_0, ...), or the full result if `reduce` is `None`
+    """
+    assert reduce in _reductions, "Unknown reduction %s" % reduce
+    reward_fn = rewards_names_map[reward] if type(reward) == str else reward
+    params = dict(params or {})
+    keep = list(axes)[:1] if keep is None else list(keep)
+    assert all(name in axes for name in keep), "Kept arguments must be reward arguments of `axes`"
+    names = keep + [name for name in axes if name not in keep]
+    axes = {name: np.asarray(axes[name]) for name in names}
+    if z is not None:
+        slice_axis = keep[0] if slice_axis is None else slice_axis
+        axes[slice_axis] = z_slice(axes[slice_axis], z)
+    unknown = set(names) - set(inspect.signature(reward_fn).parameters)
+    assert not unknown, "%s are not arguments of %s" % (", ".join(sorted(unknown)), reward_fn)
+
+    shape = tuple(len(values) for values in axes.values())
+    kept_shape = shape[:len(keep)]
+    n_reduced = int(np.prod(shape[len(keep):]))
+    n_total = int(np.prod(shape))
+
+    if isinstance(out, str):
+        out = np.lib.format.open_memmap(out, mode="w+", dtype=dtype, shape=shape)
+    elif out is None and reduce is None:
+        out = np.empty(shape, dtype=dtype)
+    if out is not None:
+        assert out.shape == shape, "The output must be of shape %s" % (shape,)
+    out_values = None if out is None else out.reshape(-1)
+
+    n_kept = int(np.prod(kept_shape))
+    if reduce == "argmax":
+        best = np.full(n_kept, -np.inf)
+        result = np.full(n_kept, -1, dtype=np.int64)
+    else:
+        result = np.full(n_kept, np.nan if reduce == "max" else 0., dtype=dtype)
+
+    size = chunk_size(axes, memory_budget, np.dtype(dtype).itemsize)
+    for start in range(0, n_total, size):
+        flat = np.arange(start, min(start + size, n_total))
+        idcs = np.unravel_index(flat, shape)
+        kwargs = {name: values[i] for (name, values), i in zip(axes.items(), idcs)}
+        values = np.broadcast_to(reward_fn(**kwargs, **params), flat.shape)
+
+        if out_values is not None:
+            out_values[start:start + len(flat)] = values
+        if reduce is None:
+            continue
+
+        # chunks are contiguous, every kept combination is a contiguous segment of the chunk
+        rows = flat // n_reduced
+        starts = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]])
+        rows = rows[starts]
+        if reduce == "max":
+            result[rows] = np.fmax(result[rows], np.fmax.reduceat(values, starts))
+        elif reduce == "mean":
+            result[rows] += np.add.reduceat(values, starts)
+        else:
+            values = np.where(np.isnan(values), -np.inf, values)
+            segment_max = np.maximum.reduceat(values, starts)
+            lengths = np.diff(np.r_[starts, len(flat)])
+            is_max = values == np.repeat(segment_max, lengths)
+            first = np.minimum.reduceat(np.where(is_max, np.arange(len(flat)), len(flat)), starts)
+            better = segment_max > best[rows]
+            best[rows[better]] = segment_max[better]
+            result[rows[better]] = flat[first[better]] % n_reduced
+
+    if isinstance(out, np.memmap):
+        out.flush()
+    if reduce is None:
+        return out
+    if reduce == "mean":
+        result /= n_reduced
+    return result.reshape(kept_shape)
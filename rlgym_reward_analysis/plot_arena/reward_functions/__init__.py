@@ -0,0 +1,15 @@
+from . import common_rewards, custom_rewards, extra_rewards
+
+rewards_names_map = {"liu_dist_ball2goal": custom_rewards.liu_dist_ball2goal,
+                     "signed_liu_dist_ball2goal": custom_rewards.signed_liu_dist_ball2goal,
+                     "liu_dist_ball2goal_diff": custom_rewards.liu_dist_ball2goal_diff,
+                     "velocity_ball2goal": common_rewards.velocity_ball2goal,
+                     "ball_y_coord": custom_rewards.ball_y_coord,
+                     "align_ball": common_rewards.align_ball,
+                     "dist_weighted_align_ball": custom_rewards.dist_weighted_align_ball,
+                     "offensive_potential": custom_rewards.offensive_potential,
+                     "liu_dist_player2ball": custom_rewards.liu_dist_player2ball,
+                     "velocity_player2ball": common_rewards.velocity_player2ball,
+                     "face_ball": common_rewards.face_ball,
+                     "kickoff": extra_rewards.kickoff,
+                     }
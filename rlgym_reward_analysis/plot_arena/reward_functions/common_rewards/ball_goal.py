@@ -22,7 +22,7 @@ def velocity_ball2goal(ball_position, ball_lin_velocity, own_goal=False, use_sca
     else:
         norm_pos_diff = pos_diff / (np.linalg.norm(pos_diff, 2, axis=-1)[:, None] + 1e-8)
         ball_lin_velocity = ball_lin_velocity / _common_values.BALL_MAX_SPEED
-        return np.dot(norm_pos_diff, ball_lin_velocity)
+        return (norm_pos_diff * ball_lin_velocity).sum(-1)
 
 
 def ball_y_coord(ball_position, exponent=1):
@@ -18,7 +18,7 @@ def velocity_player2ball(player_position,
     else:
         norm_pos_dif = pos_diff / (np.linalg.norm(pos_diff, 2, axis=-1)[:, None] + 1e-8)
         player_lin_velocity = player_lin_velocity / _common_values.CAR_MAX_SPEED
-        return np.dot(norm_pos_dif, player_lin_velocity)
+        return (norm_pos_dif * player_lin_velocity).sum(-1)
 
 
 def face_ball(player_position, ball_position, player_forward_vec):
@@ -0,0 +1,208 @@
+"""
+Reward field sampling at arbitrary arena positions.
+
+Reward values are computed at the arena triangulation vertices. A field sampler interpolates them at any position
+inside the arena, instead of snapping positions to the nearest vertex, using a uniform grid of candidate triangles
+built once per arena geometry.
+"""
+from functools import cached_property
+from typing import Tuple, Union
+
+import numpy as np
+
+from .arena import ArenaGeometry, arena_geometry
+
+_chunk_size = 1 << 16
+_eps = 1e-9
+
+
+class TriangleLookup:
+    """
+    Point location in a triangulation. Every cell of a uniform grid over the triangulation bounding box lists the
+    triangles overlapping it, so that a point is only tested against the few triangles of its cell.
+    """
+
+    def __init__(self, x: np.ndarray, y: np.ndarray, triangles: np.ndarray, cells_per_triangle=4.):
+        """
+        :param x: Vertex x coordinates
+        :param y: Vertex y coordinates
+        :param triangles: Vertex indices of the triangles, shape (n_triangles, 3)
+        :param cells_per_triangle: Number of grid cells per triangle. More cells mean fewer candidate triangles per
+            cell, at the cost of a larger grid.
+        """
+        self.triangles = np.asarray(triangles)
+        vertices = np.stack([x, y], -1).astype(float)
+        p0, p1, p2 = (vertices[self.triangles[:, i]] for i in range(3))
+
+        # inverses of the (p1 - p0, p2 - p0) edge matrices, mapping positions to barycentric coordinates
+        e1, e2 = p1 - p0, p2 - p0
+        det = e1[:, 0] * e2[:, 1] - e1[:, 1] * e2[:, 0]
+        # barycentric map rows (e2_y, -e2_x) / det and (-e1_y, e1_x) / det, then the origin (p0_x, p0_y),
+        # gathered together per candidate triangle
+        self.transforms = np.stack([e2[:, 1] / det, -e2[:, 0] / det, -e1[:, 1] / det, e1[:, 0] / det,
+                                     p0[:, 0], p0[:, 1]], -1)
+
+        self._min = vertices.min(0)
+        extent = vertices.max(0) - self._min
+        self._cell = np.sqrt(extent.prod() / (len(self.triangles) * cells_per_triangle))
+        self._shape = np.maximum(np.ceil(extent / self._cell).astype(int), 1)
+
+        # cells overlapped by the triangle bounding boxes
+        corners = np.stack([p0, p1, p2])
+        lo = self._cell_idcs(corners.min(0))
+        hi = self._cell_idcs(corners.max(0))
+        cells, tris = [], []
+        span = (hi - lo).max(0) + 1
+        for dx in range(span[0]):
+            for dy in range(span[1]):
+                overlap = (lo[:, 0] + dx <= hi[:, 0]) & (lo[:, 1] + dy <= hi[:, 1])
+                cells.append((lo[overlap, 1] + dy) * self._shape[0] + lo[overlap, 0] + dx)
+                tris.append(np.flatnonzero(overlap))
+        cells, tris = np.concatenate(cells), np.concatenate(tris)
+
+        # candidates covering most of their cell are tested first, estimated at 3x3 sample points per cell
+        offsets = (np.arange(3) + 0.5) / 3 * self._cell
+        coverage = np.zeros(len(cells))
+        for ox in offsets:
+            for oy in offsets:
+                coverage += self._contains(tris, self._min[0] + cells % self._shape[0] * self._cell + ox,
+                                           self._min[1] + cells // self._shape[0] * self._cell + oy)[0]
+        order = np.lexsort((-coverage, cells))
+        cells, tris = cells[order], tris[order]
+        n_cells = self._shape.prod()
+        counts = np.bincount(cells, minlength=n_cells)
+        slots = np.arange(len(cells)) - np.repeat(np.cumsum(counts) - counts, counts)
+        # the last row is the empty cell of positions outside the grid
+        self._candidates = np.full((n_cells + 1, counts.max()), -1, dtype=np.int64)
+        self._candidates[cells, slots] = tris
+
+    def _contains(self, tris: np.ndarray, x: np.ndarray, y: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        t = self.transforms[tris]
+        dx, dy = x - t[:, 4], y - t[:, 5]
+        lam1 = t[:, 0] * dx + t[:, 1] * dy
+        lam2 = t[:, 2] * dx + t[:, 3] * dy
+        return (lam1 >= -_eps) & (lam2 >= -_eps) & (lam1 + lam2 <= 1 + _eps), lam1, lam2
+
+    def _cell_idcs(self, points: np.ndarray) -> np.ndarray:
+        return np.clip(((points - self._min) // self._cell).astype(int), 0, self._shape - 1)
+
+    def locate(self, x: np.ndarray, y: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        :param x: Position x coordinates
+        :param y: Position y coordinates, same shape as `x`
+        :return: The triangle index of every position, -1 outside the triangulation, and the barycentric coordinates
+            of the positions with respect to the second and third triangle vertices, shape (..., 2)
+        """
+        x, y = np.broadcast_arrays(np.asarray(x, dtype=float), np.asarray(y, dtype=float))
+        shape = x.shape
+        points = np.stack([x.ravel(), y.ravel()], -1)
+        tri_idcs = np.full(len(points), -1, dtype=np.int64)
+        barycentric = np.full((len(points), 2), np.nan)
+
+        for start in range(0, len(points), _chunk_size):
+            p = points[start:start + _chunk_size]
+            grid_idcs = ((p - self._min) // self._cell).astype(int)
+            inside = ((grid_idcs >= 0) & (grid_idcs < self._shape)).all(1)
+            cells = np.where(inside, grid_idcs[:, 1] * self._shape[0] + grid_idcs[:, 0], len(self._candidates) - 1)
+            candidates = self._candidates[cells]
+
+            # positions are tested against the next candidate triangle of their cell until one contains them
+            active = np.arange(len(p))
+            for k in range(candidates.shape[1]):
+                tris = candidates[active, k]
+                active, tris = active[tris >= 0], tris[tris >= 0]
+                hit, lam1, lam2 = self._contains(tris, p[active, 0], p[active, 1])
+                tri_idcs[start + active[hit]] = tris[hit]
+                barycentric[start + active[hit], 0] = lam1[hit]
+                barycentric[start + active[hit], 1] = lam2[hit]
+                active = active[~hit]
+                if not len(active):
+                    break
+
+        return tri_idcs.reshape(shape), barycentric.reshape(shape + (2,))
+
+
+def lookup_trifinder(geometry: ArenaGeometry):
+    """
+    :param geometry: An arena geometry
+    :return: A matplotlib `TriFinder` of the arena triangulation backed by the geometry triangle lookup
+    """
+    from matplotlib.tri import TriFinder
+
+    class LookupTriFinder(TriFinder):
+        def __call__(self, x, y):
+            return geometry.lookup.locate(x, y)[0]
+
+    return LookupTriFinder(geometry.triangulation)
+
+
+class FieldSampler:
+    """
+    Samples a reward field given at the arena vertices at arbitrary positions
+    """
+
+    def __init__(self, z: np.ndarray, kind: str = "linear", geometry: Union[None, ArenaGeometry] = None):
+        """
+        :param z: Reward values for each point of the arena
+        :param kind: `"linear"` for piecewise linear interpolation over the arena triangles or `"cubic"` for
+            matplotlib's `CubicTriInterpolator`
+        :param geometry: The arena geometry `z` is given on. Defaults to the default arena geometry.
+        """
+        assert kind in ("linear", "cubic"), "Unknown interpolation kind %s" % kind
+        self.geometry = arena_geometry() if geometry is None else geometry
+        self.kind = kind
+        self.z = np.asarray(z, dtype=float)
+        assert self.z.shape == self.geometry.x.shape, "Rewards must be given at every arena vertex"
+
+        if kind == "linear":
+            # value at the first vertex and increments along the two triangle edges
+            z_triangles = self.z[self.geometry.triangles]
+            self._coefficients = np.stack([z_triangles[:, 0],
+                                           z_triangles[:, 1] - z_triangles[:, 0],
+                                           z_triangles[:, 2] - z_triangles[:, 0]], -1)
+        else:
+            from matplotlib import tri
+
+            self._interpolator = tri.CubicTriInterpolator(self.geometry.triangulation, self.z,
+                                                          trifinder=self.geometry.trifinder)
+
+    def __call__(self, positions: np.ndarray) -> Union[float, np.ndarray]:
+        """
+        :param positions: Arena positions, numpy array of shape (..., 2) or (..., 3). Heights are ignored.
+        :return: Interpolated rewards of shape (...), NaN outside the arena
+        """
+        positions = np.asarray(positions, dtype=float)
+        x, y = positions[..., 0], positions[..., 1]
+
+        if self.kind == "linear":
+            tri_idcs, barycentric = self.geometry.lookup.locate(x, y)
+            coefficients = self._coefficients[np.maximum(tri_idcs, 0)]
+            values = (coefficients[..., 0] + barycentric[..., 0] * coefficients[..., 1] +
+                      barycentric[..., 1] * coefficients[..., 2])
+            values = np.where(tri_idcs < 0, np.nan, values)
+        else:
+            values = self._interpolator(x.ravel(), y.ravel()).filled(np.nan).reshape(x.shape)
+        return values[()]
+
+    @cached_property
+    def _gradients(self) -> np.ndarray:
+        # the field is planar over every triangle, (d/dx, d/dy) = M^T (increments) for the barycentric map M
+        transforms = self.geometry.lookup.transforms
+        return np.stack([self._coefficients[:, 1] * transforms[:, 0] + self._coefficients[:, 2] * transforms[:, 2],
+                         self._coefficients[:, 1] * transforms[:, 1] + self._coefficients[:, 2] * transforms[:, 3]],
+                        -1)
+
+    def gradient(self, positions: np.ndarray) -> np.ndarray:
+        """
+        :param positions: Arena positions, numpy array of shape (..., 2) or (..., 3). Heights are ignored.
+        :return: Spatial (d/dx, d/dy) gradients of the interpolated rewards, shape (..., 2), NaN outside the arena.
+            Linear interpolation gradients are constant over every arena triangle.
+        """
+        positions = np.asarray(positions, dtype=float)
+        x, y = positions[..., 0], positions[..., 1]
+
+        if self.kind == "linear":
+            tri_idcs, _ = self.geometry.lookup.locate(x, y)
+            return np.where((tri_idcs < 0)[..., None], np.nan, self._gradients[np.maximum(tri_idcs, 0)])
+        dx, dy = self._interpolator.gradient(x.ravel(), y.ravel())
+        return np.stack([dx.filled(np.nan), dy.filled(np.nan)], -1).reshape(x.shape + (2,))
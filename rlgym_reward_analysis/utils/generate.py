@@ -1,4 +1,8 @@
+import os
+
 import numpy as np
+import pandas as pd
+from scipy.signal import lfilter
 
 from rlgym_reward_analysis import _common_values
 
@@ -50,3 +54,90 @@ def sphere_points(n_points=50, radius=1):
     theta = np.pi * (1 + 5 ** 0.5) * indices
     x, y, z = np.cos(theta) * np.sin(phi), np.sin(theta) * np.sin(phi), np.cos(phi)
     return np.stack([x, y, z], axis=-1) * radius
+
+
+def synthetic_replay(n_frames=10000, n_players=6, tick_rate=30, seed=None):
+    """
+    Generates a synthetic replay data frame with the column layout of parsed replay files.
+    Ball and player trajectories are random walks within the arena, starting from a kickoff.
+
+    :param n_frames: Number of replay frames
+    :param n_players: Number of players, half of which are in the blue team
+    :param tick_rate: Number of frames per second
+    :param seed: Random generator seed
+    :return: A data frame of (entity, field) columns, with entities `ball`, `game` and player names
+    """
+    rng = np.random.default_rng(seed)
+    delta = 1 / tick_rate
+    columns = {}
+
+    def random_walk(n, start, speed, low, high):
+        # mean-reverting velocities, integrated into positions that bounce off the arena bounds
+        vel = lfilter([0.05], [1, -0.95], rng.normal(0, speed * 3, (n, 3)), axis=0)
+        span = np.subtract(high, low)
+        pos = (np.add(start, np.cumsum(vel * delta, axis=0)) - low) % (2 * span)
+        pos = np.where(pos > span, 2 * span - pos, pos) + low
+        vel[1:] = np.diff(pos, axis=0) / delta
+        return pos, vel
+
+    arena_low = (-_common_values.SIDE_WALL_X, -_common_values.BACK_WALL_Y, 0)
+    arena_high = (_common_values.SIDE_WALL_X, _common_values.BACK_WALL_Y, _common_values.CEILING_Z)
+    kickoff_frames = min(n_frames, 3 * tick_rate)
+
+    # the ball stands still in the center during kickoff
+    ball_position = np.tile((0., 0., _common_values.BALL_RADIUS), (n_frames, 1))
+    ball_lin_vel = np.zeros((n_frames, 3))
+    ball_position[kickoff_frames:], ball_lin_vel[kickoff_frames:] = random_walk(
+        n_frames - kickoff_frames, ball_position[0], _common_values.BALL_MAX_SPEED / 4,
+        np.add(arena_low, _common_values.BALL_RADIUS), np.subtract(arena_high, _common_values.BALL_RADIUS))
+    ball_rotation = np.angle(np.exp(1j * np.cumsum(rng.normal(0, 0.1, (n_frames, 3)), axis=0)))
+    for field, values in (("pos_", ball_position), ("vel_", ball_lin_vel), ("rot_", ball_rotation)):
+        for i, axis in enumerate("xyz"):
+            columns[("ball", field + axis)] = values[:, i]
+
+    columns[("game", "time")] = np.arange(n_frames) * delta
+    columns[("game", "delta")] = np.full(n_frames, delta)
+
+    n_blue = (n_players + 1) // 2
+    for p in range(n_players):
+        # blue players start in the negative y half, orange players in the positive one
+        side = -1 if p < n_blue else 1
+        start = (rng.uniform(-2048, 2048), side * rng.uniform(2500, 4600), 17)
+        position, lin_vel = random_walk(n_frames, start, _common_values.CAR_MAX_SPEED / 2,
+                                        np.add(arena_low, (0, 0, 17)), arena_high)
+        pitch = np.pi / 2 * np.sin(np.cumsum(rng.normal(0, 0.05, n_frames)))
+        yaw = np.angle(np.exp(1j * (np.arctan2(lin_vel[:, 1], lin_vel[:, 0]) + rng.normal(0, 0.1, n_frames))))
+        roll = np.angle(np.exp(1j * np.cumsum(rng.normal(0, 0.05, n_frames))))
+        boost = np.clip(85 + lfilter([1], [1, -0.99], rng.normal(0, 8, n_frames)), 0, 255)
+
+        player = "player_%d" % p
+        for field, values in (("pos_", position), ("vel_", lin_vel)):
+            for i, axis in enumerate("xyz"):
+                columns[(player, field + axis)] = values[:, i]
+        columns[(player, "rot_x")] = pitch
+        columns[(player, "rot_y")] = yaw
+        columns[(player, "rot_z")] = roll
+        columns[(player, "boost")] = boost
+
+    return pd.DataFrame(columns)
+
+
+def synthetic_replays(folder, n_replays=10, n_frames=10000, n_players=6, seed=None):
+    """
+    Writes synthetic replay CSV files into a folder, as expected by `parse_replay.parsing.parse_replays`
+
+    :param folder: Folder to write replay files into. Created if it does not exist.
+    :param n_replays: Number of replay files
+    :param n_frames: Number of frames per replay
+    :param n_players: Number of players per replay
+    :param seed: Random generator seed
+    :return: A list of the replay file paths
+    """
+    os.makedirs(folder, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    paths = []
+    for i in range(n_replays):
+        path = os.path.join(folder, "replay_%04d.csv" % i)
+        synthetic_replay(n_frames, n_players, seed=rng.integers(2 ** 32)).to_csv(path)
+        paths.append(path)
+    return paths
@@ -4,3 +4,13 @@ import numpy as np
 def cosine_similarity(a, b):
     return ((a / (np.linalg.norm(a, axis=-1).reshape(-1, 1) + 1e-8)) *
             (b / (np.linalg.norm(b, axis=-1).reshape(-1, 1) + 1e-8))).sum(-1)
+
+
+def dot(a, b):
+    """Dot product over the last axis, broadcasting over the remaining axes"""
+    return np.einsum('...i,...i->...', a, b)
+
+
+def norm(a):
+    """Euclidean norm over the last axis"""
+    return np.sqrt(dot(a, a))
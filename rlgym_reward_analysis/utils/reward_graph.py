@@ -0,0 +1,440 @@
+"""
+Composite reward expression graphs.
+
+Rewards are composed declaratively from named rewards, arithmetic operators and combinators into expressions.
+Compiling expressions against the reward functions of a backend, `parse_replay` or `plot_arena`, builds a DAG in
+which structurally equal sub-expressions are evaluated once, e.g. the `align_ball` term shared by
+`offensive_potential` and `dist_weighted_align_ball`. Intermediate arrays are written into buffers which are recycled
+as soon as their last consumer is evaluated, and kept by the graph across evaluations.
+"""
+import functools
+import inspect
+from numbers import Number
+from typing import Callable, Dict, List, Sequence, Tuple, Union
+
+import numpy as np
+
+_ufuncs = {"add": np.add,
+           "subtract": np.subtract,
+           "multiply": np.multiply,
+           "divide": np.divide,
+           "power": np.power,
+           "negative": np.negative,
+           "absolute": np.absolute,
+           "sign": np.sign,
+           "sqrt": np.sqrt,
+           "exp": np.exp}
+_commutative = ("add", "multiply")
+# combinators over consecutive frames
+_stateful = ("diff", "diff_potential")
+_sequences = ("sequential", "anneal")
+
+
+class Expr:
+    """
+    A reward expression. Expressions are built with `reward`, `constant`, arithmetic operators, numpy-like functions of
+    this module and the `multiply`, `weighted_product`, `diff`, `diff_potential`, `sequential`, `anneal` and
+    `distribute` combinators.
+    """
+    __slots__ = ("op", "args", "params")
+
+    def __init__(self, op: str, args: Sequence["Expr"] = (), params: Union[None, dict] = None):
+        self.op = op
+        self.args = tuple(args)
+        self.params = params or {}
+
+    def __add__(self, other):
+        return Expr("add", (self, _expr(other)))
+
+    def __radd__(self, other):
+        return Expr("add", (_expr(other), self))
+
+    def __sub__(self, other):
+        return Expr("subtract", (self, _expr(other)))
+
+    def __rsub__(self, other):
+        return Expr("subtract", (_expr(other), self))
+
+    def __mul__(self, other):
+        return Expr("multiply", (self, _expr(other)))
+
+    def __rmul__(self, other):
+        return Expr("multiply", (_expr(other), self))
+
+    def __truediv__(self, other):
+        return Expr("divide", (self, _expr(other)))
+
+    def __rtruediv__(self, other):
+        return Expr("divide", (_expr(other), self))
+
+    def __pow__(self, exponent):
+        return Expr("power", (self, _expr(exponent)))
+
+    def __neg__(self):
+        return Expr("negative", (self,))
+
+    def __abs__(self):
+        return Expr("absolute", (self,))
+
+    def __repr__(self):
+        if self.op == "reward":
+            kwargs = ", ".join("%s=%r" % item for item in self.params["kwargs"].items())
+            return "reward(%r%s)" % (self.params["name"], ", " + kwargs if kwargs else "")
+        if self.op == "constant":
+            return repr(self.params["value"])
+        params = "".join(", %s=%r" % item for item in self.params.items())
+        return "%s(%s%s)" % (self.op, ", ".join(map(repr, self.args)), params)
+
+
+def _expr(value) -> Expr:
+    if isinstance(value, Expr):
+        return value
+    if type(value) is str:
+        return reward(value)
+    return constant(value)
+
+
+def reward(name: str, **kwargs) -> Expr:
+    """
+    :param name: A reward name of the backend reward map, e.g. `"align_ball"`
+    :param kwargs: Reward keyword arguments. A `conditions` keyword argument gates the reward by replay conditions
+        and is passed to the backend call separately, see `parse_replay.conditions.gated`.
+    :return: A named reward expression
+    """
+    return Expr("reward", params={"name": name, "kwargs": kwargs})
+
+
+def constant(value) -> Expr:
+    """
+    :param value: A scalar or an array broadcasting against rewards
+    :return: A constant expression
+    """
+    return Expr("constant", params={"value": value})
+
+
+def sign(x) -> Expr:
+    return Expr("sign", (_expr(x),))
+
+
+def sqrt(x) -> Expr:
+    return Expr("sqrt", (_expr(x),))
+
+
+def exp(x) -> Expr:
+    return Expr("exp", (_expr(x),))
+
+
+def multiply(rewards: Sequence[Union[str, Expr]]) -> Expr:
+    """
+    Product of rewards, see `plot_arena.reward_functions.extra_rewards.multiply`
+    """
+    rewards = [_expr(r) for r in rewards]
+    product = rewards[0]
+    for r in rewards[1:]:
+        product = product * r
+    return product
+
+
+def weighted_product(rewards: Sequence[Union[str, Expr]], logical_and=False) -> Expr:
+    """
+    "Weighted" product of N rewards between -1 and 1, i.e. the N-th root of the product magnitude
+
+    :param rewards: Rewards to multiply
+    :param logical_and: Whether the product is positive only if all rewards are positive, instead of taking the sign
+        of the product
+    """
+    return Expr("weighted_product", [_expr(r) for r in rewards], {"logical_and": logical_and})
+
+
+def diff(x: Union[str, Expr], negative_slope=1.) -> Expr:
+    """
+    Difference of consecutive rewards over the first axis, see `plot_arena.reward_functions.extra_rewards.diff`
+    """
+    return Expr("diff", (_expr(x),), {"negative_slope": negative_slope})
+
+
+def diff_potential(x: Union[str, Expr], gamma, negative_slope=1.) -> Expr:
+    """
+    Potential-based reward shaping over the first axis, see `plot_arena.reward_functions.custom_rewards.diff_potential`
+    """
+    return Expr("diff_potential", (_expr(x),), {"gamma": gamma, "negative_slope": negative_slope})
+
+
+def sequential(rewards: Sequence[Union[str, Expr]]) -> Expr:
+    """
+    Rewards concatenated over the first axis, see `plot_arena.reward_functions.extra_rewards.sequential`
+    """
+    return Expr("sequential", [_expr(r) for r in rewards])
+
+
+def anneal(rewards: Sequence[Union[str, Expr]], x_fading_steps: Sequence[int]) -> Expr:
+    """
+    Rewards cross-faded over the first axis, see `plot_arena.reward_functions.extra_rewards.anneal`
+    """
+    assert len(rewards) == len(x_fading_steps) + 1
+    return Expr("anneal", [_expr(r) for r in rewards], {"x_fading_steps": tuple(x_fading_steps)})
+
+
+def distribute(x: Union[str, Expr], team_spirit=0.3) -> Expr:
+    """
+    Rewards shared between team mates and opposed to the opponents' rewards,
+    see `plot_arena.reward_functions.extra_rewards.distribute`. Team indices are provided at evaluation.
+    """
+    return Expr("distribute", (_expr(x),), {"team_spirit": team_spirit})
+
+
+def _liu_dist_ball2goal_diff(off_dispersion=0.5,
+                             def_dispersion=0.5,
+                             def_density=1.,
+                             off_density=1.,
+                             off_weight=1.,
+                             def_weight=1.):
+    return (off_weight * reward("liu_dist_ball2goal", dispersion=off_dispersion, density=off_density) -
+            def_weight * reward("liu_dist_ball2goal", dispersion=def_dispersion, density=def_density, own_goal=True))
+
+
+def _dist_weighted_align_ball(defense=0.5, offense=0.5, dispersion=1., density=1., **align_kwargs):
+    return weighted_product([reward("align_ball", defense=defense, offense=offense, **align_kwargs),
+                             reward("liu_dist_player2ball", dispersion=dispersion, density=density)])
+
+
+def _offensive_potential(defense=0.5, offense=0.5, dispersion=1., density=1., **align_kwargs):
+    return weighted_product([reward("align_ball", defense=defense, offense=offense, **align_kwargs),
+                             reward("velocity_player2ball"),
+                             reward("liu_dist_player2ball", dispersion=dispersion, density=density)],
+                            logical_and=True)
+
+
+# Composite rewards expanded into their sub-rewards at compilation, so that sub-rewards are shared
+composite_rewards = {"liu_dist_ball2goal_diff": _liu_dist_ball2goal_diff,
+                     "dist_weighted_align_ball": _dist_weighted_align_ball,
+                     "offensive_potential": _offensive_potential,
+                     }
+
+
+def freeze(value):
+    """
+    :param value: A reward keyword argument value, e.g. a number, an array or a list or dictionary of them
+    :return: A hashable value, equal for structurally equal values. Other unhashable values are compared by identity.
+    """
+    if isinstance(value, np.ndarray):
+        return "ndarray", value.dtype.str, value.shape, value.tobytes()
+    if isinstance(value, (list, tuple)):
+        return type(value).__name__, tuple(freeze(v) for v in value)
+    if isinstance(value, dict):
+        return "dict", tuple(sorted((k, freeze(v)) for k, v in value.items()))
+    if isinstance(value, Number):
+        return type(value).__name__, value
+    try:
+        hash(value)
+    except TypeError:
+        return "id", id(value)
+    return value
+
+
+def canonical_kwargs(fn: Callable, kwargs: dict) -> dict:
+    """
+    :param fn: A reward function
+    :param kwargs: Reward keyword arguments
+    :return: The keyword arguments completed with the reward function defaults, in signature order
+    """
+    parameters = inspect.signature(fn).parameters
+    for k in kwargs:
+        if k not in parameters:
+            raise TypeError("%s() got an unexpected keyword argument '%s'" % (getattr(fn, "__name__", fn), k))
+    return {name: kwargs.get(name, p.default) for name, p in parameters.items()
+            if p.default is not inspect.Parameter.empty or name in kwargs}
+
+
+class _Node:
+    __slots__ = ("op", "args", "params", "fn")
+
+    def __init__(self, op, args, params, fn=None):
+        self.op = op
+        self.args = args
+        self.params = params
+        self.fn = fn
+
+
+class RewardGraph:
+    """
+    A compiled reward expression DAG. Sub-expressions are deduplicated by structure, with reward keyword arguments
+    completed with the reward function defaults, and composite rewards are expanded into their sub-rewards.
+    """
+
+    def __init__(self,
+                 reward_names_exprs: Dict[str, Union[str, Expr]],
+                 rewards_names_map: Dict[str, Callable],
+                 expand_composites=True):
+        """
+        :param reward_names_exprs: A dictionary of output names and reward expressions or reward names
+        :param rewards_names_map: The backend reward functions by name
+        :param expand_composites: Whether `composite_rewards` are expanded into their sub-rewards
+        """
+        self.rewards_names_map = rewards_names_map
+        self.expand_composites = expand_composites
+        self.nodes: List[_Node] = []
+        self._ids = {}
+        self.outputs = {name: self._intern(_expr(e)) for name, e in reward_names_exprs.items()}
+
+        # the index of the last node consuming each node, buffers are recycled after it is evaluated
+        self._last_use = {}
+        for i, node in enumerate(self.nodes):
+            for a in node.args:
+                self._last_use[a] = i
+        self._output_ids = set(self.outputs.values())
+        self._pool: Dict[Tuple[tuple, np.dtype], List[np.ndarray]] = {}
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def _intern(self, expr: Expr) -> int:
+        if expr.op == "reward":
+            name, kwargs = expr.params["name"], expr.params["kwargs"]
+            if self.expand_composites and name in composite_rewards:
+                return self._intern(composite_rewards[name](**kwargs))
+            fn = self.rewards_names_map[name]
+            kwargs = dict(kwargs)
+            conditions = kwargs.pop("conditions", None)
+            kwargs = canonical_kwargs(fn, kwargs)
+            if conditions is not None:
+                kwargs["conditions"] = conditions
+            return self._add(_Node("reward", (), kwargs, fn), ("reward", name, freeze(kwargs)))
+        if expr.op == "constant":
+            return self._add(_Node("constant", (), expr.params), ("constant", freeze(expr.params["value"])))
+
+        args = tuple(self._intern(a) for a in expr.args)
+        key_args = tuple(sorted(args)) if expr.op in _commutative else args
+        return self._add(_Node(expr.op, args, expr.params), (expr.op, key_args, freeze(expr.params)))
+
+    def _add(self, node: _Node, key) -> int:
+        if key not in self._ids:
+            self._ids[key] = len(self.nodes)
+            self.nodes.append(node)
+        return self._ids[key]
+
+    def _buffer(self, shape, dtype) -> np.ndarray:
+        buffers = self._pool.get((shape, np.dtype(dtype)))
+        return buffers.pop() if buffers else np.empty(shape, dtype)
+
+    def _release(self, buffer: np.ndarray):
+        self._pool.setdefault((buffer.shape, buffer.dtype), []).append(buffer)
+
+    def evaluate(self,
+                 call: Callable[[Callable, dict], np.ndarray],
+                 team_idcs: Union[None, np.ndarray] = None,
+                 player_axis=-1,
+                 state: Union[None, dict] = None) -> Dict[str, np.ndarray]:
+        """
+        Evaluates every node once, in dependency order
+
+        :param call: Calls a reward function with its keyword arguments and the backend inputs, e.g. a `Replay`
+        :param team_idcs: Team indices of the players, required by `distribute`
+        :param player_axis: The reward axis of players, required by `distribute`
+        :param state: The last frame of the inputs of `diff` and `diff_potential` nodes, for evaluating consecutive
+            batches of frames. Updated in place, start with an empty dictionary. These nodes then produce a value for
+            every frame, NaN for the first frame, and `sequential` and `anneal` are not supported. Optional.
+        :return: A dictionary of output names and reward arrays. Outputs of equal expressions are the same array.
+        """
+        values = [None] * len(self.nodes)
+        owned = set()
+
+        def release(ids):
+            for a in set(ids):
+                if self._last_use[a] == i and a not in self._output_ids:
+                    if a in owned:
+                        self._release(values[a])
+                    values[a] = None
+
+        for i, node in enumerate(self.nodes):
+            args = [values[a] for a in node.args]
+            if node.op == "reward":
+                values[i] = call(node.fn, node.params)
+                continue
+            if node.op == "constant":
+                values[i] = node.params["value"]
+                continue
+
+            if state is not None and node.op in _stateful:
+                # frames continue the previous batch
+                x = np.asarray(args[0])
+                previous = state.get(i)
+                if previous is None:
+                    previous = np.full((1,) + x.shape[1:], np.nan, np.result_type(x, 1.))
+                if x.shape[0]:
+                    state[i] = x[-1:].copy()
+                args = [np.concatenate([previous, x])]
+            elif state is not None and node.op in _sequences:
+                raise ValueError("`%s` rewards cannot be evaluated incrementally" % node.op)
+
+            if node.op in _ufuncs:
+                # element-wise results may be written into the buffer of an argument no longer needed
+                release(node.args)
+                out = self._buffer(np.broadcast_shapes(*map(np.shape, args)), np.result_type(*args, 1.))
+                values[i] = _ufuncs[node.op](*args, out=out)
+            else:
+                values[i] = _evaluate_combinator(node, args, self._buffer, team_idcs, player_axis)
+                release(node.args)
+            owned.add(i)
+
+        return {name: values[i] for name, i in self.outputs.items()}
+
+
+def _evaluate_combinator(node: _Node, args: list, buffer: Callable, team_idcs, player_axis) -> np.ndarray:
+    params = node.params
+    if node.op == "weighted_product":
+        out = buffer(np.broadcast_shapes(*map(np.shape, args)), np.result_type(*args, 1.))
+        np.multiply(args[0], args[1], out=out)
+        for a in args[2:]:
+            np.multiply(out, a, out=out)
+        # logical AND: negative unless all values are positive
+        signs = ((functools.reduce(np.logical_and, [a >= 0 for a in args]) - 0.5) * 2) if params["logical_and"] \
+            else np.sign(out)
+        np.absolute(out, out=out)
+        if len(args) == 2:
+            np.sqrt(out, out=out)
+        else:
+            np.power(out, 1 / len(args), out=out)
+        return np.multiply(out, signs, out=out)
+
+    x = args[0] if args else None
+    if node.op == "diff" or node.op == "diff_potential":
+        out = buffer((x.shape[0] - 1,) + x.shape[1:], np.result_type(x, 1.))
+        if node.op == "diff":
+            np.subtract(x[1:], x[:-1], out=out)
+        else:
+            np.multiply(params["gamma"], x[1:], out=out)
+            np.subtract(out, x[:-1], out=out)
+        if params["negative_slope"] != 1:
+            out[out < 0] *= params["negative_slope"]
+        return out
+
+    if node.op == "sequential":
+        shape = (sum(a.shape[0] for a in args),) + args[0].shape[1:]
+        return np.concatenate(args, 0, out=buffer(shape, np.result_type(*args, 1.)))
+
+    if node.op == "anneal":
+        steps = params["x_fading_steps"]
+        out = buffer((sum(steps),) + args[0].shape[1:], np.result_type(*args, 1.))
+        start = 0
+        for k, a, b in zip(steps, args[:-1], args[1:]):
+            # the weights of the kernel and the inverse kernel add up to 1
+            kernel = np.linspace(0, 1, k).reshape((k,) + (1,) * (a.ndim - 1))
+            np.add(a[a.shape[0] - k:] * kernel[::-1], b[:k] * kernel, out=out[start:start + k])
+            start += k
+        return out
+
+    if node.op == "distribute":
+        assert team_idcs is not None, "`distribute` requires team indices"
+        orange = np.array(team_idcs, dtype=bool)
+        out = buffer(x.shape, np.result_type(x, 1.))
+        # players first
+        rewards, distributed = np.moveaxis(x, player_axis, 0), np.moveaxis(out, player_axis, 0)
+        blue_means = rewards[~orange].mean(0)
+        orange_means = rewards[orange].mean(0)
+        spirit = params["team_spirit"]
+        distributed[~orange] = blue_means * spirit + rewards[~orange] * (1 - spirit) - orange_means
+        distributed[orange] = orange_means * spirit + rewards[orange] * (1 - spirit) - blue_means
+        return out
+
+    raise ValueError("Unknown reward expression operation %s" % node.op)
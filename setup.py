@@ -1,11 +1,17 @@
+import re
+
 import setuptools
 
 with open("README.md", "r", encoding="utf-8") as fh:
     long_description = fh.read()
 
+# the package version is defined once, in the package itself
+with open("rlgym_reward_analysis/__init__.py", "r", encoding="utf-8") as fh:
+    version = re.search(r'^__version__ = "(.+)"$', fh.read(), re.M).group(1)
+
 setuptools.setup(
     name='rlgym-reward-analysis',
-    version="0.1",
+    version=version,
     author="Will Moschopoulos",
     description="A python API for analyzing RLGym rewards using data visualization and analysis techniques.",
     long_description=long_description,
@@ -0,0 +1,31 @@
+import pytest
+
+from rlgym_reward_analysis import _common_values
+from rlgym_reward_analysis.utils.generate import synthetic_replay
+
+# (frame, player) ball touches and goal frames of the `touch_replay` fixture, players 0 and 1 being blue
+touches = [(200, 0), (420, 2), (700, 1), (1150, 0), (1500, 3)]
+goals = [(800, 1), (1600, -1)]
+
+
+def _touch(df, frame, player):
+    # the player stands at the ball when it is hit
+    for axis in "xyz":
+        df.loc[frame - 1:frame, (player, "pos_" + axis)] = df.loc[frame - 1:frame, ("ball", "pos_" + axis)].values
+    # the ball speeds up along x from the touch on
+    df.loc[frame:, ("ball", "vel_x")] += 1000
+
+
+@pytest.fixture
+def touch_replay():
+    """
+    A 4 player synthetic replay with `touches` and `goals` in the orange (1) or blue (-1) goal
+    """
+    df = synthetic_replay(2000, 4, seed=0)
+    # a steady ball, only changing velocity when touched
+    df[[("ball", "vel_" + axis) for axis in "xyz"]] = 0.
+    for frame, player in touches:
+        _touch(df, frame, "player_%d" % player)
+    for frame, side in goals:
+        df.loc[frame, ("ball", "pos_y")] = side * (_common_values.BACK_WALL_Y + 2 * _common_values.BALL_RADIUS)
+    return df
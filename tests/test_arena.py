@@ -0,0 +1,19 @@
+import os
+
+import numpy as np
+
+from rlgym_reward_analysis.plot_arena import arena
+
+
+def test_arena_cache(tmp_path, monkeypatch):
+    monkeypatch.setenv("RLGYM_REWARD_ANALYSIS_CACHE_DIR", str(tmp_path))
+    geometry = arena._arena_geometry.__wrapped__(2)
+    cached = arena._arena_geometry.__wrapped__(2)
+    np.testing.assert_array_equal(cached.triangles, geometry.triangles)
+    # only plain arrays are cached
+    assert os.listdir(tmp_path) == ["arena_v%d_subdiv2.npz" % arena._cache_format]
+
+    points = np.random.default_rng(0).uniform(-4000, 4000, (50, 3))
+    _, idcs = cached.kdtree.query(points)
+    nearest = np.linalg.norm(points[:, None] - cached.positions, axis=-1).argmin(1)
+    np.testing.assert_array_equal(idcs, nearest)
@@ -0,0 +1,36 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from rlgym_reward_analysis.parse_replay.conditions import touched_last
+from rlgym_reward_analysis.parse_replay.parsing import iter_parse_replay, parse_replay
+from rlgym_reward_analysis.parse_replay.replay import Replay
+
+from conftest import touches
+
+
+def test_touched_last(touch_replay):
+    replay = Replay.from_dataframe(touch_replay)
+    assert replay.features.touches.sum() == len(touches)
+
+    expected = np.full(replay.n_frames, -1)
+    for frame, player in touches:
+        expected[frame:] = player
+    np.testing.assert_array_equal(touched_last(replay), expected[:, None] == np.arange(replay.n_players))
+
+
+def test_touched_last_slice(touch_replay):
+    replay = Replay.from_dataframe(touch_replay)
+    np.testing.assert_array_equal(touched_last(replay[500:900]), touched_last(replay)[500:900])
+
+
+# touches fall on the last and on the first frame of chunks of 67 and 100 frames
+@pytest.mark.parametrize("chunk_size", [67, 100, 5000])
+def test_touched_last_chunked(touch_replay, tmp_path, chunk_size):
+    replay_file = str(tmp_path / "replay.csv")
+    touch_replay.to_csv(replay_file)
+    reward_names_args = ["touched_last", ("face_ball", {"conditions": "touched_last"})]
+
+    expected = parse_replay(pd.read_csv(replay_file, header=[0, 1], index_col=0), reward_names_args)
+    chunked = pd.concat(iter_parse_replay(replay_file, reward_names_args, chunk_size=chunk_size))
+    pd.testing.assert_frame_equal(chunked, expected)
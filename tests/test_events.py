@@ -0,0 +1,29 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from rlgym_reward_analysis.parse_replay.events import detect_events, event_names
+from rlgym_reward_analysis.parse_replay.parsing import iter_parse_replay, parse_replay
+
+from conftest import touches
+
+
+def test_goal(touch_replay):
+    goal = detect_events(touch_replay, ["goal", "concede"])
+    # the orange goal is scored by the last blue toucher, the blue goal by the last orange toucher
+    assert list(zip(*np.nonzero(goal[..., 0]))) == [(800, 1), (1600, 3)]
+    assert list(zip(*np.nonzero(goal[..., 1]))) == [(800, 2), (800, 3), (1600, 0), (1600, 1)]
+    assert detect_events(touch_replay, ["touch"]).sum() == len(touches)
+
+
+# touches fall on the last and on the first frame of chunks of 67 and 100 frames
+@pytest.mark.parametrize("chunk_size", [67, 100, 5000])
+def test_events_chunked(touch_replay, tmp_path, chunk_size):
+    replay_file = str(tmp_path / "replay.csv")
+    touch_replay.to_csv(replay_file)
+    # one event reward per event
+    reward_names_fns = {name: (lambda replay, i=i: detect_events(replay)[..., i]) for i, name in enumerate(event_names)}
+
+    expected = parse_replay(pd.read_csv(replay_file, header=[0, 1], index_col=0), reward_names_fns=reward_names_fns)
+    chunked = pd.concat(iter_parse_replay(replay_file, reward_names_fns=reward_names_fns, chunk_size=chunk_size))
+    pd.testing.assert_frame_equal(chunked, expected)
@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+
+from rlgym_reward_analysis.plot_arena.grid import grid_evaluate
+from rlgym_reward_analysis.plot_arena.reward_functions import rewards_names_map
+from rlgym_reward_analysis.utils.generate import grid_positions, sphere_points
+
+axes = {"player_position": grid_positions(2400),
+        "ball_position": grid_positions(3200),
+        "player_lin_velocity": sphere_points(6, 2300)}
+
+
+@pytest.fixture(scope="module")
+def full():
+    # the reward over the whole product space, evaluated at once
+    idcs = np.meshgrid(*(np.arange(len(a)) for a in axes.values()), indexing="ij")
+    values = rewards_names_map["offensive_potential"](*(a[i.ravel()] for a, i in zip(axes.values(), idcs)),
+                                                       dispersion=0.8)
+    return values.reshape(idcs[0].shape)
+
+
+# memory budgets splitting the product space into many chunks, chunks across the kept axis, and a single chunk
+@pytest.mark.parametrize("memory_budget", [1 << 10, 1 << 14, 1 << 28])
+def test_grid_reductions(full, memory_budget):
+    kwargs = dict(reward="offensive_potential", axes=axes, params={"dispersion": 0.8}, memory_budget=memory_budget)
+    np.testing.assert_allclose(grid_evaluate(reduce="max", **kwargs), full.max((1, 2)))
+    np.testing.assert_allclose(grid_evaluate(reduce="mean", **kwargs), full.mean((1, 2)))
+    np.testing.assert_array_equal(grid_evaluate(reduce="argmax", **kwargs), full.reshape(len(full), -1).argmax(1))
+    np.testing.assert_allclose(grid_evaluate(reduce=None, **kwargs), full)
+    np.testing.assert_allclose(grid_evaluate(reduce="max", keep=["player_lin_velocity", "ball_position"], **kwargs),
+                               full.max(0).T)
+
+
+def test_grid_out(full, tmp_path):
+    out = str(tmp_path / "rewards.npy")
+    grid_evaluate("offensive_potential", axes, {"dispersion": 0.8}, None, out=out, memory_budget=1 << 12)
+    np.testing.assert_allclose(np.load(out), full)
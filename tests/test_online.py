@@ -0,0 +1,48 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from rlgym_reward_analysis.parse_replay.composition import parse_composite
+from rlgym_reward_analysis.parse_replay.events import event_names
+from rlgym_reward_analysis.parse_replay.online import OnlineEvaluator
+from rlgym_reward_analysis.parse_replay.replay import Replay
+from rlgym_reward_analysis.utils.reward_graph import diff, diff_potential, reward
+
+reward_names_exprs = {"potential_diff": diff_potential(reward("liu_dist_ball2goal"), gamma=0.99),
+                      "face_ball_diff": diff(reward("face_ball"), negative_slope=0.5),
+                      "touch_ball": "touch_ball",
+                      "touched_last": "touched_last",
+                      "event": reward("event", weights=np.arange(len(event_names)) + 1.),
+                      "gated": reward("velocity_player2ball", conditions=["touched_last", "behind_ball"])}
+
+
+@pytest.fixture
+def expected(touch_replay):
+    return parse_composite(touch_replay, reward_names_exprs)
+
+
+def test_history_rewards(expected):
+    # the fixture touches, goals and last touchers are detected
+    assert (expected.xs("touch_ball", axis=1, level=1) > 0).values.sum() == 5
+    assert expected.xs("touched_last", axis=1, level=1).values.sum() > 0
+    assert np.isnan(expected.xs("potential_diff", axis=1, level=1).values[0]).all()
+
+
+def test_step(touch_replay, expected):
+    replay = Replay.from_dataframe(touch_replay)
+    evaluator = OnlineEvaluator.from_replay(reward_names_exprs, replay)
+    reward_values = np.stack([evaluator.step(replay.ball[t], replay.players[t], replay.game[t])
+                              for t in range(replay.n_frames)])
+    np.testing.assert_allclose(reward_values.reshape(replay.n_frames, -1), expected.values)
+
+
+@pytest.mark.parametrize("batch_size", [7, 500])
+def test_step_dataframe(touch_replay, expected, batch_size):
+    evaluator = OnlineEvaluator.from_replay(reward_names_exprs, touch_replay)
+    batches = [evaluator.step_dataframe(touch_replay.iloc[start:start + batch_size])
+               for start in range(0, touch_replay.shape[0], batch_size)]
+    pd.testing.assert_frame_equal(pd.concat(batches), expected)
+
+    # a reset evaluator starts over
+    evaluator.reset()
+    pd.testing.assert_frame_equal(evaluator.step_dataframe(touch_replay), expected)
@@ -0,0 +1,138 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from rlgym_reward_analysis.parse_replay.cache import ReplayCache
+from rlgym_reward_analysis.parse_replay.events import event_names
+from rlgym_reward_analysis.parse_replay.parsing import iter_parse_replay, load_replay, parse_replay, parse_replays
+from rlgym_reward_analysis.parse_replay.postprocessing import anneal, diff, diff_potential, distribute
+from rlgym_reward_analysis.parse_replay.profiling import RewardProfiler
+from rlgym_reward_analysis.parse_replay.reward_functions import rewards_columns, rewards_columns_map
+from rlgym_reward_analysis.utils.generate import synthetic_replay, synthetic_replays
+
+reward_names_args = ["liu_dist_ball2goal", "velocity_player2ball", ("align_ball", {"defense": 0.5}),
+                     ("face_ball", {"conditions": "behind_ball"})]
+
+
+@pytest.fixture
+def replay_file(tmp_path):
+    replay_file = str(tmp_path / "replay.csv")
+    synthetic_replay(1000, 4, seed=0).to_csv(replay_file)
+    return replay_file
+
+
+@pytest.mark.parametrize("load_options", [{},
+                                          {"n_skip": 3},
+                                          {"columns": rewards_columns(["align_ball"]), "dtype": "float32"},
+                                          {"target_hz": 12}])
+def test_load_cached(replay_file, tmp_path, load_options):
+    cache = ReplayCache(str(tmp_path / "cache"))
+    expected = load_replay(replay_file, **load_options)
+    # the first load stores the replay, the second one reads the cache
+    for mmap in (False, False, True):
+        pd.testing.assert_frame_equal(load_replay(replay_file, cache, mmap, **load_options), expected,
+                                      check_index_type=False)
+    assert replay_file in cache
+
+
+def test_cache_invalidation(replay_file, tmp_path):
+    cache = ReplayCache(str(tmp_path / "cache"))
+    load_replay(replay_file, cache)
+    df = synthetic_replay(500, 4, seed=1)
+    df.to_csv(replay_file)
+    os.utime(replay_file, ns=(0, 0))
+    assert replay_file not in cache
+    np.testing.assert_allclose(load_replay(replay_file, cache).values, df.values)
+
+
+@pytest.mark.parametrize("chunk_size, n_skip", [(97, 1), (100, 3), (5000, 1)])
+def test_iter_parse_replay(replay_file, chunk_size, n_skip):
+    stages = [("diff", {})]
+    expected = parse_replay(load_replay(replay_file, n_skip=n_skip), reward_names_args, stage_names_args=stages)
+    chunked = pd.concat(iter_parse_replay(replay_file, reward_names_args, chunk_size=chunk_size, n_skip=n_skip,
+                                          stage_names_args=stages))
+    pd.testing.assert_frame_equal(chunked, expected)
+
+
+def test_parse_replays_workers(tmp_path):
+    synthetic_replays(str(tmp_path / "replays"), 3, 400, 4, seed=0)
+    folder_paths = {"synthetic": [str(tmp_path / "replays")]}
+    expected = parse_replays(folder_paths, reward_names_args, n_skip=2)["synthetic"]
+    parsed = parse_replays(folder_paths, reward_names_args, n_skip=2, n_workers=2,
+                           cache=str(tmp_path / "cache"))["synthetic"]
+    assert len(parsed) == len(expected)
+    for df, expected_df in zip(parsed, expected):
+        pd.testing.assert_frame_equal(df, expected_df)
+
+
+@pytest.mark.parametrize("reward_name", list(rewards_columns_map))
+def test_load_reward_columns(replay_file, reward_name):
+    reward_names_args = [(reward_name, {"weights": np.ones(len(event_names))} if reward_name == "event" else {})]
+    expected = parse_replay(load_replay(replay_file), reward_names_args)
+    projected = parse_replay(load_replay(replay_file, columns=rewards_columns([reward_name])), reward_names_args)
+    pd.testing.assert_frame_equal(projected, expected)
+
+
+def test_parse_replays_player_rewards(tmp_path):
+    synthetic_replays(str(tmp_path / "replays"), 2, 200, 4, seed=0)
+    folder_paths = {"synthetic": [str(tmp_path / "replays")]}
+    parsed = parse_replays(folder_paths, ["velocity", "save_boost"], n_skip=1)["synthetic"]
+    assert [df.shape for df in parsed] == [(200, 8), (200, 8)]
+
+
+# two frames of 3 players, players 0 and 1 blue, player 2 orange
+stage_values = np.array([[1., 3., 5.], [2., 2., 8.]])[..., None]
+stage_team_idcs = np.array([0, 0, 1])
+
+
+def test_distribute():
+    # own team mean * team spirit + own reward * (1 - team spirit) - opponent team mean
+    expected = [[1 + 0.5 - 5, 1 + 1.5 - 5, 2.5 + 2.5 - 2], [1 + 1 - 8, 1 + 1 - 8, 4 + 4 - 2]]
+    np.testing.assert_allclose(distribute(stage_values, stage_team_idcs, team_spirit=0.5)[..., 0], expected)
+
+
+def test_diff():
+    np.testing.assert_allclose(diff(stage_values, stage_team_idcs, negative_slope=0.5)[..., 0],
+                               [[np.nan] * 3, [1, -0.5, 3]])
+    np.testing.assert_allclose(diff_potential(stage_values, stage_team_idcs, gamma=0.5)[..., 0],
+                               [[np.nan] * 3, [1 - 1, 1 - 3, 4 - 5]])
+
+
+def test_anneal():
+    # the first reward fades into the second one over frames 0 to 2
+    values = np.ones((4, 1, 2))
+    np.testing.assert_allclose(anneal(values, [0], x_fading_steps=[3])[:, 0],
+                               [[1, 0], [0.5, 0.5], [0, 1], [0, 1]])
+    # frames continuing the replay from its second frame
+    np.testing.assert_allclose(anneal(values, [0], start=1, x_fading_steps=[3])[:, 0],
+                               [[0.5, 0.5], [0, 1], [0, 1], [0, 1]])
+
+
+def test_postprocess_stages(replay_file):
+    df = load_replay(replay_file)
+    stages = [("distribute", {"team_spirit": 0.5}), ("diff", {})]
+    raw = parse_replay(df, reward_names_args)
+    team_idcs = np.array([0, 0, 1, 1])
+    values = raw.values.reshape(raw.shape[0], 4, -1)
+    expected = diff(distribute(values, team_idcs, team_spirit=0.5), team_idcs)
+    np.testing.assert_allclose(parse_replay(df, reward_names_args, stage_names_args=stages).values,
+                               expected.reshape(raw.shape))
+
+
+def test_profile_workers(tmp_path):
+    synthetic_replays(str(tmp_path / "replays"), 2, 200, 4, seed=0)
+    folder_paths = {"synthetic": [str(tmp_path / "replays")]}
+    profiler = RewardProfiler(trace_memory=False)
+    parse_replays(folder_paths, reward_names_args, n_skip=1, n_workers=2, profiler=profiler,
+                  stage_names_args=["diff"])
+
+    files = sorted(os.path.join(str(tmp_path / "replays"), f) for f in os.listdir(tmp_path / "replays"))
+    for replay_file in files:
+        records = [r for r in profiler.records if r["file"] == replay_file]
+        assert [r["stage"] for r in records] == ["load", "replay"] + ["reward"] * len(reward_names_args) + \
+            ["postprocess"]
+        assert [r["reward"] for r in records if r["stage"] == "reward"] == \
+            [r if type(r) is str else r[0] for r in reward_names_args]
+        assert all(r["n_frames"] == 200 for r in records if r["stage"] != "load")
@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+
+from rlgym_reward_analysis.parse_replay import results
+from rlgym_reward_analysis.parse_replay.parsing import parse_replay, parse_replays
+from rlgym_reward_analysis.parse_replay.profiling import RewardProfiler
+from rlgym_reward_analysis.parse_replay.results import ResultCache, reward_key
+from rlgym_reward_analysis.utils.generate import synthetic_replay, synthetic_replays
+
+reward_names_args = ["liu_dist_ball2goal", "face_ball", ("align_ball", {"defense": 0.5}),
+                     ("velocity", {"conditions": "closest2ball"})]
+
+
+def _computed(profiler):
+    return [r["reward"] for r in profiler.records if r["stage"] == "reward"]
+
+
+def test_reward_key(monkeypatch):
+    assert reward_key(("liu_dist_ball2goal", {"dispersion": 1.})) == reward_key("liu_dist_ball2goal")
+    assert reward_key(("liu_dist_ball2goal", {"dispersion": 2.})) != reward_key("liu_dist_ball2goal")
+    assert reward_key(("velocity", {"conditions": "closest2ball"})) != reward_key("velocity")
+    key = reward_key("velocity")
+    monkeypatch.setattr(results, "__version__", "0.0")
+    assert reward_key("velocity") != key
+
+
+def test_parse_replay_cached(tmp_path):
+    df = synthetic_replay(500, 4, seed=0)
+    cache = ResultCache(str(tmp_path))
+    expected = parse_replay(df, reward_names_args)
+
+    profiler = RewardProfiler(trace_memory=False)
+    parse_replay(df, reward_names_args[:2], result_cache=cache, profiler=profiler)
+    cached = parse_replay(df, reward_names_args, result_cache=cache, profiler=profiler)
+    # only rewards added since are computed
+    assert _computed(profiler) == ["liu_dist_ball2goal", "face_ball", "align_ball", "velocity"]
+    pd.testing.assert_frame_equal(cached, expected)
+
+
+def test_parse_replays_cached(tmp_path):
+    synthetic_replays(str(tmp_path / "replays"), 3, 400, 4, seed=0)
+    folder_paths = {"synthetic": [str(tmp_path / "replays")]}
+    stages = [("distribute", {"team_spirit": 0.3})]
+    expected = parse_replays(folder_paths, reward_names_args, n_skip=2, stage_names_args=stages)["synthetic"]
+
+    for _ in range(2):
+        profiler = RewardProfiler(trace_memory=False)
+        parsed = parse_replays(folder_paths, reward_names_args, n_skip=2, stage_names_args=stages,
+                               profiler=profiler, result_cache=str(tmp_path / "results"))["synthetic"]
+        for df, expected_df in zip(parsed, expected):
+            np.testing.assert_allclose(df.values, expected_df.values)
+    # fully cached replays are neither loaded nor parsed
+    assert profiler.records == []
@@ -0,0 +1,74 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from rlgym_reward_analysis.parse_replay.parsing import parse_replays
+from rlgym_reward_analysis.parse_replay.stats import QuantileSketch, RewardStats, reward_stats
+from rlgym_reward_analysis.utils.generate import synthetic_replay
+
+reward_names_args = ["liu_dist_ball2goal", "velocity_player2ball", "save_boost"]
+reward_names = [r if type(r) is str else r[0] for r in reward_names_args]
+
+
+@pytest.fixture
+def replay_folder(tmp_path):
+    # every replay has different player names
+    for i in range(4):
+        df = synthetic_replay(600, 4, seed=i)
+        df.columns = pd.MultiIndex.from_tuples([(e if e in ("ball", "game") else "%s_%d" % (e, i), f)
+                                                for e, f in df.columns])
+        df.to_csv(os.path.join(tmp_path, "replay_%d.csv" % i))
+    return {"synthetic": [str(tmp_path)]}
+
+
+def test_quantile_sketch():
+    rng = np.random.default_rng(0)
+    values = np.stack([rng.normal(0, 1, 10000), rng.lognormal(0, 2, 10000)], -1)
+    sketch = QuantileSketch(2, relative_accuracy=0.01)
+    for batch in np.array_split(values, 7):
+        sketch.update(batch)
+    q = [0.05, 0.5, 0.95]
+    expected = np.quantile(values, q, axis=0, method="lower").T
+    np.testing.assert_allclose(sketch.quantile(q), expected, rtol=0.011)
+
+
+def test_sketch_range():
+    sketch = QuantileSketch(1, min_value=1e-3, max_value=1e3)
+    assert sketch.counts.size < QuantileSketch(1).counts.size / 2
+    sketch.update(np.array([[1e-5], [0.5], [1e5]]))
+    quantiles = sketch.quantile([0, 0.5, 1])[0]
+    assert quantiles[0] == 0 and quantiles[1] == pytest.approx(0.5, rel=0.01) and quantiles[2] < 1.1e3
+
+
+@pytest.mark.parametrize("group_by, groups", [("slot", [0, 1, 2, 3]), ("team", ["blue", "orange"])])
+def test_reward_stats(replay_folder, group_by, groups):
+    stats = reward_stats(replay_folder, reward_names_args, n_skip=1, group_by=group_by, n_workers=2)["synthetic"]
+    # groups do not grow with the number of distinct players
+    assert list(stats.groups) == groups
+
+    reward_values = pd.concat([df.T.reset_index(0, drop=True).T
+                               for df in parse_replays(replay_folder, reward_names_args, n_skip=1)["synthetic"]])
+    summary = stats.summary(by_group=False)
+    np.testing.assert_array_equal(summary["count"], reward_values.count().groupby(level=0).sum()[reward_names])
+    for r in reward_names:
+        values = reward_values[r].values.ravel()
+        assert summary.loc[r, "mean"] == pytest.approx(values.mean())
+        assert summary.loc[r, "std"] == pytest.approx(values.std(ddof=1))
+        assert summary.loc[r, "min"] == values.min() and summary.loc[r, "max"] == values.max()
+        assert summary.loc[r, "q0.5"] == pytest.approx(np.quantile(values, 0.5, method="lower"), rel=0.011)
+
+
+def test_merge_stats(replay_folder):
+    parsed = parse_replays(replay_folder, reward_names_args, n_skip=1)["synthetic"]
+    merged = RewardStats(reward_names)
+    for df in parsed:
+        stats = RewardStats(reward_names)
+        stats.update(df)
+        merged.merge(stats)
+    single = RewardStats(reward_names)
+    for df in parsed:
+        single.update(df)
+    pd.testing.assert_frame_equal(merged.summary(), single.summary())
+    pd.testing.assert_frame_equal(merged.covariance(), single.covariance())
@@ -0,0 +1,48 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from rlgym_reward_analysis.parse_replay.parsing import parse_replays
+from rlgym_reward_analysis.parse_replay.store import build_store, parse_store
+from rlgym_reward_analysis.utils.generate import synthetic_replays
+
+reward_names_args = ["liu_dist_ball2goal", "velocity_player2ball", ("align_ball", {"defense": 0.5})]
+
+
+def _assert_parsed_equal(parsed, expected):
+    assert list(parsed) == list(expected)
+    for category in expected:
+        assert len(parsed[category]) == len(expected[category])
+        for df, expected_df in zip(parsed[category], expected[category]):
+            np.testing.assert_allclose(df.values, expected_df.values)
+            pd.testing.assert_index_equal(df.columns, expected_df.columns)
+
+
+@pytest.mark.parametrize("n_workers", [1, 2])
+def test_parse_store(tmp_path, n_workers):
+    synthetic_replays(str(tmp_path / "replays"), 3, 500, 4, seed=0)
+    folder_paths = {"synthetic": [str(tmp_path / "replays")]}
+
+    store = build_store(str(tmp_path / "store"), folder_paths)
+    assert len(store) == 3
+    _assert_parsed_equal(parse_store(store, reward_names_args, n_skip=3, n_workers=n_workers),
+                         parse_replays(folder_paths, reward_names_args, n_skip=3))
+
+
+@pytest.mark.parametrize("n_workers", [1, 2])
+def test_rebuild_store(tmp_path, n_workers):
+    store_dir = str(tmp_path / "store")
+    synthetic_replays(str(tmp_path / "first"), 3, 500, 4, seed=0)
+    synthetic_replays(str(tmp_path / "second"), 2, 300, 6, seed=1)
+    first, second = {"first": [str(tmp_path / "first")]}, {"second": [str(tmp_path / "second")]}
+
+    old_store = build_store(store_dir, first)
+    old_ball = np.array(old_store.ball)
+    parse_store(store_dir, reward_names_args, n_workers=n_workers)
+
+    # rebuilding a parsed store in place neither crashes nor serves the previous replays
+    build_store(store_dir, second)
+    _assert_parsed_equal(parse_store(store_dir, reward_names_args, n_workers=n_workers),
+                         parse_replays(second, reward_names_args, n_skip=1))
+    # stores opened before the rebuild keep reading their own arrays
+    np.testing.assert_array_equal(old_store.ball, old_ball)
@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+
+from rlgym_reward_analysis.parse_replay.parsing import parse_replay
+from rlgym_reward_analysis.parse_replay.replay import Replay
+from rlgym_reward_analysis.parse_replay.sweep import param_grid, sweep_replay
+from rlgym_reward_analysis.utils.generate import synthetic_replay
+
+
+@pytest.fixture
+def replay():
+    return Replay.from_dataframe(synthetic_replay(300, 4, seed=0))
+
+
+def _target_distance(replay, target, scale=1.):
+    # distance of players to a target position, scaled
+    return np.linalg.norm(replay.features.position - np.asarray(target), axis=-1) * scale
+
+
+def test_sweep_numeric(replay):
+    params = {"dispersion": [0.5, 1, 2], "density": [1, 2]}
+    rewards = sweep_replay(replay, "liu_dist_player2ball", params)
+    for p, values in zip(param_grid(params), rewards):
+        expected = parse_replay(replay, [("liu_dist_player2ball", p)]).values
+        np.testing.assert_allclose(values, expected)
+
+
+def test_sweep_list_params(replay):
+    params = {"target": [[0, 0, 0], (0, 5120, 0), np.array([0, -5120, 0]), [0, 0, 0]], "scale": [1, 0.5]}
+    rewards = sweep_replay(replay, _target_distance, params, max_batch=1)
+    for p, values in zip(param_grid(params), rewards):
+        np.testing.assert_allclose(values, _target_distance(replay, **p))
+
+
+def test_sweep_event_weights(replay):
+    params = [{"weights": [1, 0, 0, 0, 0, 0, 0, 0]}, {"weights": [0, 0, 0, 1, 0, 0, 0, 0]}]
+    rewards = sweep_replay(replay, "event", params)
+    for p, values in zip(params, rewards):
+        np.testing.assert_allclose(values, parse_replay(replay, [("event", p)]).values)